@@ -1,10 +1,21 @@
 
 
+import time
 import logging
 from datetime import datetime
 from config import ADMIN_USERNAME, ADMIN_PASSWORD
-from database import create_and_store_redeem_code, get_redeem_code_info, mark_redeem_code_used, update_subscription, get_users_count
-from keyboards import get_admin_main_keyboard
+from database import create_and_store_redeem_code, get_redeem_code_info, mark_redeem_code_used, update_subscription, get_users_count, get_file_cache_stats, get_transcript_stats
+from keyboards import get_admin_main_keyboard, get_admin_back_keyboard
+from download import download_scheduler
+from storage import storage_manager
+from progress import format_size
+from thumbnails import thumbnail_cache
+from pyrogram_client import pyrogram_pool
+from prefetch import get_prefetch_stats
+from client_selector import get_selector_stats
+from captions import get_subtitle_source_stats
+from asr_pool import asr_pool
+from cancellation import active_handles_count
 
 logger = logging.getLogger(__name__)
 
@@ -87,6 +98,101 @@ async def admin_gen_code(query):
             reply_markup=get_admin_main_keyboard()
         )
 
+def build_stats_text():
+    """ متن آمار سیستم برای پنل ادمین """
+    cache = get_file_cache_stats()
+    lines = [
+        "📊 آمار سیستم",
+        "",
+        "🗂 کش file_id:",
+        f"   ورودی‌ها: {cache['entries']}",
+        f"   hit: {cache['hits']} | miss: {cache['misses']} | نرخ hit: {cache['hit_ratio']:.0%}",
+        f"   حذف‌شده (قدیمی/مازاد): {cache['evicted']}",
+    ]
+    queue = download_scheduler.stats()
+    lines += [
+        "",
+        "⏬ صف دانلود:",
+        f"   در حال اجرا: {queue['active']}/{queue['workers']} | در انتظار: {queue['queued']}",
+        f"   اتصال‌های فعال: {queue['connections']}/{queue['max_connections']} | پیش‌دانلود در صف: {queue['background']}",
+        f"   کارهای قابل لغو: {active_handles_count()} | workerهای گیرکرده رهاشده: {queue['reclaimed']}",
+    ]
+    prefetch = get_prefetch_stats()
+    lines += [
+        "",
+        "🔮 پیش‌دانلود:",
+        f"   فعال: {prefetch['active']} | شروع‌شده: {prefetch['started']} | ردشده (سقف): {prefetch['skipped']}",
+        f"   hit: {prefetch['hits']} | miss: {prefetch['misses']} | نرخ hit: {prefetch['hit_ratio']:.0%}",
+        f"   منقضی: {prefetch['expired']} | لغوشده: {prefetch['cancelled']}",
+    ]
+    storage = storage_manager.stats()
+    lines += [
+        "",
+        "💾 فضای دانلود:",
+        f"   رزرو: {format_size(storage['reserved'])} ({storage['jobs']} کار) | نگه‌داشته: {format_size(storage['retained'])} ({storage['retained_count']} فایل)",
+        f"   سهمیه: {format_size(storage['quota'])} | فضای آزاد دیسک: {format_size(storage['disk_free'])} (حداقل {format_size(storage['min_free'])})",
+        f"   hit فایل محلی: {storage['hits']} | miss: {storage['misses']} | نرخ hit: {storage['hit_ratio']:.0%}",
+        f"   ردشده (بزرگ‌تر از سهمیه): {storage['rejected']}",
+    ]
+    thumbs = thumbnail_cache.stats()
+    lines += [
+        "",
+        "🖼 کش thumbnail:",
+        f"   ورودی‌ها: {thumbs['entries']} | حجم بایت‌ها: {format_size(thumbs['bytes'])}",
+        f"   hit: {thumbs['hits']} | miss: {thumbs['misses']} | نرخ hit: {thumbs['hit_ratio']:.0%}",
+    ]
+    pool = pyrogram_pool.stats()
+    lines += [
+        "",
+        "📡 نشست‌های Pyrogram:",
+        f"   سالم: {pool['healthy']}/{pool['sessions']} | آپلودهای در جریان: {pool['uploads']}",
+    ]
+    sources = get_subtitle_source_stats()
+    lines += [
+        "",
+        "📝 منبع زیرنویس‌ها:",
+        f"   یوتیوب (دستی): {sources['manual']} | یوتیوب (خودکار): {sources['auto']} | Whisper: {sources['whisper']}",
+    ]
+    transcripts = get_transcript_stats()
+    lines += [
+        "",
+        "🗃 رونوشت‌های ذخیره‌شده:",
+        f"   ورودی‌ها: {transcripts['entries']} | حجم: {format_size(transcripts['bytes'])} | حذف‌شده: {transcripts['evicted']}",
+        f"   hit: {transcripts['hits']} | miss: {transcripts['misses']} | نرخ hit: {transcripts['hit_ratio']:.0%}",
+    ]
+    asr = asr_pool.stats()
+    lines += [
+        "",
+        "🗣 پروسه‌های ASR:",
+        f"   زنده: {asr['alive']}/{asr['workers']} | شروع مجدد: {asr['restarts']}",
+        f"   در صف: {asr['queued']} | در حال اجرا: {asr['running']} | انجام‌شده: {asr['done']} | ناموفق: {asr['failed']}",
+    ]
+    now = time.time()
+    for worker in asr['heartbeats']:
+        lines.append(
+            f"   {worker['worker_id']}: {worker['status']} ({int(now - worker['heartbeat_at'])} ثانیه پیش) | "
+            f"مدل‌ها: {worker['models'] or '-'}"
+        )
+        lines.append(
+            f"      هم‌ترازی: {worker['align_models'] or '-'} ({format_size(worker['align_bytes'])}) | "
+            f"حافظه پروسه: {format_size(worker['rss'])}"
+        )
+    lines += ["", "🎯 کلاینت‌های yt-dlp (بهترین‌ها):"]
+    arms = get_selector_stats()
+    for arm in arms:
+        lines.append(
+            f"   {arm['player_client']} / {arm['ua_family']}: موفقیت {arm['success_rate']:.0%} | "
+            f"{format_size(arm['throughput'])}/s | تلاش‌ها: {arm['attempts']}"
+        )
+    if not arms:
+        lines.append("   هنوز داده‌ای ثبت نشده است.")
+    return "\n".join(lines)
+
+async def admin_show_stats(query):
+    """ نمایش آمار سیستم """
+    await query.answer()
+    await query.message.edit_text(build_stats_text(), reply_markup=get_admin_back_keyboard())
+
 async def start_redeem_callback(query, state):
     """ شروع فرآیند وارد کردن کد ریدیم """
     await query.answer()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+asr_models.py
+
+انتخاب مدل Whisper بر اساس زبان و شناسه مدل/نسخه pipeline در کلید رونوشت‌ها، فقط از روی ENV.
+بدون وابستگی سنگین است تا ربات (transcript_store) بدون import کردن audio_to_subtitle کلید رونوشت را بسازد.
+"""
+
+import os
+from typing import Optional
+
+DEFAULT_MODEL = os.environ.get("A2S_MODEL", "large-v3")
+MODEL_FA = os.environ.get("A2S_MODEL_FA")  # مدل اختصاصی فارسی (در صورت تنظیم)
+MODEL_EN = os.environ.get("A2S_MODEL_EN")  # مدل اختصاصی انگلیسی (در صورت تنظیم)
+# با هر تغییر ASR یا هم‌ترازی که متن/زمان رونوشت را عوض می‌کند افزایش یابد (رونوشت‌های ذخیره‌شده قبلی استفاده نمی‌شوند)
+PIPELINE_VERSION = 1
+
+
+def select_model_by_lang(lang: Optional[str]) -> str:
+    """بر اساس زبان، بهترین مدل رایگان و آفلاین را انتخاب می‌کند (قابل override با ENV)."""
+    # اولویت با ENV اختصاصی هر زبان
+    if lang == "fa" and MODEL_FA:
+        return MODEL_FA
+    if lang == "en" and MODEL_EN:
+        return MODEL_EN
+    # انتخاب‌های پیشنهادی
+    # برای انگلیسی: مدل‌های "*.en" دقیق‌تر و سریع‌تر می‌شوند
+    if lang == "en":
+        # اگر سخت‌افزار قوی نیست، medium.en تعادل خوبی دارد
+        return "medium.en"
+    # برای فارسی: بهترین کیفیت، مدل‌های چندزبانه بزرگ‌تر
+    if lang == "fa":
+        return "large-v3"
+    # پیش‌فرض
+    return DEFAULT_MODEL
+
+
+def translate_via_en(lang: str) -> bool:
+    """ زیرنویس فارسی از رونوشت انگلیسی و ترجمه googletrans ساخته می‌شود (A2S_TRANSLATE_FA_VIA_EN=1) """
+    return lang == "fa" and os.environ.get("A2S_TRANSLATE_FA_VIA_EN", "0") == "1"
+
+
+def transcript_model_id(lang: str, model_name: str = DEFAULT_MODEL) -> str:
+    """ شناسه مدلی که متن رونوشت را می‌سازد (بخشی از کلید ذخیره رونوشت) """
+    if translate_via_en(lang):
+        return select_model_by_lang("en") + "+googletrans"
+    if model_name == DEFAULT_MODEL:
+        return select_model_by_lang(lang)
+    return model_name
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+استخر پروسه‌های ASR از دید ربات: راه‌اندازی و نظارت بر workerها (asr_worker)، ثبت کار در جدول asr_jobs
+و دنبال کردن وضعیت آن تا پایان. event loop ربات هیچ‌وقت مدل Whisper را اجرا نمی‌کند.
+"""
+
+import os
+import sys
+import uuid
+import asyncio
+import logging
+import subprocess
+import importlib.util
+from config import ASR_WORKERS, ASR_CPU_THREADS, ASR_POLL_INTERVAL, ASR_HEARTBEAT_INTERVAL
+from database import (
+    create_asr_job, get_asr_job, cancel_asr_job, fail_worker_asr_jobs, reset_asr_queue,
+    get_asr_queue_counts, get_asr_workers
+)
+from cancellation import JobCancelled, REASON_USER, STAGE_TRANSCRIBE
+
+logger = logging.getLogger(__name__)
+
+# (ماژول، نام بسته pip) وابستگی‌های لازم worker؛ همان چیزی که audio_to_subtitle.check_dependencies می‌خواهد
+_WORKER_DEPENDENCIES = (("faster_whisper", "faster-whisper"),)
+
+
+def missing_dependencies():
+    """ بسته‌های نصب‌نشده worker؛ فقط جستجوی بسته است و torch/مدل‌ها در ربات import نمی‌شوند """
+    return [package for module, package in _WORKER_DEPENDENCIES if importlib.util.find_spec(module) is None]
+
+
+class AsrError(Exception):
+    """ ساخت زیرنویس با Whisper ممکن نشد """
+
+
+class AsrPool:
+    def __init__(self, workers: int):
+        self.size = workers
+        self._processes = {}
+        self._watcher = None
+        self.restarts = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def _cpu_threads(self) -> int:
+        if ASR_CPU_THREADS:
+            return ASR_CPU_THREADS
+        return max(1, ((os.cpu_count() or 2) - 1) // self.size)
+
+    def _spawn(self, worker_id: str):
+        # پروسه مستقل (نه fork از ربات): event loop و کتابخانه‌های ربات در worker نیستند
+        process = subprocess.Popen([
+            sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "asr_worker.py"),
+            worker_id, str(os.getpid()), str(self._cpu_threads())
+        ])
+        self._processes[worker_id] = process
+        logger.info(f"worker ASR {worker_id} شروع شد (pid {process.pid})")
+
+    def start(self):
+        """ شروع workerها؛ کارهای ناتمام اجرای قبلی ربات لغو می‌شوند """
+        if not self.enabled:
+            return
+        missing = missing_dependencies()
+        if missing:
+            # بدون وابستگی‌ها workerها مدام از کار می‌افتند؛ استخر خاموش می‌شود تا گزینه زیرنویس هم نمایش داده نشود
+            logger.warning(
+                f"ساخت زیرنویس غیرفعال شد؛ وابستگی‌های نصب‌نشده: {', '.join(missing)} "
+                f"(pip install {' '.join(missing)})"
+            )
+            self.size = 0
+            return
+        reset_asr_queue()
+        for index in range(self.size):
+            self._spawn(f"asr-{index}")
+        self._watcher = asyncio.ensure_future(self._watch())
+
+    async def _watch(self):
+        """ جایگزینی workerهای ازکارافتاده (مثلاً کمبود حافظه)؛ کار در حال اجرای آن‌ها شکست می‌خورد """
+        while True:
+            await asyncio.sleep(ASR_HEARTBEAT_INTERVAL)
+            for worker_id, process in list(self._processes.items()):
+                if process.poll() is None:
+                    continue
+                logger.error(f"worker ASR {worker_id} متوقف شد (کد خروج {process.returncode})؛ شروع مجدد")
+                fail_worker_asr_jobs(worker_id, f"worker با کد {process.returncode} متوقف شد")
+                self.restarts += 1
+                self._spawn(worker_id)
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+        loop = asyncio.get_event_loop()
+        for process in self._processes.values():
+            process.terminate()
+        for process in self._processes.values():
+            try:
+                await loop.run_in_executor(None, process.wait, 5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self._processes.clear()
+
+    async def transcribe(self, media_path: str, lang: str, video_id: str = None, token=None, on_status=None,
+                         source_id: str = None) -> str:
+        """ ساخت SRT در یکی از workerها؛ مسیر فایل SRT.
+        on_status(job) با هر تغییر وضعیت (جایگاه صف، مرحله و پیشرفت) فراخوانی می‌شود.
+        لغو task یا توکن، کار را در صف هم لغو می‌کند.
+        """
+        if not self.enabled:
+            raise AsrError("ساخت زیرنویس غیرفعال است")
+        job_id = uuid.uuid4().hex
+        create_asr_job(job_id, video_id, lang, os.path.abspath(media_path), source_id)
+        finished = False
+        last_seen = None
+        try:
+            while True:
+                if token is not None:
+                    token.check()
+                job = get_asr_job(job_id)
+                if job is None:
+                    raise AsrError("کار زیرنویس پیدا نشد")
+                if job['status'] == 'done':
+                    finished = True
+                    return job['result_path']
+                if job['status'] == 'failed':
+                    finished = True
+                    raise AsrError(job['error'] or "خطا در ساخت زیرنویس")
+                if job['status'] == 'cancelled':
+                    finished = True
+                    raise JobCancelled(REASON_USER, STAGE_TRANSCRIBE)
+                seen = (job['queue_position'], job['stage'], round(job['progress'] or 0, 2))
+                if on_status is not None and seen != last_seen:
+                    last_seen = seen
+                    await on_status(job)
+                await asyncio.sleep(ASR_POLL_INTERVAL)
+        finally:
+            if not finished:
+                cancel_asr_job(job_id)
+
+    def stats(self):
+        counts = get_asr_queue_counts()
+        return {
+            "workers": self.size,
+            "alive": sum(1 for p in self._processes.values() if p.poll() is None),
+            "restarts": self.restarts,
+            "queued": counts.get('queued', 0),
+            "running": counts.get('running', 0),
+            "done": counts.get('done', 0),
+            "failed": counts.get('failed', 0),
+            "heartbeats": get_asr_workers(),
+        }
+
+
+asr_pool = AsrPool(ASR_WORKERS)
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+پروسه worker تبدیل گفتار به متن: مدل‌های Whisper یک بار بارگذاری و بین کارها نگه داشته می‌شوند،
+کارها از جدول asr_jobs برداشته می‌شوند و مرحله/پیشرفت هر کار در همان جدول ثبت می‌شود تا ربات بخواند.
+صوت‌های بلند در سکوت‌ها بخش‌بندی می‌شوند و بخش‌ها به صورت کار فرزند در همان صف قرار می‌گیرند
+تا workerهای بیکار هم‌زمان اجرایشان کنند؛ worker کار اصلی سگمنت‌ها را به هم می‌چسباند و هم‌ترازی را انجام می‌دهد.
+این ماژول با `python asr_worker.py <worker_id> <parent_pid> <cpu_threads>` در پروسه جدا اجرا می‌شود
+و aiogram را import نمی‌کند.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import logging
+from config import (
+    LOGGING_FORMAT, LOGGING_LEVEL, ASR_WORKERS, ASR_WORKER_NICE, ASR_PRELOAD_LANGS, ASR_PRELOAD_ALIGN,
+    ASR_ALIGN_CACHE_SIZE, ASR_POLL_INTERVAL, ASR_HEARTBEAT_INTERVAL, ASR_CHUNK_MIN_DURATION, ASR_CHUNK_SECONDS,
+    ASR_BATCH_SIZE
+)
+from database import (
+    claim_asr_job, update_asr_job_progress, finish_asr_job, record_asr_heartbeat,
+    create_asr_chunk_jobs, get_asr_chunk_jobs, cancel_asr_chunks
+)
+from cancellation import JobCancelled, REASON_USER, STAGE_TRANSCRIBE
+from transcript_store import file_source_id, save_transcript, write_cached_srt, subtitle_output_path
+
+logger = logging.getLogger(__name__)
+
+
+class _JobMonitor:
+    """ پیشرفت و لغو یک کار: نوشتن پیشرفت در جدول (حداکثر هر ASR_POLL_INTERVAL) و خواندن درخواست لغو """
+
+    def __init__(self, job_id: str, parent_pid: int):
+        self.job_id = job_id
+        self.parent_pid = parent_pid
+        self.stage = None
+        self.fraction = 0.0
+        self.cancelled = False
+        self._last_sync = 0.0
+
+    def progress(self, stage: str, fraction: float):
+        changed = stage != self.stage
+        self.stage = stage
+        self.fraction = fraction
+        self._sync(force=changed)
+
+    def check(self):
+        """ cancel_check برای transcribe_pipeline """
+        self._sync()
+        # ربات متوقف شده است؛ کسی منتظر نتیجه نیست
+        if self.cancelled or os.getppid() != self.parent_pid:
+            raise JobCancelled(REASON_USER, STAGE_TRANSCRIBE)
+
+    def _sync(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_sync < ASR_POLL_INTERVAL:
+            return
+        self._last_sync = now
+        try:
+            if update_asr_job_progress(self.job_id, self.stage, self.fraction):
+                self.cancelled = True
+        except Exception as e:
+            logger.warning(f"ثبت پیشرفت کار ASR {self.job_id} ناموفق بود: {e}")
+
+
+def _loaded_models(a2s) -> str:
+    return ",".join(sorted({key[0] for key in a2s._MODEL_CACHE}))
+
+
+def _rss_bytes() -> int:
+    """ حافظه مقیم این پروسه (لینوکس)؛ 0 اگر در دسترس نباشد """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _heartbeat(a2s, worker_id: str, pid: int, status: str, job_id: str = None):
+    """ heartbeat همراه مدل‌های بارگذاری‌شده و حافظه آن‌ها برای آمار ادمین """
+    align = a2s.align_cache_info()
+    record_asr_heartbeat(
+        worker_id, pid, status, job_id, _loaded_models(a2s),
+        align_models=",".join(f"{lang}@{device}" for lang, device, _ in align),
+        align_bytes=sum(size for _, _, size in align),
+        rss=_rss_bytes()
+    )
+
+
+def _preload(a2s):
+    """ بارگذاری مدل زبان‌های ASR_PRELOAD_LANGS (و در صورت ASR_PRELOAD_ALIGN مدل هم‌ترازی آن‌ها) پیش از اولین کار """
+    device, compute_type = a2s.get_device_and_compute_type()
+    for lang in ASR_PRELOAD_LANGS:
+        model_name = a2s.select_model_by_lang(lang)
+        try:
+            a2s.get_whisper_model(model_name, device, compute_type)
+            logger.info(f"مدل {model_name} ({lang}) روی {device} بارگذاری شد")
+        except Exception as e:
+            logger.error(f"بارگذاری مدل {model_name} ناموفق بود: {e}")
+    if not ASR_PRELOAD_ALIGN or a2s.whisperx is None:
+        return
+    # بیشتر از ظرفیت کش بارگذاری نمی‌شود (مدل‌های اول بلافاصله آزاد می‌شدند)
+    for lang in ASR_PRELOAD_LANGS[:ASR_ALIGN_CACHE_SIZE]:
+        try:
+            a2s.get_align_model(lang, device)
+            logger.info(f"مدل هم‌ترازی {lang} روی {device} بارگذاری شد")
+        except Exception as e:
+            logger.error(f"بارگذاری مدل هم‌ترازی {lang} ناموفق بود: {e}")
+
+
+def _run_chunk(a2s, job: dict, parent_pid: int, on_progress=None):
+    """ اجرای یک بخش؛ سگمنت‌ها (با زمان مطلق) در فایل JSON کنار فایل صوت مشترک کار اصلی نوشته می‌شوند """
+    monitor = _JobMonitor(job['job_id'], parent_pid)
+
+    def report(stage, fraction):
+        monitor.progress(stage, fraction)
+        if on_progress is not None:
+            on_progress(fraction)
+
+    try:
+        device, compute_type = a2s.get_device_and_compute_type()
+        segments = a2s.transcribe_chunk(
+            job['media_path'], job['chunk_start'], job['chunk_end'], job['lang'], job['model'],
+            device, compute_type, cancel_check=monitor.check, progress=report
+        )
+        # کار اصلی تمام یا لغو شده و پوشه حافظه مشترک آن پاک شده است
+        if not os.path.exists(job['media_path']):
+            raise JobCancelled(REASON_USER, STAGE_TRANSCRIBE)
+        result_path = f"{job['media_path']}.{job['job_id']}.json"
+        with open(result_path, 'w', encoding='utf-8') as f:
+            json.dump(segments, f, ensure_ascii=False)
+    except JobCancelled:
+        finish_asr_job(job['job_id'], 'cancelled')
+    except Exception as e:
+        logger.exception(f"بخش ASR {job['job_id']} ناموفق بود: {e}")
+        finish_asr_job(job['job_id'], 'failed', error=str(e)[:500])
+    else:
+        finish_asr_job(job['job_id'], 'done', result_path=result_path)
+
+
+def _run_chunks(a2s, job: dict, worker_id: str, parent_pid: int, audio_path: str, chunks, lang: str,
+                model_name: str, duration_s: float, cancel_check, progress):
+    """ ثبت بخش‌ها در صف، اجرای بخش‌ها در همین worker تا وقتی بخشی باقی است و انتظار برای بقیه؛ سگمنت‌های چسبانده‌شده """
+    create_asr_chunk_jobs(job['job_id'], lang, model_name, audio_path, chunks)
+    logger.info(f"کار ASR {job['job_id']}: {duration_s:.0f} ثانیه صوت در {len(chunks)} بخش")
+    done_s = 0.0
+    try:
+        while True:
+            cancel_check()
+            own = claim_asr_job(worker_id, parent_id=job['job_id'])
+            if own is not None:
+                length = own['chunk_end'] - own['chunk_start']
+                _run_chunk(
+                    a2s, own, parent_pid,
+                    on_progress=lambda fraction: progress("asr", (done_s + fraction * length) / duration_s)
+                )
+            chunk_jobs = get_asr_chunk_jobs(job['job_id'])
+            failed = [c for c in chunk_jobs if c['status'] == 'failed']
+            if failed:
+                raise RuntimeError(f"بخش {failed[0]['job_id']}: {failed[0]['error']}")
+            # بخش‌ها فقط همراه کار اصلی (یا با شروع مجدد ربات) لغو می‌شوند
+            if any(c['status'] == 'cancelled' for c in chunk_jobs):
+                raise JobCancelled(REASON_USER, STAGE_TRANSCRIBE)
+            done_s = sum(c['chunk_end'] - c['chunk_start'] for c in chunk_jobs if c['status'] == 'done')
+            progress("asr", done_s / duration_s)
+            if all(c['status'] == 'done' for c in chunk_jobs):
+                break
+            if own is None:
+                time.sleep(ASR_POLL_INTERVAL)
+    except BaseException:
+        cancel_asr_chunks(job['job_id'])
+        raise
+    results = []
+    for chunk_job in chunk_jobs:
+        with open(chunk_job['result_path'], encoding='utf-8') as f:
+            results.append(json.load(f))
+    return a2s.stitch_chunk_segments(results)
+
+
+def _chunked_runner(a2s, job: dict, worker_id: str, parent_pid: int):
+    """ asr_runner کار اصلی: صوت بلند به بخش‌های حدود ASR_CHUNK_SECONDS تقسیم و بخش‌ها در صف گذاشته می‌شوند؛
+    این worker هم بخش‌ها را برمی‌دارد و پس از پایان همه، سگمنت‌ها را با حذف تکرار مرزها به هم می‌چسباند.
+    با یک worker، صوت بلند به جای بخش‌بندی با استنتاج دسته‌ای (ASR_BATCH_SIZE) در همین پروسه اجرا می‌شود.
+    """
+
+    def run(audio, lang, model_name, device, compute_type, duration_s, cancel_check, progress):
+        if duration_s < ASR_CHUNK_MIN_DURATION:
+            return a2s.transcribe_with_faster_whisper(
+                audio, lang, model_name, device, compute_type, duration_s, cancel_check, progress
+            )
+        if ASR_WORKERS < 2:
+            return a2s.transcribe_with_faster_whisper(
+                audio, lang, model_name, device, compute_type, duration_s, cancel_check, progress,
+                batch_size=ASR_BATCH_SIZE
+            )
+        progress("asr", 0.0)
+        chunks = a2s.plan_chunks(a2s.speech_map(audio), duration_s, ASR_CHUNK_SECONDS)
+        if len(chunks) < 2:
+            return a2s.transcribe_with_faster_whisper(
+                audio, lang, model_name, device, compute_type, duration_s, cancel_check, progress
+            )
+        # آرایه صوت یک بار در حافظه مشترک (/dev/shm در صورت وجود) نوشته و در workerها با mmap خوانده می‌شود
+        handoff_dir = tempfile.mkdtemp(prefix="a2s_", dir=a2s.shared_audio_dir())
+        try:
+            audio_path = os.path.join(handoff_dir, "audio.f32")
+            audio.tofile(audio_path)
+            return _run_chunks(a2s, job, worker_id, parent_pid, audio_path, chunks, lang, model_name,
+                               duration_s, cancel_check, progress), lang
+        finally:
+            shutil.rmtree(handoff_dir, ignore_errors=True)
+
+    return run
+
+
+def _run_job(a2s, job: dict, worker_id: str, parent_pid: int):
+    monitor = _JobMonitor(job['job_id'], parent_pid)
+    started = time.monotonic()
+    srt_path = subtitle_output_path(job['job_id'])
+    try:
+        source_id = job['source_id'] or file_source_id(job['media_path'])
+        # کار هم‌زمان دیگری ممکن است همین رونوشت را پس از ثبت این کار ساخته باشد
+        if write_cached_srt(source_id, job['lang'], srt_path):
+            logger.info(f"کار ASR {job['job_id']}: رونوشت ذخیره‌شده {source_id} استفاده شد")
+        else:
+            transcript = a2s.transcribe_transcript(
+                job['media_path'], job['lang'], cancel_check=monitor.check, progress=monitor.progress,
+                asr_runner=_chunked_runner(a2s, job, worker_id, parent_pid)
+            )
+            save_transcript(source_id, job['lang'], transcript)
+            a2s.write_srt(transcript['subs'], srt_path)
+    except JobCancelled:
+        logger.info(f"کار ASR {job['job_id']} لغو شد")
+        finish_asr_job(job['job_id'], 'cancelled')
+    except Exception as e:
+        logger.exception(f"کار ASR {job['job_id']} ناموفق بود: {e}")
+        finish_asr_job(job['job_id'], 'failed', error=str(e)[:500])
+    else:
+        logger.info(f"کار ASR {job['job_id']} ({job['lang']}) در {time.monotonic() - started:.1f} ثانیه تمام شد")
+        finish_asr_job(job['job_id'], 'done', result_path=srt_path)
+
+
+def worker_main(worker_id: str, parent_pid: int, cpu_threads: int):
+    """ نقطه شروع پروسه worker؛ با توقف پروسه ربات (تغییر parent) خارج می‌شود """
+    # سهم CPU این worker؛ پیش از import کتابخانه‌های ASR تنظیم می‌شود
+    os.environ["A2S_CPU_THREADS"] = str(cpu_threads)
+    os.environ.setdefault("OMP_NUM_THREADS", str(cpu_threads))
+    os.environ["A2S_ALIGN_CACHE"] = str(ASR_ALIGN_CACHE_SIZE)
+    logging.basicConfig(format=LOGGING_FORMAT, level=LOGGING_LEVEL)
+    try:
+        os.nice(ASR_WORKER_NICE)
+    except (AttributeError, OSError):
+        pass
+
+    import audio_to_subtitle as a2s
+
+    pid = os.getpid()
+    record_asr_heartbeat(worker_id, pid, "loading")
+    _preload(a2s)
+    logger.info(f"worker {worker_id} (pid {pid}, {cpu_threads} رشته) آماده است")
+    last_heartbeat = 0.0
+    while os.getppid() == parent_pid:
+        try:
+            job = claim_asr_job(worker_id)
+        except Exception as e:
+            logger.warning(f"خواندن صف ASR ناموفق بود: {e}")
+            job = None
+        if job is None:
+            if time.monotonic() - last_heartbeat >= ASR_HEARTBEAT_INTERVAL:
+                _heartbeat(a2s, worker_id, pid, "idle")
+                last_heartbeat = time.monotonic()
+            time.sleep(ASR_POLL_INTERVAL)
+            continue
+        _heartbeat(a2s, worker_id, pid, "busy", job['job_id'])
+        if job['parent_id']:
+            _run_chunk(a2s, job, parent_pid)
+        else:
+            _run_job(a2s, job, worker_id, parent_pid)
+        _heartbeat(a2s, worker_id, pid, "idle")
+        last_heartbeat = time.monotonic()
+    logger.info(f"worker {worker_id}: پروسه ربات متوقف شده است، خروج")
+
+
+if __name__ == "__main__":
+    worker_main(sys.argv[1], int(sys.argv[2]), int(sys.argv[3]))
@@ -10,16 +10,19 @@ This file provides the transcribe_pipeline(input_path, lang) function used by th
 import argparse
 import os
 import sys
-import tempfile
 import uuid
-import math
-import shutil
-from typing import List, Dict, Optional, Tuple
+import re
+import gc
+import inspect
+import logging
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple, Callable
 import subprocess
 
-from tqdm import tqdm
 import shutil as _shutil
 
+logger = logging.getLogger(__name__)
+
 try:
     import torch
 except Exception:
@@ -30,6 +33,12 @@ try:
 except Exception:
     WhisperModel = None  # type: ignore
 
+# استنتاج دسته‌ای روی بازه‌های VAD (faster-whisper 1.1 به بعد)
+try:
+    from faster_whisper import BatchedInferencePipeline
+except Exception:
+    BatchedInferencePipeline = None  # type: ignore
+
 try:
     import whisperx
 except Exception:
@@ -41,22 +50,28 @@ try:
 except Exception:
     Translator = None  # type: ignore
 
+# تقطیع و نوشتن SRT در ماژول سبک subtitle_format است تا ربات بدون torch/whisperx از آن استفاده کند
+from subtitle_format import normalize_fa_text, write_srt, subtitles_from_transcript
+
+# انتخاب مدل و نسخه pipeline (بخشی از کلید رونوشت‌ها) هم بدون وابستگی سنگین در asr_models است
+from asr_models import DEFAULT_MODEL, PIPELINE_VERSION, select_model_by_lang, translate_via_en, transcript_model_id
+
 SUPPORTED_LANGS = {"fa", "en"}
-DEFAULT_MODEL = os.environ.get("A2S_MODEL", "large-v3")
-MODEL_FA = os.environ.get("A2S_MODEL_FA")  # مدل اختصاصی فارسی (در صورت تنظیم)
-MODEL_EN = os.environ.get("A2S_MODEL_EN")  # مدل اختصاصی انگلیسی (در صورت تنظیم)
 STRICT_LANG = os.environ.get("A2S_STRICT_LANG", "1") == "1"
 ENABLE_FA_RULES = os.environ.get("A2S_FA_RULES", "0") == "1"
 ENV_BEAM = os.environ.get("A2S_BEAM")
 ENV_TEMP = os.environ.get("A2S_TEMP")
 COND_PREV = os.environ.get("A2S_CONDITION_PREV", "0") == "1"
 VAD_MIN_MS = int(os.environ.get("A2S_VAD_MIN_MS", "600"))
-MAX_SUBTITLE_DURATION = 3.0
-MAX_WORDS_PER_LINE = 8
+SAMPLE_RATE = 16000
 DEBUG = os.environ.get("A2S_DEBUG", "0") == "1"
 FAST_NO_VAD = os.environ.get("A2S_FAST_NO_VAD", "0") == "1"
+# حداکثر تعداد مدل‌های هم‌ترازی whisperx که هم‌زمان در حافظه می‌مانند
+ALIGN_CACHE_SIZE = max(1, int(os.environ.get("A2S_ALIGN_CACHE", "2")))
 
 _MODEL_CACHE: Dict[Tuple[str, str, str, int, int], "WhisperModel"] = {}
+# (زبان، دستگاه) -> (مدل، metadata، حجم بایت)؛ ترتیب از کم‌استفاده‌ترین
+_ALIGN_CACHE: "OrderedDict[Tuple[str, str], Tuple[object, Dict, int]]" = OrderedDict()
 
 
 def check_dependencies() -> None:
@@ -90,18 +105,6 @@ def _find_binary(binary_name: str) -> Optional[str]:
     return None
 
 
-def _probe_duration_seconds(input_path: str) -> float:
-    ffprobe_path = _find_binary("ffprobe.exe") or _find_binary("ffprobe") or "ffprobe"
-    result = subprocess.run(
-        [ffprobe_path, "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", input_path],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        check=True,
-        text=True,
-    )
-    return float(result.stdout.strip())
-
-
 def has_cuda() -> bool:
     try:
         return bool(torch is not None and torch.cuda.is_available())
@@ -116,7 +119,8 @@ def get_device_and_compute_type() -> Tuple[str, str]:
 
 
 def get_cpu_threads_and_workers() -> Tuple[int, int]:
-    cpu_threads = max(1, (os.cpu_count() or 4) - 1)
+    # A2S_CPU_THREADS: سهم هر پروسه worker وقتی چند worker روی یک سرور اجرا می‌شوند
+    cpu_threads = int(os.environ.get("A2S_CPU_THREADS") or 0) or max(1, (os.cpu_count() or 4) - 1)
     num_workers = 2 if has_cuda() else 1
     return cpu_threads, num_workers
 
@@ -137,25 +141,6 @@ def get_whisper_model(model_name: str, device: str, compute_type: str) -> "Whisp
     return model
 
 
-def select_model_by_lang(lang: Optional[str]) -> str:
-    """بر اساس زبان، بهترین مدل رایگان و آفلاین را انتخاب می‌کند (قابل override با ENV)."""
-    # اولویت با ENV اختصاصی هر زبان
-    if lang == "fa" and MODEL_FA:
-        return MODEL_FA
-    if lang == "en" and MODEL_EN:
-        return MODEL_EN
-    # انتخاب‌های پیشنهادی
-    # برای انگلیسی: مدل‌های "*.en" دقیق‌تر و سریع‌تر می‌شوند
-    if lang == "en":
-        # اگر سخت‌افزار قوی نیست، medium.en تعادل خوبی دارد
-        return "medium.en"
-    # برای فارسی: بهترین کیفیت، مدل‌های چندزبانه بزرگ‌تر
-    if lang == "fa":
-        return "large-v3"
-    # پیش‌فرض
-    return DEFAULT_MODEL
-
-
 def translate_texts_google(texts: List[str], src: str, dest: str) -> List[str]:
     """Translate a list of texts using googletrans. Falls back to originals on failure."""
     if not texts:
@@ -184,36 +169,53 @@ def translate_texts_google(texts: List[str], src: str, dest: str) -> List[str]:
 essential_bins_checked = False
 
 
-def load_audio_to_mono16k_wav(input_path: str, tmp_dir: str) -> Tuple[str, float]:
+def load_audio(input_path: str, cancel_check: Optional[Callable[[], None]] = None):
+    """ رمزگشایی یک‌باره ورودی به آرایه float32 تک‌کاناله 16kHz از خروجی خام f32le ffmpeg (بدون WAV موقت).
+    همین آرایه به faster-whisper و whisperx داده می‌شود و مدت صوت از تعداد نمونه‌ها به دست می‌آید.
+    cancel_check بین خواندن بلوک‌ها فراخوانی می‌شود و با raise کردن، ffmpeg کشته می‌شود.
+    """
+    import numpy as np
     if not os.path.exists(input_path):
         raise FileNotFoundError(f"Input not found: {input_path}")
-    duration_s = _probe_duration_seconds(input_path)
-    out_wav = os.path.join(tmp_dir, f"{uuid.uuid4().hex}.wav")
     ffmpeg_bin = _find_binary("ffmpeg.exe") or _find_binary("ffmpeg") or "ffmpeg"
-    subprocess.run([ffmpeg_bin, "-y", "-i", input_path, "-ac", "1", "-ar", "16000", out_wav], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
-    return out_wav, duration_s
-
-
-def _normalize_fa_text(text: str) -> str:
-    # ساده‌سازی فارسی: یکسان‌سازی حروف عربی/فارسی، حذف کشیده و فاصله‌های تکراری
-    if not text:
-        return text
-    replaces = {
-        "ي": "ی",
-        "ى": "ی",
-        "ئ": "ی",
-        "ك": "ک",
-        "أ": "ا",
-        "إ": "ا",
-        "ؤ": "و",
-        "ٱ": "ا",
-        "ـ": "",  # کشیده
-    }
-    for k, v in replaces.items():
-        text = text.replace(k, v)
-    # فاصله‌های متعدد به یک فاصله
-    text = " ".join(text.split())
-    return text
+    cmd = [
+        ffmpeg_bin, "-nostdin", "-v", "error", "-i", input_path,
+        "-f", "f32le", "-acodec", "pcm_f32le", "-ac", "1", "-ar", str(SAMPLE_RATE), "-",
+    ]
+    buffer = bytearray()
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as proc:
+        try:
+            while True:
+                block = proc.stdout.read(1 << 20)
+                if not block:
+                    break
+                buffer += block
+                if cancel_check is not None:
+                    cancel_check()
+            # با -v error خروجی stderr کوتاه است و بعد از stdout خوانده می‌شود
+            stderr = proc.stderr.read()
+            proc.wait()
+        except BaseException:
+            proc.kill()
+            raise
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr)
+    # آرایه روی همان buffer ساخته می‌شود (بدون کپی دوم)
+    return np.frombuffer(buffer, dtype=np.float32, count=len(buffer) // 4)
+
+
+def shared_audio_dir() -> Optional[str]:
+    """ پوشه حافظه مشترک (tmpfs) برای دادن آرایه صوت به پروسه‌های دیگر؛ None یعنی پوشه موقت پیش‌فرض """
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return None
+
+
+def open_shared_audio(path: str):
+    """ آرایه صوتی که با audio.tofile(path) نوشته شده است، به صورت mmap فقط‌خواندنی (بدون کپی کل فایل) """
+    import numpy as np
+    return np.memmap(path, dtype=np.float32, mode="r")
+
 
 def _fa_common_corrections(text: str) -> str:
     # غیرفعال پیش‌فرض؛ در صورت نیاز با A2S_FA_RULES=1 فعال می‌شود
@@ -221,13 +223,20 @@ def _fa_common_corrections(text: str) -> str:
 
 
 def transcribe_with_faster_whisper(
-    wav_path: str,
+    audio,
     lang: Optional[str],
     model_name: str,
     device: str,
     compute_type: str,
     progress_total_s: float,
+    cancel_check: Optional[Callable[[], None]] = None,
+    progress: Optional[Callable[[str, float], None]] = None,
+    offset: float = 0.0,
+    batch_size: int = 1,
 ) -> Tuple[List[Dict], str]:
+    """ ASR آرایه float32 (16kHz) یا فایل صوتی؛ offset به زمان همه سگمنت‌ها اضافه می‌شود.
+    با batch_size > 1 (و نسخه‌ای از faster-whisper که BatchedInferencePipeline دارد) بازه‌های گفتار دسته‌ای رمزگشایی می‌شوند.
+    """
     model = get_whisper_model(model_name, device, compute_type)
     # افزایش/کنترل beam از طریق ENV یا بر اساس مدل
     if ENV_BEAM is not None:
@@ -266,25 +275,152 @@ def transcribe_with_faster_whisper(
         if lang == "fa":
             kwargs["initial_prompt"] = "«متن فارسی، کلمات صحیح و بدون کشیده و محاوره رایج.»"
 
-    seg_iter, info = model.transcribe(wav_path, **kwargs)
+    if batch_size > 1 and BatchedInferencePipeline is not None:
+        pipeline = BatchedInferencePipeline(model=model)
+        # حالت دسته‌ای بدون VAD بازه‌ای برای دسته‌بندی ندارد و همه پارامترهای حالت عادی را نمی‌پذیرد
+        accepted = inspect.signature(pipeline.transcribe).parameters
+        kwargs = {k: v for k, v in kwargs.items() if k in accepted}
+        kwargs["vad_filter"] = True
+        seg_iter, info = pipeline.transcribe(audio, batch_size=batch_size, **kwargs)
+    else:
+        seg_iter, info = model.transcribe(audio, **kwargs)
     detected_lang = getattr(info, "language", None) or (lang or "en")
     segments: List[Dict] = []
     last_end = 0.0
     for s in seg_iter:
+        # segmentها به صورت lazy رمزگشایی می‌شوند؛ لغو بین دو segment اعمال می‌شود
+        if cancel_check is not None:
+            cancel_check()
         text = s.text.strip()
         if (lang or detected_lang) == "fa":
-            text = _normalize_fa_text(text)
+            text = normalize_fa_text(text)
             if ENABLE_FA_RULES:
                 text = _fa_common_corrections(text)
-        seg = {"start": float(s.start), "end": float(s.end), "text": text}
+        seg = {"start": float(s.start) + offset, "end": float(s.end) + offset, "text": text}
         segments.append(seg)
         last_end = float(s.end)
+        if progress is not None and progress_total_s > 0:
+            progress("asr", min(1.0, last_end / progress_total_s))
     # Progress bar removed for bot usage
     return segments, detected_lang
 
 
+def speech_map(audio, block_s: float = 600.0) -> List[Tuple[float, float]]:
+    """ بازه‌های گفتار کل صوت (ثانیه) با VAD خود faster-whisper؛ آرایه بلوک‌به‌بلوک بررسی می‌شود """
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+    options = VadOptions(min_silence_duration_ms=VAD_MIN_MS)
+    block = int(block_s * SAMPLE_RATE)
+    spans: List[Tuple[float, float]] = []
+    for first in range(0, len(audio), block):
+        block_start = first / SAMPLE_RATE
+        for ts in get_speech_timestamps(audio[first:first + block], options):
+            start = block_start + ts["start"] / SAMPLE_RATE
+            end = block_start + ts["end"] / SAMPLE_RATE
+            # گفتاری که در مرز دو بلوک بریده شده یک بازه است
+            if spans and start - spans[-1][1] < 0.1:
+                spans[-1] = (spans[-1][0], end)
+            else:
+                spans.append((start, end))
+    return spans
+
+
+def plan_chunks(speech: List[Tuple[float, float]], duration_s: float, target_s: float) -> List[Tuple[float, float]]:
+    """ تقسیم فایل به بخش‌های حدود target_s ثانیه؛ برش فقط وسط سکوت بین دو بازه گفتار """
+    chunks: List[Tuple[float, float]] = []
+    chunk_start = 0.0
+    for (_, gap_start), (gap_end, _) in zip(speech, speech[1:]):
+        cut = (gap_start + gap_end) / 2
+        # بخش آخر خیلی کوتاه نشود
+        if cut - chunk_start >= target_s and duration_s - cut >= target_s / 2:
+            chunks.append((chunk_start, cut))
+            chunk_start = cut
+    chunks.append((chunk_start, duration_s))
+    return chunks
+
+
+def transcribe_chunk(
+    audio,
+    start_s: float,
+    end_s: float,
+    lang: Optional[str],
+    model_name: str,
+    device: str,
+    compute_type: str,
+    cancel_check: Optional[Callable[[], None]] = None,
+    progress: Optional[Callable[[str, float], None]] = None,
+) -> List[Dict]:
+    """ ASR یک بخش از صوت (آرایه یا مسیر فایل open_shared_audio)؛ زمان سگمنت‌ها نسبت به ابتدای کل صوت است """
+    import numpy as np
+    if isinstance(audio, str):
+        audio = open_shared_audio(audio)
+    piece = np.ascontiguousarray(audio[int(start_s * SAMPLE_RATE):int(end_s * SAMPLE_RATE)])
+    segments, _ = transcribe_with_faster_whisper(
+        piece, lang, model_name, device, compute_type, end_s - start_s, cancel_check, progress, offset=start_s
+    )
+    return segments
+
+
+def _seam_text(text: str) -> str:
+    return re.sub(r"\W+", "", text.lower())
+
+
+def stitch_chunk_segments(chunks: List[List[Dict]]) -> List[Dict]:
+    """ اتصال سگمنت‌های بخش‌ها به ترتیب؛ در مرز دو بخش سگمنت تکراری حذف و هم‌پوشانی زمانی بریده می‌شود """
+    stitched: List[Dict] = []
+    for chunk in chunks:
+        for seg in chunk:
+            if stitched and seg["start"] < stitched[-1]["end"]:
+                prev_text = _seam_text(stitched[-1]["text"])
+                text = _seam_text(seg["text"])
+                if not text or text in prev_text:
+                    continue
+                if prev_text and prev_text in text:
+                    stitched.pop()
+                else:
+                    seg = dict(seg, start=stitched[-1]["end"])
+                    if seg["end"] <= seg["start"]:
+                        continue
+            stitched.append(seg)
+    return stitched
+
+
+def _torch_module_bytes(model) -> int:
+    """ حجم پارامترها و bufferهای مدل torch (بایت)؛ 0 اگر قابل محاسبه نباشد """
+    try:
+        tensors = list(model.parameters()) + list(model.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    except Exception:
+        return 0
+
+
+def get_align_model(language: str, device: str):
+    """ (مدل، metadata) هم‌ترازی whisperx از کش LRU؛ با پر شدن کش کم‌استفاده‌ترین مدل آزاد می‌شود """
+    key = (language, device)
+    if key in _ALIGN_CACHE:
+        _ALIGN_CACHE.move_to_end(key)
+        model, metadata, _ = _ALIGN_CACHE[key]
+        return model, metadata
+    model, metadata = whisperx.load_align_model(language_code=language, device=device)
+    _ALIGN_CACHE[key] = (model, metadata, _torch_module_bytes(model))
+    while len(_ALIGN_CACHE) > ALIGN_CACHE_SIZE:
+        old_key, evicted = _ALIGN_CACHE.popitem(last=False)
+        old_bytes = evicted[2]
+        # آخرین ارجاع به مدل پیش از gc حذف می‌شود تا حافظه همین‌جا آزاد شود
+        del evicted
+        gc.collect()
+        if old_key[1] == "cuda" and torch is not None:
+            torch.cuda.empty_cache()
+        logger.info(f"مدل هم‌ترازی {old_key[0]}/{old_key[1]} ({old_bytes // (1024 * 1024)}MB) از کش خارج شد")
+    return model, metadata
+
+
+def align_cache_info() -> List[Tuple[str, str, int]]:
+    """ مدل‌های هم‌ترازی بارگذاری‌شده: (زبان، دستگاه، حجم بایت) """
+    return [(language, device, size) for (language, device), (_, _, size) in _ALIGN_CACHE.items()]
+
+
 def align_with_whisperx(
-    wav_path: str,
+    audio,
     segments: List[Dict],
     language: str,
     device: str,
@@ -293,171 +429,89 @@ def align_with_whisperx(
         return []
     if whisperx is None:
         return segments
-    audio = whisperx.load_audio(wav_path)
-    align_model, metadata = whisperx.load_align_model(language_code=language, device=device)
+    if isinstance(audio, str):
+        audio = whisperx.load_audio(audio)
+    align_model, metadata = get_align_model(language, device)
     aligned = whisperx.align({"segments": segments, "language": language}, align_model, metadata, audio, device, return_char_alignments=False)
     return aligned["segments"]
 
 
-def format_timestamp_srt(seconds: float) -> str:
-    seconds = max(0.0, seconds)
-    h = int(seconds // 3600)
-    m = int((seconds % 3600) // 60)
-    s = int(seconds % 60)
-    ms = int(round((seconds - int(seconds)) * 1000))
-    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
-
-
-def chunk_words_to_subs(words: List[Dict], max_duration: float, max_words: int) -> List[Dict]:
-    subs: List[Dict] = []
-    cur_words: List[str] = []
-    cur_start: Optional[float] = None
-    cur_end: Optional[float] = None
-    for w in words:
-        if "start" not in w or w["start"] is None or "end" not in w or w["end"] is None:
-            continue
-        w_start = float(w["start"])  # type: ignore
-        w_end = float(w["end"])  # type: ignore
-        token = str(w.get("word", "")).strip()
-        if not token:
-            continue
-        if cur_start is None:
-            cur_start = w_start
-            cur_end = w_end
-            cur_words = [token]
-            continue
-        next_end = w_end
-        next_count = len(cur_words) + 1
-        next_duration = next_end - cur_start
-        if next_duration > MAX_SUBTITLE_DURATION or next_count > MAX_WORDS_PER_LINE:
-            if cur_words and cur_start is not None and cur_end is not None:
-                subs.append({"start": cur_start, "end": cur_end, "text": " ".join(cur_words)})
-            cur_words = [token]
-            cur_start = w_start
-            cur_end = w_end
-        else:
-            cur_words.append(token)
-            cur_end = next_end
-    if cur_words and cur_start is not None and cur_end is not None:
-        subs.append({"start": cur_start, "end": cur_end, "text": " ".join(cur_words)})
-    return subs
-
-
-def fallback_chunk_segments(segments: List[Dict]) -> List[Dict]:
-    subs: List[Dict] = []
-    for seg in segments:
-        start = float(seg.get("start", 0.0))
-        end = float(seg.get("end", start + 2.0))
-        text = str(seg.get("text", "")).strip()
-        if not text:
-            continue
-        duration = max(0.0, end - start)
-        if duration <= MAX_SUBTITLE_DURATION:
-            subs.append({"start": start, "end": end, "text": text})
-            continue
-        parts = max(1, int(math.ceil(duration / MAX_SUBTITLE_DURATION)))
-        words = text.split()
-        words_per_part = max(1, int(math.ceil(len(words) / parts)))
-        current = 0
-        for i in range(parts):
-            chunk_words = words[current: current + words_per_part]
-            if not chunk_words:
-                break
-            chunk_start = start + i * (duration / parts)
-            chunk_end = start + (i + 1) * (duration / parts)
-            subs.append({"start": chunk_start, "end": chunk_end, "text": " ".join(chunk_words)})
-            current += words_per_part
-    return subs
-
-
-def build_subtitles(aligned_segments: List[Dict]) -> List[Dict]:
-    all_words: List[Dict] = []
-    for seg in aligned_segments:
-        for w in seg.get("words", []) or []:
-            if w.get("start") is None or w.get("end") is None:
-                continue
-            token = str(w.get("word", "")).strip()
-            if token:
-                all_words.append({"word": token, "start": float(w["start"]), "end": float(w["end"])} )
-    if all_words:
-        return chunk_words_to_subs(all_words, MAX_SUBTITLE_DURATION, MAX_WORDS_PER_LINE)
-    return fallback_chunk_segments(aligned_segments)
-
-
-def _merge_short_subs(subs: List[Dict], min_duration: float = 0.8) -> List[Dict]:
-    if not subs:
-        return subs
-    merged: List[Dict] = []
-    i = 0
-    while i < len(subs):
-        cur = subs[i]
-        duration = float(cur["end"]) - float(cur["start"])
-        if duration < min_duration and i + 1 < len(subs):
-            nxt = subs[i + 1]
-            combined_text = (str(cur.get("text", "")).strip() + " " + str(nxt.get("text", "")).strip()).strip()
-            combined_duration = float(nxt["end"]) - float(cur["start"])
-            if combined_duration <= MAX_SUBTITLE_DURATION:
-                merged.append({"start": float(cur["start"]), "end": float(nxt["end"]), "text": combined_text})
-                i += 2
-                continue
-        merged.append(cur)
-        i += 1
-    return merged
-
-
-def write_srt(subs: List[Dict], out_path: str) -> None:
-    lines: List[str] = []
-    for idx, item in enumerate(subs, start=1):
-        start = format_timestamp_srt(float(item["start"]))
-        end = format_timestamp_srt(float(item["end"]))
-        text = str(item.get("text", "")).strip()
-        lines.append(str(idx))
-        lines.append(f"{start} --> {end}")
-        lines.append(text)
-        lines.append("")
-    with open(out_path, "w", encoding="utf-8") as f:
-        f.write("\n".join(lines))
-
-
-def transcribe_pipeline(input_path: str, lang: str, model_name: str = DEFAULT_MODEL) -> str:
+def default_srt_path(input_path: str, lang: str) -> str:
+    """ مسیر یکتا کنار پوشه جاری؛ دو کار هم‌زمان روی یک ورودی فایل هم را بازنویسی نمی‌کنند """
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.abspath(f"{stem}.{lang}.{uuid.uuid4().hex[:8]}.srt")
+
+
+def transcribe_transcript(
+    input_path: str,
+    lang: str,
+    model_name: str = DEFAULT_MODEL,
+    cancel_check: Optional[Callable[[], None]] = None,
+    progress: Optional[Callable[[str, float], None]] = None,
+    asr_runner: Optional[Callable[..., Tuple[List[Dict], str]]] = None,
+) -> Dict:
+    """ رونوشت کامل: سگمنت‌های خام ASR، سگمنت‌های هم‌ترازشده (کلمه‌ای) و زیرنویس نهایی.
+    cancel_check (اختیاری) در هر مرحله فراخوانی می‌شود و با raise کردن، کار را متوقف می‌کند.
+    progress (اختیاری) با (مرحله، کسر پیشرفت همان مرحله) فراخوانی می‌شود: decode / asr / align.
+    asr_runner (اختیاری) با امضای transcribe_with_faster_whisper جای آن اجرا می‌شود (مثلاً ASR بخش‌بندی‌شده worker).
+    """
     check_dependencies()
+    model_id = transcript_model_id(lang, model_name)
     # انتخاب مدل بر اساس زبان در صورتیکه کاربر model_name را override نکرده باشد
     if model_name == DEFAULT_MODEL:
         model_name = select_model_by_lang(lang)
     device, compute_type = get_device_and_compute_type()
-    tmp_dir = tempfile.mkdtemp(prefix="a2s_")
-    srt_path = None
-    try:
-        wav_path, duration_s = load_audio_to_mono16k_wav(input_path, tmp_dir)
-        # اگر فارسی و ترجمه آنلاین فعال: اول انگلیسی STT بگیریم
-        stt_lang = lang
-        used_model = model_name
-        if lang == "fa" and os.environ.get("A2S_TRANSLATE_FA_VIA_EN", "0") == "1":
-            stt_lang = "en"
-            used_model = select_model_by_lang("en")
-        segments, det_lang = transcribe_with_faster_whisper(wav_path, stt_lang, used_model, device, compute_type, duration_s)
-        detected_language = stt_lang if stt_lang in SUPPORTED_LANGS else (det_lang or "en")
-        # ترجمه در صورت نیاز
-        if lang == "fa" and stt_lang == "en":
-            original_texts = [seg.get("text", "") for seg in segments]
-            translated = translate_texts_google(original_texts, src="en", dest="fa")
-            for i, seg in enumerate(segments):
-                seg["text"] = translated[i] if i < len(translated) else seg.get("text", "")
-            detected_language = "fa"
-        align_lang = detected_language if detected_language in SUPPORTED_LANGS else (lang if lang in SUPPORTED_LANGS else "en")
-        aligned_segments = align_with_whisperx(wav_path, segments, align_lang, device)
-        subs = build_subtitles(aligned_segments)
-        subs = _merge_short_subs(subs)
-        if not subs:
-            subs = fallback_chunk_segments(segments)
-        base_out = os.path.splitext(os.path.basename(input_path))[0] + ".srt"
-        if not base_out.lower().endswith('.srt'):
-            base_out = os.path.splitext(base_out)[0] + '.srt'
-        srt_path = os.path.abspath(base_out)
-        write_srt(subs, srt_path)
-        return srt_path
-    finally:
-        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if progress is not None:
+        progress("decode", 0.0)
+    audio = load_audio(input_path, cancel_check)
+    duration_s = len(audio) / SAMPLE_RATE
+    # اگر فارسی و ترجمه آنلاین فعال: اول انگلیسی STT بگیریم
+    stt_lang = lang
+    used_model = model_name
+    if translate_via_en(lang):
+        stt_lang = "en"
+        used_model = select_model_by_lang("en")
+    runner = asr_runner or transcribe_with_faster_whisper
+    segments, det_lang = runner(audio, stt_lang, used_model, device, compute_type, duration_s, cancel_check, progress)
+    detected_language = stt_lang if stt_lang in SUPPORTED_LANGS else (det_lang or "en")
+    # ترجمه در صورت نیاز
+    if lang == "fa" and stt_lang == "en":
+        original_texts = [seg.get("text", "") for seg in segments]
+        translated = translate_texts_google(original_texts, src="en", dest="fa")
+        for i, seg in enumerate(segments):
+            seg["text"] = translated[i] if i < len(translated) else seg.get("text", "")
+        detected_language = "fa"
+    align_lang = detected_language if detected_language in SUPPORTED_LANGS else (lang if lang in SUPPORTED_LANGS else "en")
+    if cancel_check is not None:
+        cancel_check()
+    if progress is not None:
+        progress("align", 0.0)
+    aligned_segments = align_with_whisperx(audio, segments, align_lang, device)
+    transcript = {
+        "language": align_lang,
+        "model": model_id,
+        "pipeline_version": PIPELINE_VERSION,
+        "duration": duration_s,
+        "segments": segments,
+        "aligned": aligned_segments,
+    }
+    subtitles_from_transcript(transcript)
+    return transcript
+
+
+def transcribe_pipeline(
+    input_path: str,
+    lang: str,
+    model_name: str = DEFAULT_MODEL,
+    cancel_check: Optional[Callable[[], None]] = None,
+    progress: Optional[Callable[[str, float], None]] = None,
+    out_path: Optional[str] = None,
+) -> str:
+    """ ساخت SRT برای ورودی؛ بدون out_path در مسیر یکتای default_srt_path نوشته می‌شود. """
+    transcript = transcribe_transcript(input_path, lang, model_name, cancel_check, progress)
+    srt_path = out_path or default_srt_path(input_path, lang)
+    write_srt(transcript["subs"], srt_path)
+    return srt_path
 
 
 if __name__ == "__main__":
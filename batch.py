@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+دسته‌ها: پلی‌لیست یا چند لینک در یک پیام با یک انتخاب کیفیت.
+دانلود و آپلود به صورت pipeline اجرا می‌شوند (آیتم بعدی هم‌زمان با آپلود آیتم فعلی دانلود می‌شود)،
+اعتبار پس از تحویل هر آیتم کسر می‌شود و وضعیت همه آیتم‌ها در یک پیام نمایش داده می‌شود.
+"""
+
+import re
+import asyncio
+import logging
+from yt_dlp import YoutubeDL
+from config import BATCH_MAX_ITEMS, MAX_DURATION
+from keyboards import get_quality_keyboard, get_job_cancel_keyboard
+from states import DownloadStates
+from credits import check_and_consume_credit, has_enough_credit
+from progress import ProgressReporter
+from cancellation import register_handle, unregister_handle, STAGE_EXTRACT, STAGE_TIMEOUTS
+from prefetch import cancel_prefetch, record_quality_pick
+from database import has_cached_file
+from download import (
+    get_extract_opts, get_video_info, shared_download, send_cached_media, upload_and_cache, CANCELLED_MESSAGE
+)
+
+logger = logging.getLogger(__name__)
+
+_VIDEO_LINK_PATTERN = re.compile(
+    r'(?:https?://)?(?:www\.|m\.)?(?:youtube\.com/(?:watch\?v=|shorts/)|youtu\.be/)([a-zA-Z0-9_-]{11})'
+)
+_PLAYLIST_LINK_PATTERN = re.compile(r'(?:https?://)?(?:www\.|m\.)?youtube\.com/playlist\?list=([a-zA-Z0-9_-]+)')
+
+MAX_TITLE_CHARS = 40
+
+
+def parse_batch_request(text: str):
+    """ ('playlist', list_id) یا ('links', [video_id, ...]) برای پیام‌های دسته‌ای؛ لینک تکی None """
+    if not text:
+        return None
+    playlist = _PLAYLIST_LINK_PATTERN.search(text)
+    if playlist:
+        return 'playlist', playlist.group(1)
+    video_ids = list(dict.fromkeys(_VIDEO_LINK_PATTERN.findall(text)))
+    if len(video_ids) > 1:
+        return 'links', video_ids[:BATCH_MAX_ITEMS]
+    return None
+
+
+def is_batch_request(text: str) -> bool:
+    return parse_batch_request(text) is not None
+
+
+def extract_playlist_sync(list_id: str):
+    """ فهرست پلی‌لیست با استخراج flat (بدون خواندن اطلاعات کامل هر ویدیو) """
+    opts = get_extract_opts()
+    opts.update({'extract_flat': 'in_playlist', 'playlistend': BATCH_MAX_ITEMS})
+    with YoutubeDL(opts) as ydl:
+        info = ydl.extract_info(f"https://www.youtube.com/playlist?list={list_id}", download=False)
+    items = []
+    for entry in info.get('entries') or []:
+        if not entry or not entry.get('id'):
+            continue
+        items.append({
+            'id': entry['id'],
+            'title': entry.get('title') or entry['id'],
+            'duration': entry.get('duration'),
+        })
+    return info.get('title') or "پلی‌لیست", items[:BATCH_MAX_ITEMS]
+
+
+def _short(title: str) -> str:
+    return title if len(title) <= MAX_TITLE_CHARS else title[:MAX_TITLE_CHARS - 1] + "…"
+
+
+class BatchBoard:
+    """ پیام وضعیت دسته: یک خط برای هر آیتم، ویرایش با محدودیت نرخ ProgressReporter """
+
+    def __init__(self, message, title: str, items, reply_markup=None):
+        self.items = items
+        self.lines = ["⏳ در انتظار"] * len(items)
+        self.reporter = ProgressReporter(message, title, reply_markup=reply_markup)
+
+    def set_line(self, index: int, text: str):
+        self.lines[index] = text
+        self.reporter.set_status(self.render())
+
+    def set_title(self, index: int, title: str):
+        self.items[index]['title'] = title
+        self.reporter.set_status(self.render())
+
+    def render(self) -> str:
+        return "\n".join(
+            f"{number}. {_short(item['title'])}\n    {line}"
+            for number, (item, line) in enumerate(zip(self.items, self.lines), start=1)
+        )
+
+    async def finish(self, summary: str):
+        """ نمایش نهایی وضعیت بدون دکمه لغو """
+        await self.reporter.finish(f"{self.render()}\n\n{summary}")
+
+
+class _ItemReporter(ProgressReporter):
+    """ گزارشگر یک آیتم: وضعیت در خط همان آیتم در پیام دسته قرار می‌گیرد """
+
+    def __init__(self, board: BatchBoard, index: int):
+        parent = board.reporter
+        super().__init__(parent.message, parent.title, loop=parent.loop, min_interval=parent.min_interval)
+        self.board = board
+        self.index = index
+
+    def set_status(self, text: str):
+        # ویرایش پیام با گزارشگر خود دسته است؛ این گزارشگر فقط خط آیتم را عوض می‌کند
+        with self._lock:
+            if self._closed:
+                return
+        self.board.set_line(self.index, text)
+
+    async def finish(self, text: str):
+        await self.close()
+        self.board.set_line(self.index, text)
+
+
+class _ItemDownload:
+    """ دانلود یک آیتم که تا پایان آپلود آن باز نگه داشته می‌شود """
+
+    def __init__(self):
+        loop = asyncio.get_event_loop()
+        self.ready = loop.create_future()
+        self.released = asyncio.Event()
+        self.task = None
+
+    def release(self):
+        self.released.set()
+
+
+async def _resolve_title(item, board, index):
+    """ عنوان آیتم دسته لینک‌ها (تا استخراج همان video_id است) پیش از ارسال از کش file_id """
+    if item['title'] != item['id']:
+        return
+    try:
+        info = await get_video_info(f"https://www.youtube.com/watch?v={item['id']}", item['id'])
+    except Exception as e:
+        logger.warning(f"عنوان آیتم {item['id']} دسته خوانده نشد: {e}")
+        return
+    board.set_title(index, info.get('title') or item['title'])
+
+
+async def _hold_item(item_dl: _ItemDownload, item, quality, user_id, board, index):
+    reporter = _ItemReporter(board, index)
+    url = f"https://www.youtube.com/watch?v={item['id']}"
+    try:
+        info = await get_video_info(url, item['id'])
+        board.set_title(index, info.get('title') or item['title'])
+        duration = info.get('duration') or 0
+        if duration > MAX_DURATION:
+            item_dl.ready.set_result((None, f"طولانی‌تر از حد مجاز ({MAX_DURATION // 60} دقیقه)"))
+            return
+
+        async def show_position(position):
+            if position > 0:
+                reporter.set_status(f"🕒 در صف دانلود... نوبت: {position}")
+            else:
+                reporter.set_status("⏬ در حال دانلود...")
+
+        async with shared_download(
+            url, item['id'], quality, user_id=user_id, on_position=show_position, on_progress=reporter.ytdlp_hook
+        ) as result:
+            item_dl.ready.set_result(result)
+            # فایل تا پایان آپلود روی دیسک می‌ماند
+            await item_dl.released.wait()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.warning(f"خطا در دانلود آیتم {item['id']} دسته: {e}")
+        if not item_dl.ready.done():
+            item_dl.ready.set_result((None, "خطا در خواندن اطلاعات ویدیو"))
+
+
+async def process_batch_request(message, state):
+    """ فهرست کردن دسته و نمایش یک کیبورد کیفیت برای همه آیتم‌ها """
+    request = parse_batch_request(message.text)
+    if request is None:
+        return
+    kind, value = request
+    status_msg = await message.answer("🚀")
+    if kind == 'playlist':
+        try:
+            loop = asyncio.get_event_loop()
+            title, items = await asyncio.wait_for(
+                loop.run_in_executor(None, extract_playlist_sync, value),
+                STAGE_TIMEOUTS[STAGE_EXTRACT] or None
+            )
+        except Exception as e:
+            logger.warning(f"خواندن پلی‌لیست {value} ناموفق بود: {e}")
+            await status_msg.edit_text("خطا در خواندن پلی‌لیست. ممکن است خصوصی یا حذف شده باشد.")
+            return
+        if not items:
+            await status_msg.edit_text("این پلی‌لیست ویدیویی ندارد.")
+            return
+    else:
+        # عنوان‌ها پس از استخراج هر آیتم (هنگام دانلود) تکمیل می‌شوند
+        title = "دسته لینک‌ها"
+        items = [{'id': video_id, 'title': video_id, 'duration': None} for video_id in value]
+
+    cancel_prefetch(message.from_user.id)
+    await state.set_state(DownloadStates.waiting_for_batch_quality)
+    await state.update_data(batch_title=title, batch_items=items)
+    lines = "\n".join(f"{n}. {_short(item['title'])}" for n, item in enumerate(items, start=1))
+    await status_msg.edit_text(
+        f"<b>📚 {title}</b>\n\n{lines}\n\n"
+        f"{len(items)} ویدیو (هر ویدیو ۱ اعتبار، پس از تحویل). کیفیت را انتخاب کنید:",
+        reply_markup=get_quality_keyboard(prefix="bq_")
+    )
+
+
+async def handle_batch_quality_callback(query, state):
+    """ انتخاب کیفیت دسته و اجرای pipeline """
+    user_data = await state.get_data()
+    items = user_data.get('batch_items')
+    title = user_data.get('batch_title') or "دسته"
+    if not items:
+        await query.answer("این دکمه منقضی شده است.", show_alert=True)
+        await query.message.delete()
+        return
+    quality = query.data[len("bq_"):]
+    await state.clear()
+    if quality == "cancel":
+        await query.answer("عملیات لغو شد.")
+        await query.message.delete()
+        return
+    await query.answer(f"دانلود {len(items)} ویدیو با کیفیت {quality}...")
+    await run_batch(query.bot, query.message, query.from_user.id, f"📚 {title} ({quality})", items, quality)
+
+
+async def run_batch(bot, message, user_id, title, items, quality):
+    """ تحویل آیتم‌ها به ترتیب؛ دانلود آیتم بعدی هم‌زمان با آپلود آیتم فعلی """
+    handle = register_handle(user_id)
+    board = BatchBoard(message, title, items, reply_markup=get_job_cancel_keyboard(handle.handle_id))
+    board.reporter.set_status(board.render())
+    chat_id = message.chat.id
+    downloads = {}
+    delivered = 0
+    charged = 0
+    summary = None
+
+    def start_download(index):
+        if index in downloads:
+            return
+        item_dl = _ItemDownload()
+        item_dl.task = asyncio.ensure_future(_hold_item(item_dl, items[index], quality, user_id, board, index))
+        downloads[index] = item_dl
+
+    def start_next_download(after):
+        """ دانلود اولین آیتم بعدی که واقعاً دانلود لازم دارد (نه ردشده و نه موجود در کش) """
+        for index in range(after, len(items)):
+            if index in downloads:
+                return
+            item = items[index]
+            if (item.get('duration') or 0) > MAX_DURATION or has_cached_file(item['id'], quality):
+                continue
+            start_download(index)
+            return
+
+    def stop_without_credit(after, credit_msg):
+        """ آیتم‌های بعد از after بدون اعتبار رد می‌شوند؛ متن خلاصه برگردانده می‌شود """
+        for rest in range(after, len(items)):
+            board.set_line(rest, "⏭ بدون اعتبار")
+        return f"❌ {credit_msg}"
+
+    try:
+        for index, item in enumerate(items):
+            if item.get('duration') and item['duration'] > MAX_DURATION:
+                board.set_line(index, f"⏭ طولانی‌تر از حد مجاز ({MAX_DURATION // 60} دقیقه)")
+                continue
+            ok, credit_msg = await has_enough_credit(user_id)
+            if not ok:
+                summary = stop_without_credit(index, credit_msg)
+                break
+
+            if has_cached_file(item['id'], quality):
+                await _resolve_title(item, board, index)
+            if await send_cached_media(bot, chat_id, item['id'], quality, item['title']):
+                delivered += 1
+                board.set_line(index, "✅ ارسال شد")
+                # اعتبار ممکن است هم‌زمان در جای دیگری مصرف شده باشد
+                ok, credit_msg = await check_and_consume_credit(user_id)
+                if not ok:
+                    summary = stop_without_credit(index + 1, credit_msg)
+                    break
+                charged += 1
+                continue
+
+            start_download(index)
+            item_dl = downloads[index]
+            file_path, error_msg = await item_dl.ready
+            try:
+                if error_msg or not file_path:
+                    board.set_line(index, f"❌ {error_msg or 'فایل پیدا نشد'}")
+                    continue
+                # pipeline: آیتم بعدی (اگر اعتبارش هم هست) هم‌زمان با آپلود این آیتم دانلود می‌شود
+                if (await has_enough_credit(user_id, 2))[0]:
+                    start_next_download(index + 1)
+                reporter = _ItemReporter(board, index)
+                reporter.set_status("📤 در حال آپلود...")
+                try:
+                    await upload_and_cache(
+                        bot, chat_id, file_path, item['id'], quality, items[index]['title'], reporter,
+                        cancel_check=handle.token.check
+                    )
+                except Exception as e:
+                    logger.error(f"خطا در آپلود آیتم {item['id']} دسته: {e!r}")
+                    board.set_line(index, "❌ خطا در آپلود")
+                    continue
+                delivered += 1
+                board.set_line(index, "✅ ارسال شد")
+                ok, credit_msg = await check_and_consume_credit(user_id)
+                if not ok:
+                    summary = stop_without_credit(index + 1, credit_msg)
+                    break
+                charged += 1
+            finally:
+                item_dl.release()
+    except asyncio.CancelledError:
+        if not handle.token.cancelled:
+            raise
+        logger.info(f"دسته کاربر {user_id} لغو شد")
+        summary = f"❌ {CANCELLED_MESSAGE}"
+        for index, line in enumerate(board.lines):
+            if not line.startswith(("✅", "❌", "⏭")):
+                board.lines[index] = "⏭ لغو شد"
+    finally:
+        # دانلودهای رهاشده (بدون استفاده‌کننده دیگر) لغو می‌شوند
+        for item_dl in downloads.values():
+            if item_dl.task is not None and not item_dl.task.done():
+                item_dl.task.cancel()
+        unregister_handle(handle)
+    if charged:
+        # فقط دسته‌هایی که اعتبارشان کسر شده در آمار پیش‌دانلود حساب می‌شوند
+        record_quality_pick(quality)
+    await board.finish(summary or f"✅ {delivered} از {len(items)} ویدیو تحویل شد.")
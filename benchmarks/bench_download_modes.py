@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+مقایسه زمان دانلود تک‌اتصالی، چنداتصالی (Range موازی) و دانلود هم‌زمان تکه‌های HLS
+(concurrent_fragment_downloads در yt-dlp، همان مسیر فرمت‌های DASH/HLS) روی یک سرور HTTP محلی
+که مثل یوتیوب سرعت هر اتصال را محدود می‌کند.
+
+اجرا:
+    python benchmarks/bench_download_modes.py --size-mb 32 --per-conn-kbps 4096 --fragments 16
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from range_download import download_ranges_parallel  # noqa: E402
+
+
+def make_handler(payload: bytes, per_conn_bytes_per_sec: int, fragments: int):
+    """ هندلری که Range را پشتیبانی می‌کند و سرعت هر اتصال را محدود می‌کند.
+    /video.m3u8 همان payload را در fragments تکه (/frag{i}.ts) به شکل پلی‌لیست HLS می‌دهد.
+    """
+    step = -(-len(payload) // fragments)
+    playlist = "\n".join(
+        ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:10", "#EXT-X-MEDIA-SEQUENCE:0"]
+        + [f"#EXTINF:10.0,\nfrag{i}.ts" for i in range(fragments)]
+        + ["#EXT-X-ENDLIST", ""]
+    ).encode()
+
+    class ThrottledRangeHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            pass
+
+        def do_GET(self):
+            if self.path.endswith('.m3u8'):
+                self._send_body(playlist, 'application/vnd.apple.mpegurl')
+                return
+            if self.path.startswith('/frag'):
+                index = int(self.path[len('/frag'):-len('.ts')])
+                self._send_body(payload[index * step:(index + 1) * step], 'video/mp2t')
+                return
+            start, end = 0, len(payload) - 1
+            range_header = self.headers.get('Range')
+            if range_header and range_header.startswith('bytes='):
+                first, _, last = range_header[len('bytes='):].partition('-')
+                start = int(first)
+                end = int(last) if last else len(payload) - 1
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {start}-{end}/{len(payload)}')
+            else:
+                self.send_response(200)
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Length', str(end - start + 1))
+            self.end_headers()
+            self._write_throttled(payload, start, end)
+
+        def _send_body(self, body: bytes, content_type: str):
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self._write_throttled(body, 0, len(body) - 1)
+
+        def _write_throttled(self, body: bytes, start: int, end: int):
+            chunk = 64 * 1024
+            position = start
+            began = time.monotonic()
+            sent = 0
+            try:
+                while position <= end:
+                    data = body[position:min(position + chunk, end + 1)]
+                    self.wfile.write(data)
+                    position += len(data)
+                    sent += len(data)
+                    # محدودیت سرعت هر اتصال
+                    expected = sent / per_conn_bytes_per_sec
+                    elapsed = time.monotonic() - began
+                    if expected > elapsed:
+                        time.sleep(expected - elapsed)
+            except (ConnectionResetError, BrokenPipeError):
+                # کلاینت اتصال را زودتر بست (مثلاً تکه‌ای که دوباره درخواست شد)؛ traceback لازم نیست
+                self.close_connection = True
+
+    return ThrottledRangeHandler
+
+
+def run_mode(url, size, connections, out_dir):
+    dest = os.path.join(out_dir, f"out_{connections}.bin")
+    started = time.perf_counter()
+    download_ranges_parallel(url, dest, size, connections=connections)
+    elapsed = time.perf_counter() - started
+    assert os.path.getsize(dest) == size
+    os.remove(dest)
+    return elapsed
+
+
+def run_ytdlp_baseline(url, out_dir):
+    """ دانلود همان فایل با yt-dlp (تک‌اتصال) در صورت نصب بودن """
+    try:
+        from yt_dlp import YoutubeDL
+    except ImportError:
+        return None
+    opts = {'outtmpl': os.path.join(out_dir, 'ytdlp.%(ext)s'), 'quiet': True, 'no_warnings': True, 'noprogress': True}
+    started = time.perf_counter()
+    with YoutubeDL(opts) as ydl:
+        ydl.download([url])
+    return time.perf_counter() - started
+
+
+def run_ytdlp_fragments(url, out_dir, concurrency):
+    """ دانلود پلی‌لیست HLS با yt-dlp و concurrent_fragment_downloads=concurrency؛ None اگر yt-dlp نصب نباشد """
+    try:
+        from yt_dlp import YoutubeDL
+    except ImportError:
+        return None
+    opts = {
+        'outtmpl': os.path.join(out_dir, f'frag_{concurrency}.%(ext)s'),
+        'quiet': True,
+        'no_warnings': True,
+        'noprogress': True,
+        'concurrent_fragment_downloads': concurrency,
+        # تکه‌ها داده تصادفی‌اند؛ اصلاح کانتینر با ffmpeg لازم نیست
+        'fixup': 'never',
+        'hls_prefer_native': True,
+    }
+    started = time.perf_counter()
+    with YoutubeDL(opts) as ydl:
+        ydl.download([url])
+    elapsed = time.perf_counter() - started
+    for name in os.listdir(out_dir):
+        if name.startswith(f'frag_{concurrency}.'):
+            os.remove(os.path.join(out_dir, name))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size-mb', type=int, default=32)
+    parser.add_argument('--per-conn-kbps', type=int, default=4096, help="سقف سرعت هر اتصال (KB/s)")
+    parser.add_argument('--connections', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--fragments', type=int, default=16, help="تعداد تکه‌های پلی‌لیست HLS")
+    args = parser.parse_args()
+
+    size = args.size_mb * 1024 * 1024
+    payload = os.urandom(size)
+    handler = make_handler(payload, args.per_conn_kbps * 1024, args.fragments)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    url = f"{base_url}/video.mp4"
+
+    print(f"file={args.size_mb}MB per-connection cap={args.per_conn_kbps}KB/s fragments={args.fragments}")
+    with tempfile.TemporaryDirectory() as out_dir:
+        baseline = run_ytdlp_baseline(url, out_dir)
+        if baseline is not None:
+            print(f"{'yt-dlp (single)':>18}: {baseline:6.2f}s")
+        results = {}
+        for connections in args.connections:
+            results[connections] = run_mode(url, size, connections, out_dir)
+            speedup = results[args.connections[0]] / results[connections]
+            print(f"{f'range x{connections}':>18}: {results[connections]:6.2f}s  (x{speedup:.2f})")
+        fragment_results = {}
+        for concurrency in args.connections:
+            elapsed = run_ytdlp_fragments(f"{base_url}/video.m3u8", out_dir, concurrency)
+            if elapsed is None:
+                break
+            fragment_results[concurrency] = elapsed
+            speedup = fragment_results[args.connections[0]] / elapsed
+            print(f"{f'fragments x{concurrency}':>18}: {elapsed:6.2f}s  (x{speedup:.2f})")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+بررسی حالت سرور Bot API محلی روی یک سرور aiohttp ساختگی:
+نشست bot_api_session باید درخواست‌ها را به همان سرور بفرستد و bot_api_input_file به جای آپلود multipart
+فقط مسیر file:// فایل را ارسال کند.
+
+اجرا:
+    python benchmarks/check_local_bot_api.py
+"""
+
+import os
+import sys
+import asyncio
+import tempfile
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TOKEN = "123456:TEST"
+PORT = 8765
+# config مقدارها را هنگام import از محیط می‌خواند
+os.environ['BOT_TOKEN'] = TOKEN
+os.environ['LOCAL_BOT_API_URL'] = f"http://127.0.0.1:{PORT}"
+
+from aiogram import Bot  # noqa: E402
+from delivery import bot_api_session, bot_api_input_file, bot_api_limit, local_file_uri  # noqa: E402
+from config import LOCAL_BOT_API_UPLOAD_LIMIT  # noqa: E402
+
+
+async def main():
+    requests = []
+
+    async def handle(request: web.Request):
+        form = await request.post()
+        requests.append((request.path, {key: value for key, value in form.items()}))
+        return web.json_response({"ok": True, "result": {
+            "message_id": 1, "date": 0, "chat": {"id": 42, "type": "private"},
+            "video": {"file_id": "f", "file_unique_id": "u", "width": 1, "height": 1, "duration": 1},
+        }})
+
+    app = web.Application()
+    app.router.add_post(f"/bot{TOKEN}/{{method}}", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+
+    with tempfile.NamedTemporaryFile(suffix=".mp4") as media:
+        media.write(b"\0" * 1024)
+        media.flush()
+        session = bot_api_session()
+        assert session is not None and session.api.is_local, "نشست محلی ساخته نشد"
+        bot = Bot(token=TOKEN, session=session)
+        try:
+            await bot.send_video(chat_id=42, video=bot_api_input_file(media.name, "video.mp4"), caption="t")
+        finally:
+            await bot.session.close()
+            await runner.cleanup()
+
+    assert len(requests) == 1, requests
+    path, form = requests[0]
+    assert path == f"/bot{TOKEN}/sendVideo", path
+    # فقط رشته file:// فرستاده شده است، نه فایل multipart
+    assert form['video'] == local_file_uri(media.name), form['video']
+    assert all(isinstance(value, str) for value in form.values()), form
+    assert bot_api_limit() == LOCAL_BOT_API_UPLOAD_LIMIT
+    print(f"OK: {path} video={form['video']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+لغو همکارانه کارها و مهلت هر مرحله (استخراج، دانلود، آپلود، تبدیل گفتار به متن):
+توکن لغو از event loop فعال و در threadهای کار (hook yt-dlp، ffmpeg، ASR) بررسی می‌شود.
+"""
+
+import time
+import uuid
+import asyncio
+import logging
+import threading
+import subprocess
+from config import (
+    STAGE_TIMEOUT_EXTRACT, STAGE_TIMEOUT_DOWNLOAD, STAGE_TIMEOUT_UPLOAD, STAGE_TIMEOUT_TRANSCRIBE
+)
+
+logger = logging.getLogger(__name__)
+
+STAGE_EXTRACT = "extract"
+STAGE_DOWNLOAD = "download"
+STAGE_UPLOAD = "upload"
+STAGE_TRANSCRIBE = "transcribe"
+
+STAGE_TIMEOUTS = {
+    STAGE_EXTRACT: STAGE_TIMEOUT_EXTRACT,
+    STAGE_DOWNLOAD: STAGE_TIMEOUT_DOWNLOAD,
+    STAGE_UPLOAD: STAGE_TIMEOUT_UPLOAD,
+    STAGE_TRANSCRIBE: STAGE_TIMEOUT_TRANSCRIBE,
+}
+
+REASON_USER = "user"
+REASON_TIMEOUT = "timeout"
+REASON_ABANDONED = "abandoned"
+
+
+class JobCancelled(Exception):
+    """ کار لغو شده یا مهلت مرحله‌اش تمام شده است """
+
+    def __init__(self, reason: str = REASON_USER, stage: str = None):
+        super().__init__(f"{reason} ({stage})" if stage else reason)
+        self.reason = reason
+        self.stage = stage
+
+
+class CancelToken:
+    """ توکن لغو thread-safe با مهلت مرحله فعلی """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason = None
+        self.stage = None
+        self.deadline = None
+
+    def cancel(self, reason: str = REASON_USER):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() > self.deadline:
+            logger.warning(f"مهلت مرحله {self.stage} تمام شد")
+            self.cancel(REASON_TIMEOUT)
+        return self._event.is_set()
+
+    def check(self):
+        """ در thread کار: توقف کار لغوشده (JobCancelled) """
+        if self.cancelled:
+            raise JobCancelled(self.reason, self.stage)
+
+    def enter_stage(self, stage: str, timeout=None):
+        """ شروع مرحله جدید با مهلت خودش (پیش‌فرض از STAGE_TIMEOUTS؛ 0 = بدون مهلت) """
+        self.stage = stage
+        timeout = STAGE_TIMEOUTS.get(stage) if timeout is None else timeout
+        self.deadline = time.monotonic() + timeout if timeout else None
+
+
+def run_process(cmd, cancel_check=None, timeout=None):
+    """ اجرای فرمان (مثل ffmpeg) که با cancel_check یا پایان timeout کشته می‌شود؛
+    خروجی غیرصفر CalledProcessError می‌دهد.
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        while True:
+            try:
+                _, stderr = proc.communicate(timeout=0.5)
+                break
+            except subprocess.TimeoutExpired:
+                if cancel_check is not None:
+                    cancel_check()
+                if deadline is not None and time.monotonic() > deadline:
+                    raise JobCancelled(REASON_TIMEOUT)
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, stderr=stderr)
+
+
+class JobHandle:
+    """ کار در حال اجرای یک کاربر؛ دکمه لغو با handle_id به آن می‌رسد """
+
+    def __init__(self, user_id, task):
+        self.handle_id = uuid.uuid4().hex[:10]
+        self.user_id = user_id
+        self.task = task
+        self.token = CancelToken()
+
+    def cancel(self, reason: str = REASON_USER):
+        """ لغو توکن (مراحل thread) و task هندلر (مراحل async) """
+        self.token.cancel(reason)
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+
+# handle_id -> JobHandle
+_handles = {}
+
+
+def register_handle(user_id) -> JobHandle:
+    """ ثبت task فعلی به عنوان کار قابل لغو کاربر """
+    handle = JobHandle(user_id, asyncio.current_task())
+    _handles[handle.handle_id] = handle
+    return handle
+
+
+def get_handle(handle_id: str):
+    return _handles.get(handle_id)
+
+
+def unregister_handle(handle: JobHandle):
+    _handles.pop(handle.handle_id, None)
+
+
+def active_handles_count() -> int:
+    return len(_handles)
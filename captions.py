@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+منبع زیرنویس: اگر ویدیو زیرنویس یوتیوب (دستی یا تولید خودکار همان زبان) داشته باشد،
+همان دریافت و با قواعد تقطیع Whisper در subtitle_format به SRT تبدیل می‌شود؛
+Whisper فقط وقتی اجرا می‌شود که زیرنویس قابل استفاده‌ای نباشد. منبع استفاده‌شده در شمارنده‌ها ثبت می‌شود.
+"""
+
+import re
+import json
+import asyncio
+import logging
+from config import CAPTION_FAST_PATH, CAPTION_ALLOW_TRANSLATED, CAPTION_MAX_BYTES
+from database import increment_counter, get_counters
+from http_client import fetch_bytes
+from asr_pool import asr_pool, AsrError
+from transcript_store import video_source_id, write_cached_srt, subtitle_output_path
+from subtitle_format import build_subtitles, merge_short_subs, write_srt, normalize_fa_text
+
+logger = logging.getLogger(__name__)
+
+SOURCE_MANUAL = "manual"
+SOURCE_AUTO = "auto"
+SOURCE_WHISPER = "whisper"
+
+SOURCE_COUNTER_PREFIX = "subtitle_source_"
+
+# ترتیب ترجیح فرمت‌ها: json3 زمان هر کلمه را در زیرنویس خودکار دارد
+CAPTION_FORMATS = ('json3', 'vtt')
+
+_VTT_TIME = r'(?:(\d+):)?(\d{1,2}):(\d{2})[.,](\d{3})'
+_VTT_CUE_PATTERN = re.compile(rf'^{_VTT_TIME}\s*-->\s*{_VTT_TIME}')
+_VTT_TAG_PATTERN = re.compile(r'<[^>]*>')
+
+
+def _lang_keys(tracks: dict, lang: str):
+    """ کلیدهای هم‌زبان (fa، fa-IR، en-US، ...) با اولویت کلید دقیق """
+    keys = [key for key in tracks if key == lang or key.startswith(f"{lang}-")]
+    return sorted(keys, key=lambda key: key != lang)
+
+
+def pick_caption_track(info: dict, lang: str):
+    """ (url, ext, source) بهترین زیرنویس یوتیوب برای زبان، یا None.
+    زیرنویس دستی اولویت دارد؛ از زیرنویس‌های خودکار فقط نسخه اصلی (نه ترجمه ماشینی) انتخاب می‌شود
+    مگر CAPTION_ALLOW_TRANSLATED فعال باشد.
+    """
+    manual = info.get('subtitles') or {}
+    auto = info.get('automatic_captions') or {}
+    candidates = [(manual[key], SOURCE_MANUAL) for key in _lang_keys(manual, lang) if key != f"{lang}-orig"]
+    original_lang = (info.get('language') or '').split('-')[0]
+    if f"{lang}-orig" in auto:
+        candidates.append((auto[f"{lang}-orig"], SOURCE_AUTO))
+    elif lang in auto and (original_lang == lang or CAPTION_ALLOW_TRANSLATED):
+        candidates.append((auto[lang], SOURCE_AUTO))
+    for tracks, source in candidates:
+        by_ext = {t.get('ext'): t for t in tracks or [] if t.get('url')}
+        for ext in CAPTION_FORMATS:
+            if ext in by_ext:
+                return by_ext[ext]['url'], ext, source
+    return None
+
+
+def parse_json3(data: bytes):
+    """ سگمنت‌های audio_to_subtitle از فرمت json3 یوتیوب؛ اگر زمان کلمه‌ها موجود باشد words هم پر می‌شود """
+    events = [
+        e for e in json.loads(data.decode('utf-8')).get('events') or []
+        if e.get('segs') and not e.get('aAppend')
+    ]
+    # زیرنویس خودکار: هر seg یک کلمه با tOffsetMs؛ زیرنویس دستی: یک seg برای کل خط
+    word_level = any(len(e['segs']) > 1 for e in events)
+    segments = []
+    for event in events:
+        start = event.get('tStartMs', 0) / 1000
+        end = start + event.get('dDurationMs', 0) / 1000
+        text = "".join(seg.get('utf8', '') for seg in event['segs']).replace('\n', ' ').strip()
+        if not text:
+            continue
+        words = []
+        if word_level:
+            offsets = [start + seg.get('tOffsetMs', 0) / 1000 for seg in event['segs']]
+            for i, seg in enumerate(event['segs']):
+                tokens = seg.get('utf8', '').split()
+                if not tokens:
+                    continue
+                seg_end = offsets[i + 1] if i + 1 < len(offsets) else end
+                step = max(0.0, seg_end - offsets[i]) / len(tokens)
+                for j, token in enumerate(tokens):
+                    words.append({"word": token, "start": offsets[i] + j * step, "end": offsets[i] + (j + 1) * step})
+        segments.append({"start": start, "end": end, "text": text, "words": words})
+    return segments
+
+
+def _vtt_seconds(groups) -> float:
+    hours, minutes, seconds, millis = (int(g) if g else 0 for g in groups)
+    return hours * 3600 + minutes * 60 + seconds + millis / 1000
+
+
+def parse_vtt(data: bytes):
+    """ سگمنت‌ها (بدون زمان کلمه) از WebVTT؛ خطوط تکراری زیرنویس‌های غلتان یوتیوب حذف می‌شوند """
+    segments = []
+    previous_line = None
+    cue = None
+    for raw in data.decode('utf-8', errors='replace').splitlines() + [""]:
+        line = raw.strip()
+        match = _VTT_CUE_PATTERN.match(line)
+        if match:
+            cue = {"start": _vtt_seconds(match.groups()[:4]), "end": _vtt_seconds(match.groups()[4:]), "lines": []}
+            continue
+        if cue is None:
+            continue
+        if line:
+            text = _VTT_TAG_PATTERN.sub('', line).strip()
+            if text and text != previous_line:
+                cue['lines'].append(text)
+                previous_line = text
+            continue
+        if cue['lines'] and cue['end'] > cue['start']:
+            segments.append({"start": cue['start'], "end": cue['end'], "text": " ".join(cue['lines'])})
+        cue = None
+    return segments
+
+
+def _clip_segments(segments, clip):
+    """ فقط بخش داخل بازه برش، با زمان نسبت به ابتدای بازه """
+    start, end = clip
+
+    def shift(item):
+        return dict(item, start=max(0.0, item['start'] - start), end=min(end, item['end']) - start)
+
+    clipped = []
+    for seg in segments:
+        if seg['end'] <= start or seg['start'] >= end:
+            continue
+        words = [shift(w) for w in seg.get('words') or [] if start <= w['start'] < end]
+        clipped.append(dict(shift(seg), words=words))
+    return clipped
+
+
+def caption_to_srt(data: bytes, ext: str, lang: str, out_path: str, clip=None) -> int:
+    """ تبدیل زیرنویس یوتیوب به SRT با همان قواعد تقطیع Whisper؛ تعداد زیرنویس‌های نوشته‌شده """
+    segments = parse_json3(data) if ext == 'json3' else parse_vtt(data)
+    if clip:
+        segments = _clip_segments(segments, clip)
+    if lang == "fa":
+        for seg in segments:
+            seg['text'] = normalize_fa_text(seg['text'])
+            for word in seg.get('words') or []:
+                word['word'] = normalize_fa_text(word['word'])
+    subs = merge_short_subs(build_subtitles(segments))
+    if subs:
+        write_srt(subs, out_path)
+    return len(subs)
+
+
+async def fetch_caption_srt(info: dict, lang: str, out_path: str, clip=None):
+    """ نوشتن SRT از زیرنویس یوتیوب؛ منبع (manual/auto) یا None اگر زیرنویس قابل استفاده‌ای نبود """
+    track = pick_caption_track(info, lang)
+    if track is None:
+        return None
+    url, ext, source = track
+    try:
+        data = await fetch_bytes(url, CAPTION_MAX_BYTES)
+        loop = asyncio.get_event_loop()
+        count = await loop.run_in_executor(None, caption_to_srt, data, ext, lang, out_path, clip)
+    except Exception as e:
+        logger.warning(f"دریافت زیرنویس {source} ({ext}) ناموفق بود: {e}")
+        return None
+    return source if count else None
+
+
+async def generate_subtitles(info: dict, video_id: str, lang: str, open_media, clip=None, token=None, on_status=None):
+    """ (srt_path, source): اول زیرنویس یوتیوب، بعد رونوشت ذخیره‌شده Whisper و در نبود هر دو Whisper در پروسه‌های ASR.
+    open_media() فقط برای Whisper فراخوانی می‌شود و باید context manager با خروجی (file_path, error_msg) بدهد
+    (مثل shared_download)؛ فایل تا پایان کار worker روی دیسک می‌ماند.
+    """
+    out_path = subtitle_output_path(f"{video_id}_{lang}")
+    if CAPTION_FAST_PATH and info:
+        source = await fetch_caption_srt(info, lang, out_path, clip)
+        if source:
+            _record_source(video_id, lang, source)
+            return out_path, source
+    source_id = video_source_id(video_id, clip)
+    loop = asyncio.get_event_loop()
+    try:
+        cached = await loop.run_in_executor(None, write_cached_srt, source_id, lang, out_path)
+    except Exception as e:
+        logger.warning(f"خواندن رونوشت ذخیره‌شده {source_id} ناموفق بود: {e}")
+        cached = False
+    if cached:
+        # رونوشت قبلی همین صوت: بدون دانلود و ASR
+        _record_source(video_id, lang, SOURCE_WHISPER)
+        return out_path, SOURCE_WHISPER
+    async with open_media() as (media_path, error_msg):
+        if error_msg or not media_path:
+            raise AsrError(error_msg or "فایل پیدا نشد")
+        srt_path = await asr_pool.transcribe(media_path, lang, video_id, token, on_status, source_id)
+    _record_source(video_id, lang, SOURCE_WHISPER)
+    return srt_path, SOURCE_WHISPER
+
+
+def _record_source(video_id: str, lang: str, source: str):
+    increment_counter(f"{SOURCE_COUNTER_PREFIX}{source}")
+    logger.info(f"زیرنویس {video_id} ({lang}) از منبع {source} ساخته شد")
+
+
+def get_subtitle_source_stats():
+    counters = get_counters(SOURCE_COUNTER_PREFIX)
+    return {
+        source: counters.get(f"{SOURCE_COUNTER_PREFIX}{source}", 0)
+        for source in (SOURCE_MANUAL, SOURCE_AUTO, SOURCE_WHISPER)
+    }
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+انتخاب تطبیقی player_client و خانواده User-Agent برای yt-dlp (bandit):
+نرخ موفقیت و سرعت دانلود هر ترکیب در دیتابیس ثبت می‌شود و کارهای جدید به سمت ترکیب‌های بهتر می‌روند،
+ولی ترکیب‌های دیگر هم گاهی امتحان می‌شوند تا تغییر رفتار یوتیوب (موج‌های throttling) دیده شود.
+"""
+
+import time
+import random
+import logging
+from collections import namedtuple
+from config import CLIENT_SELECTOR_PLAYER_CLIENTS, CLIENT_SELECTOR_EXPLORATION, CLIENT_SELECTOR_HALF_LIFE
+from database import record_client_result, get_client_stats
+from user_agents import USER_AGENTS
+
+logger = logging.getLogger(__name__)
+
+# player_client: رشته‌ای با کاما (مثل "android,ios") که به همان ترتیب به yt-dlp داده می‌شود
+ClientArm = namedtuple('ClientArm', ['player_client', 'ua_family', 'user_agent'])
+
+
+def ua_family(user_agent: str) -> str:
+    """ خانواده User-Agent (سیستم‌عامل/موتور) """
+    ua = user_agent.lower()
+    if 'iphone' in ua or 'ipad' in ua:
+        return "ios"
+    if 'android' in ua:
+        return "android"
+    if 'firefox' in ua:
+        return "desktop_firefox"
+    if 'chrome' in ua:
+        return "desktop_chrome"
+    if 'safari' in ua:
+        return "desktop_safari"
+    return "other"
+
+
+_FAMILIES = {}
+for _ua in USER_AGENTS:
+    _FAMILIES.setdefault(ua_family(_ua), []).append(_ua)
+
+
+def _decayed(row: dict, now: float) -> dict:
+    """ آمار با وزن کمتر برای نتایج قدیمی (نیمه‌عمر CLIENT_SELECTOR_HALF_LIFE) """
+    if not CLIENT_SELECTOR_HALF_LIFE:
+        return row
+    factor = 0.5 ** (max(0.0, now - row['updated_at']) / CLIENT_SELECTOR_HALF_LIFE)
+    return dict(row, **{k: row[k] * factor for k in ('successes', 'failures', 'bytes', 'seconds')})
+
+
+def _arm_stats():
+    """ (player_client, ua_family) -> آمار کم‌رنگ‌شده برای همه ترکیب‌های فعال """
+    now = time.time()
+    stored = {(r['player_client'], r['ua_family']): _decayed(r, now) for r in get_client_stats()}
+    empty = {'successes': 0.0, 'failures': 0.0, 'bytes': 0.0, 'seconds': 0.0, 'attempts': 0, 'updated_at': now}
+    return {
+        (client, family): stored.get((client, family), empty)
+        for client in CLIENT_SELECTOR_PLAYER_CLIENTS
+        for family in _FAMILIES
+    }
+
+
+def _throughput(stats: dict):
+    return stats['bytes'] / stats['seconds'] if stats['seconds'] > 0 else None
+
+
+def choose_arm() -> ClientArm:
+    """ Thompson sampling روی نرخ موفقیت، وزن‌دار با سرعت نسبی؛ با احتمال CLIENT_SELECTOR_EXPLORATION تصادفی """
+    try:
+        arms = _arm_stats()
+    except Exception as e:
+        logger.warning(f"خواندن آمار کلاینت‌ها ناموفق بود: {e}")
+        arms = {}
+    if not arms or random.random() < CLIENT_SELECTOR_EXPLORATION:
+        client = random.choice(CLIENT_SELECTOR_PLAYER_CLIENTS)
+        family = random.choice(list(_FAMILIES))
+    else:
+        speeds = [s for s in map(_throughput, arms.values()) if s]
+        best_speed = max(speeds) if speeds else None
+
+        def sample(stats):
+            success = random.betavariate(stats['successes'] + 1, stats['failures'] + 1)
+            speed = _throughput(stats)
+            # ترکیب بدون اندازه‌گیری سرعت، خوش‌بینانه هم‌سرعت بهترین فرض می‌شود
+            return success * (speed / best_speed if speed and best_speed else 1.0)
+
+        client, family = max(arms, key=lambda arm: sample(arms[arm]))
+    return ClientArm(client, family, random.choice(_FAMILIES[family]))
+
+
+def player_clients(arm: ClientArm):
+    return [c.strip() for c in arm.player_client.split(',') if c.strip()]
+
+
+def record_result(arm, success: bool, nbytes: int = 0, seconds: float = 0.0):
+    """ ثبت نتیجه یک استخراج/دانلود برای ترکیب؛ arm می‌تواند None باشد (بی‌اثر) """
+    if arm is None:
+        return
+    record_client_result(
+        arm.player_client, arm.ua_family, success, nbytes, seconds, CLIENT_SELECTOR_HALF_LIFE
+    )
+
+
+def get_selector_stats(limit: int = 5):
+    """ بهترین ترکیب‌ها برای پنل ادمین (بر اساس نرخ موفقیت × سرعت) """
+    rows = []
+    for (client, family), stats in _arm_stats().items():
+        if not stats['attempts']:
+            continue
+        total = stats['successes'] + stats['failures']
+        rows.append({
+            "player_client": client,
+            "ua_family": family,
+            "attempts": stats['attempts'],
+            "success_rate": (stats['successes'] / total) if total else 0.0,
+            "throughput": _throughput(stats) or 0.0,
+        })
+    rows.sort(key=lambda r: r['success_rate'] * (r['throughput'] or 1.0), reverse=True)
+    return rows[:limit]
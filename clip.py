@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+حالت برش: خواندن بازه زمانی از لینک (t= / start= / end=) یا متن پیام (مثل 1:30-4:00)
+"""
+
+import re
+from urllib.parse import urlparse, parse_qs
+
+# 90 / 1:30 / 1:02:03
+_CLOCK = r'\d{1,2}(?::\d{1,2}){1,2}|\d+'
+_RANGE_PATTERN = re.compile(rf'(?<![\w/=])({_CLOCK})\s*(?:-|–|—|تا)\s*({_CLOCK})(?![\w/])')
+# مقدار t= در لینک‌های یوتیوب: 90، 90s یا 1h2m3s
+_YT_TIME_PATTERN = re.compile(r'^(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s?)?$')
+_URL_PATTERN = re.compile(r'(?:https?://)?(?:www\.)?(?:youtube\.com|youtu\.be)/\S+')
+
+
+def parse_timestamp(text: str):
+    """ ثانیه از '1:02:03' یا '90'؛ در صورت نامعتبر بودن None """
+    text = text.strip()
+    if not re.fullmatch(_CLOCK, text):
+        return None
+    seconds = 0
+    for part in text.split(':'):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+
+def _parse_yt_time(value: str):
+    match = _YT_TIME_PATTERN.match(value.strip().lower())
+    if not match or not any(match.groups()):
+        return None
+    hours, minutes, seconds = (int(g) if g else 0 for g in match.groups())
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def _link_params(text: str):
+    """ پارامترهای query اولین لینک یوتیوب در متن """
+    url_match = _URL_PATTERN.search(text)
+    if not url_match:
+        return {}
+    url = url_match.group(0)
+    if not url.startswith('http'):
+        url = 'https://' + url
+    return parse_qs(urlparse(url).query)
+
+
+def parse_clip(text: str):
+    """ (start, end) بر حسب ثانیه یا None.
+    بازه متنی بیرون از لینک اولویت دارد؛ در لینک، start/t فقط همراه end به معنی برش است
+    (لینک‌های اشتراک‌گذاری‌شده معمولاً t= دارند ولی کاربر کل ویدیو را می‌خواهد).
+    """
+    range_match = _RANGE_PATTERN.search(_URL_PATTERN.sub(' ', text))
+    if range_match:
+        start, end = parse_timestamp(range_match.group(1)), parse_timestamp(range_match.group(2))
+        if start is not None and end is not None and end > start:
+            return start, end
+        return None
+    end = _link_params(text).get('end')
+    if end:
+        start = parse_link_start(text) or 0
+        end = _parse_yt_time(end[0])
+        if end is not None and end > start:
+            return start, end
+    return None
+
+
+def parse_link_start(text: str):
+    """ مقدار t= / start= لینک (ثانیه) یا None """
+    start = _link_params(text).get('start') or _link_params(text).get('t')
+    return _parse_yt_time(start[0]) if start else None
+
+
+def format_clock(seconds: int) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+def format_clip(clip) -> str:
+    return f"{format_clock(clip[0])}-{format_clock(clip[1])}"
+
+
+def clip_key(quality: str, clip) -> str:
+    """ کلید کیفیت برای کش‌ها و single-flight؛ هر بازه یک فایل جداست """
+    if not clip:
+        return quality
+    return f"{quality}@{int(clip[0])}-{int(clip[1])}"
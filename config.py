@@ -28,8 +28,117 @@ REFERRAL_BONUS_CREDITS = 1  # اعتبار اهدایی
 SUBSCRIPTION_DURATION_DAYS = 30  # مدت اشتراک
 
 # تنظیمات دانلود یوتیوب
-MAX_FILE_SIZE = 49 * 1024 * 1024  # 49 مگابایت
-MAX_DURATION = 1800  # 30 دقیقه
+MAX_FILE_SIZE = 4 * 1024 * 1024 * 1024  # بزرگ‌ترین فایل قابل تحویل (با تقسیم به چند بخش)
+
+# سطوح تحویل فایل
+BOT_API_UPLOAD_LIMIT = 49 * 1024 * 1024  # ارسال با Bot API (سقف 50MB)
+MTPROTO_UPLOAD_LIMIT = 2000 * 1024 * 1024  # ارسال با Pyrogram (سقف 2GB)
+SPLIT_MAX_PARTS = 4  # حداکثر تعداد بخش‌ها برای فایل‌های بزرگ‌تر از سقف آپلود
+
+# سرور Bot API محلی (telegram-bot-api --local)؛ خالی = api.telegram.org
+LOCAL_BOT_API_URL = os.getenv('LOCAL_BOT_API_URL') or ""
+# مسیر DOWNLOAD_DIR از دید سرور محلی (مثلاً داخل کانتینر)؛ خالی = همان مسیر ربات
+LOCAL_BOT_API_DOWNLOAD_DIR = os.getenv('LOCAL_BOT_API_DOWNLOAD_DIR') or ""
+LOCAL_BOT_API_UPLOAD_LIMIT = 2000 * 1024 * 1024  # سقف آپلود در حالت محلی
+MAX_DURATION = 1800  # 30 دقیقه (در حالت برش: طول بازه)
+
+# حالت برش: False = برش روی keyframe بدون encode مجدد (سریع، ابتدای بازه کمی زودتر)؛ True = برش دقیق با encode
+CLIP_FORCE_KEYFRAMES = False
+
+# انتخاب تطبیقی player_client و User-Agent برای yt-dlp
+CLIENT_SELECTOR_PLAYER_CLIENTS = ["android,ios", "ios", "android", "web_safari", "tv"]  # هر مورد یک گزینه (با کاما: به ترتیب)
+CLIENT_SELECTOR_EXPLORATION = 0.1  # احتمال انتخاب تصادفی برای امتحان ترکیب‌های دیگر
+CLIENT_SELECTOR_HALF_LIFE = 6 * 3600  # نیمه‌عمر اعتبار آمار (ثانیه)؛ 0 = بدون کم‌رنگ‌شدن
+
+# دسته‌ها (پلی‌لیست / چند لینک در یک پیام)
+BATCH_MAX_ITEMS = 20  # حداکثر آیتم هر دسته
+
+# صف دانلود
+DOWNLOAD_WORKERS = 3  # تعداد دانلودهای هم‌زمان
+DOWNLOAD_PER_USER_LIMIT = 1  # حداکثر دانلود هم‌زمان هر کاربر
+
+# مهلت هر مرحله کار (ثانیه)؛ 0 = بدون مهلت
+STAGE_TIMEOUT_EXTRACT = 60
+STAGE_TIMEOUT_DOWNLOAD = 1800
+STAGE_TIMEOUT_UPLOAD = 1800
+STAGE_TIMEOUT_TRANSCRIBE = 3600
+STUCK_WORKER_GRACE = 30  # workerی که پس از پایان مهلت هم متوقف نشود رها و جایش آزاد می‌شود
+YTDLP_SOCKET_TIMEOUT = 30  # اتصال بی‌پاسخ yt-dlp پس از این مدت خطا می‌دهد
+
+# تلاش مجدد خطاهای موقت (backoff نمایی با jitter، بدون اشغال worker)
+DOWNLOAD_MAX_ATTEMPTS = 4  # کل تلاش‌های هر کار
+RETRY_BASE_DELAY = 2  # ثانیه
+RETRY_RATE_LIMIT_DELAY = 20  # فاصله پایه برای 429 / محدودیت نرخ
+RETRY_MAX_DELAY = 120
+
+# پیش‌دانلود هنگام انتخاب کیفیت (با اولویت پایین)
+PREFETCH_ENABLED = False
+PREFETCH_QUALITY = "auto"  # "auto" (پرانتخاب‌ترین کیفیت در آمار) یا کیفیت ثابت مثل "720" / "audio"
+PREFETCH_MAX_ACTIVE = 2  # حداکثر پیش‌دانلودهای هم‌زمان
+PREFETCH_TTL = 120  # ثانیه؛ پیش‌دانلودی که در این مدت انتخاب نشود لغو می‌شود
+
+# دانلود چنداتصالی: "parallel" (Range موازی / قطعه‌های هم‌زمان) یا "off" (تک‌اتصال)
+DOWNLOAD_ACCEL_MODE = "parallel"
+DOWNLOAD_CONNECTIONS_PER_JOB = 4  # اتصال درخواستی هر کار
+DOWNLOAD_MAX_CONNECTIONS = 12  # بودجه کل اتصال‌ها بین همه کارها
+
+# فضای DOWNLOAD_DIR
+STORAGE_QUOTA_BYTES = 10 * 1024 * 1024 * 1024  # سقف حجم رزروشده + فایل‌های نگه‌داشته (10 گیگابایت)
+STORAGE_RETAIN_BYTES = 2 * 1024 * 1024 * 1024  # حجم فایل‌های ارسال‌شده که برای درخواست مجدد نگه داشته می‌شوند (0 = غیرفعال)
+STORAGE_MIN_FREE_BYTES = 1 * 1024 * 1024 * 1024  # حداقل فضای آزاد دیسک پس از کسر رزروها؛ کمتر از آن کار در صف می‌ماند
+
+# استخر نشست‌های Pyrogram برای آپلود فایل‌های بزرگ
+PYROGRAM_SESSIONS = 2  # تعداد نشست‌های MTProto
+UPLOAD_PARALLEL_PARTS = 4  # partهای در جریان هم‌زمان در هر آپلود
+PYROGRAM_HEALTH_INTERVAL = 60  # فاصله بررسی سلامت نشست‌ها (ثانیه)؛ 0 = غیرفعال
+
+# حالت جریانی: آپلود هم‌زمان با دانلود از طریق Pyrogram، بدون فایل کامل روی دیسک
+STREAMING_UPLOAD = False
+STREAM_BUFFER_PARTS = 8  # حداکثر partهای 512KB در حافظه بین دانلود و آپلود
+
+# گزارش پیشرفت
+PROGRESS_EDIT_INTERVAL = 3  # حداقل فاصله ویرایش پیام در هر چت (ثانیه)
+
+# کش اطلاعات ویدیو (خروجی extract_info)
+INFO_CACHE_TTL = 1800  # ثانیه؛ لینک‌های مستقیم یوتیوب چند ساعت بعد منقضی می‌شوند
+INFO_CACHE_MAX_ENTRIES = 500
+
+# نشست HTTP مشترک (thumbnailها)
+HTTP_POOL_LIMIT = 20  # حداکثر اتصال باز هم‌زمان
+HTTP_TIMEOUT = 15  # ثانیه
+
+# زیرنویس: استفاده از زیرنویس یوتیوب پیش از اجرای Whisper
+CAPTION_FAST_PATH = True
+CAPTION_ALLOW_TRANSLATED = False  # پذیرش زیرنویس خودکار ترجمه‌شده ماشینی (نه زبان اصلی ویدیو)
+CAPTION_MAX_BYTES = 5 * 1024 * 1024
+
+# تبدیل گفتار به متن (Whisper) در پروسه‌های worker جدا با مدل‌های از پیش بارگذاری‌شده
+ASR_WORKERS = 1  # تعداد پروسه‌ها؛ 0 = ساخت زیرنویس غیرفعال (بدون faster-whisper هم خودکار غیرفعال می‌شود)
+ASR_CPU_THREADS = 0  # رشته‌های CPU هر worker؛ 0 = تقسیم هسته‌ها بین workerها (یک هسته برای ربات می‌ماند)
+ASR_WORKER_NICE = 10  # اولویت پایین‌تر workerها نسبت به پروسه ربات
+ASR_PRELOAD_LANGS = ["fa", "en"]  # مدل این زبان‌ها هنگام شروع هر worker بارگذاری می‌شود
+ASR_PRELOAD_ALIGN = True  # بارگذاری مدل هم‌ترازی whisperx همان زبان‌ها هم هنگام شروع
+ASR_ALIGN_CACHE_SIZE = 2  # حداکثر مدل‌های هم‌ترازی (زبان، دستگاه) در حافظه هر worker
+ASR_POLL_INTERVAL = 1  # فاصله بررسی صف و وضعیت کارها (ثانیه)
+ASR_HEARTBEAT_INTERVAL = 10  # فاصله heartbeat workerها و بررسی زنده بودنشان (ثانیه)
+# آستانه مسیر موازی صوت بلند (ثانیه): با ASR_WORKERS >= 2 صوت در سکوت‌ها بخش‌بندی و بخش‌ها هم‌زمان در workerها اجرا می‌شوند؛
+# با یک worker (پیش‌فرض) همان worker بازه‌های گفتار را با استنتاج دسته‌ای ASR_BATCH_SIZE تایی رمزگشایی می‌کند
+ASR_CHUNK_MIN_DURATION = 900
+ASR_CHUNK_SECONDS = 300  # طول تقریبی هر بخش (ثانیه)
+ASR_BATCH_SIZE = 8  # اندازه دسته استنتاج در حالت یک worker؛ 1 = بدون دسته (نیازمند faster-whisper 1.1 به بعد)
+
+# ذخیره رونوشت‌ها (سگمنت‌ها، هم‌ترازی و زیرنویس) برای درخواست‌های تکراری زیرنویس
+TRANSCRIPT_DIR = "transcripts"  # بیرون از DOWNLOAD_DIR تا پاک‌سازی شروع ربات آن را حذف نکند
+TRANSCRIPT_MAX_ENTRIES = 5000
+TRANSCRIPT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# کش thumbnail در حافظه (file_id عکس یا بایت‌ها)
+THUMB_CACHE_MAX_BYTES = 16 * 1024 * 1024
+THUMB_CACHE_MAX_ENTRIES = 5000
+
+# کش file_id تلگرام (ارسال مجدد بدون دانلود و آپلود)
+FILE_CACHE_TTL_DAYS = 30  # عمر هر ورودی کش
+FILE_CACHE_MAX_ENTRIES = 20000  # حداکثر تعداد ورودی‌ها (حذف کم‌استفاده‌ترین‌ها)
 
 # تنظیمات لاگ
 LOGGING_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -110,6 +110,20 @@ async def check_and_consume_credit(user_id, required_credits: int = 1):
     else:
         return False, f"اعتبار کافی ندارید! برای کسب اعتبار، دوستانتان را دعوت کنید یا اشتراک بخرید."
 
+async def has_enough_credit(user_id, required_credits: int = 1):
+    """ بررسی اعتبار بدون کسر (در دسته‌ها اعتبار پس از تحویل هر آیتم کسر می‌شود) """
+    user_data = get_user_data(user_id)
+    
+    if not user_data:
+        return False, "لطفاً ابتدا ربات را /start کنید."
+    
+    if is_subscribed(user_data['subscription_end']):
+        return True, "اشتراک فعال"
+    
+    if user_data['credits'] >= required_credits:
+        return True, user_data['credits']
+    return False, "اعتبار کافی ندارید! برای کسب اعتبار، دوستانتان را دعوت کنید یا اشتراک بخرید."
+
 async def buy_subscription_menu(message):
     """ نمایش منوی خرید اشتراک """
     from config import SUBSCRIPTION_PRICE, ADMIN_CARD_NUMBER, ADMIN_PAYMENT_ID
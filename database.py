@@ -8,7 +8,11 @@ import logging
 from datetime import datetime, timedelta
 import random
 import string
-from config import DB_FILE, INITIAL_CREDITS, SUBSCRIPTION_DURATION_DAYS
+import time
+from config import (
+    DB_FILE, INITIAL_CREDITS, SUBSCRIPTION_DURATION_DAYS,
+    FILE_CACHE_TTL_DAYS, FILE_CACHE_MAX_ENTRIES
+)
 
 logger = logging.getLogger(__name__)
 
@@ -51,8 +55,122 @@ def initialize_database():
     )
     ''')
     
+    # 4. کش file_id تلگرام برای ارسال مجدد بدون دانلود/آپلود
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS file_cache (
+        video_id TEXT NOT NULL,
+        quality TEXT NOT NULL,
+        sub_lang TEXT NOT NULL DEFAULT '',
+        file_id TEXT NOT NULL,
+        file_size INTEGER DEFAULT 0,
+        created_at REAL NOT NULL,
+        last_used REAL NOT NULL,
+        hits INTEGER DEFAULT 0,
+        PRIMARY KEY (video_id, quality, sub_lang)
+    )
+    ''')
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_file_cache_last_used ON file_cache (last_used)"
+    )
+    
+    # 5. شمارنده‌های آماری (کش، پیش‌دانلود و ...)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS stats_counters (
+        name TEXT PRIMARY KEY NOT NULL,
+        value INTEGER DEFAULT 0
+    )
+    ''')
+    
+    # 6. آمار ترکیب‌های player_client / خانواده User-Agent (مقادیر با گذر زمان کم‌رنگ می‌شوند)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS client_stats (
+        player_client TEXT NOT NULL,
+        ua_family TEXT NOT NULL,
+        successes REAL DEFAULT 0,
+        failures REAL DEFAULT 0,
+        bytes REAL DEFAULT 0,
+        seconds REAL DEFAULT 0,
+        attempts INTEGER DEFAULT 0,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (player_client, ua_family)
+    )
+    ''')
+    
+    # 7. صف کارهای تبدیل گفتار به متن (ASR) بین ربات و پروسه‌های worker
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS asr_jobs (
+        job_id TEXT PRIMARY KEY NOT NULL,
+        video_id TEXT,
+        source_id TEXT,
+        lang TEXT NOT NULL,
+        media_path TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        stage TEXT,
+        progress REAL DEFAULT 0,
+        result_path TEXT,
+        error TEXT,
+        worker_id TEXT,
+        cancel_requested INTEGER DEFAULT 0,
+        created_at REAL NOT NULL,
+        updated_at REAL NOT NULL,
+        parent_id TEXT,
+        chunk_start REAL,
+        chunk_end REAL,
+        model TEXT
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_asr_jobs_status ON asr_jobs (status, created_at)")
+    # جدول‌های ساخته‌شده پیش از ستون‌های source_id و بخش‌بندی (کار فرزند یک کار اصلی)
+    cursor.execute("PRAGMA table_info(asr_jobs)")
+    asr_columns = [row[1] for row in cursor.fetchall()]
+    for column, column_type in (
+        ('source_id', 'TEXT'), ('parent_id', 'TEXT'), ('chunk_start', 'REAL'), ('chunk_end', 'REAL'), ('model', 'TEXT')
+    ):
+        if column not in asr_columns:
+            cursor.execute(f"ALTER TABLE asr_jobs ADD COLUMN {column} {column_type}")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_asr_jobs_parent ON asr_jobs (parent_id)")
+    
+    # 8. heartbeat پروسه‌های worker ASR
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS asr_workers (
+        worker_id TEXT PRIMARY KEY NOT NULL,
+        pid INTEGER,
+        status TEXT,
+        job_id TEXT,
+        models TEXT,
+        heartbeat_at REAL NOT NULL,
+        align_models TEXT,
+        align_bytes INTEGER DEFAULT 0,
+        rss INTEGER DEFAULT 0
+    )
+    ''')
+    # جدول‌های ساخته‌شده پیش از ستون‌های حافظه
+    cursor.execute("PRAGMA table_info(asr_workers)")
+    worker_columns = [row[1] for row in cursor.fetchall()]
+    for column, column_type in (('align_models', 'TEXT'), ('align_bytes', 'INTEGER DEFAULT 0'), ('rss', 'INTEGER DEFAULT 0')):
+        if column not in worker_columns:
+            cursor.execute(f"ALTER TABLE asr_workers ADD COLUMN {column} {column_type}")
+    
+    # 9. فهرست رونوشت‌های ذخیره‌شده (محتوا در فایل‌های TRANSCRIPT_DIR)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS transcripts (
+        transcript_key TEXT PRIMARY KEY NOT NULL,
+        source_id TEXT NOT NULL,
+        lang TEXT NOT NULL,
+        model TEXT NOT NULL,
+        pipeline_version INTEGER NOT NULL,
+        path TEXT NOT NULL,
+        size INTEGER DEFAULT 0,
+        created_at REAL NOT NULL,
+        last_used REAL NOT NULL,
+        hits INTEGER DEFAULT 0
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transcripts_last_used ON transcripts (last_used)")
+    
     conn.commit()
     conn.close()
+    evict_file_cache()
     logger.info(f"دیتابیس '{DB_FILE}' آماده‌سازی شد.")
 
 def get_user_data(user_id):
@@ -248,3 +366,561 @@ def get_redeem_code_info(code):
     conn.close()
     return result
 
+
+# --- کش file_id ---
+
+def get_cached_file(video_id, quality, sub_lang=""):
+    """ file_id ذخیره‌شده برای (ویدیو، کیفیت، زبان زیرنویس) را برمی‌گرداند و شمارنده hit/miss را به‌روز می‌کند. """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT file_id, file_size, created_at FROM file_cache "
+            "WHERE video_id = ? AND quality = ? AND sub_lang = ?",
+            (video_id, quality, sub_lang)
+        )
+        row = cursor.fetchone()
+        now = time.time()
+        if row and now - row[2] <= FILE_CACHE_TTL_DAYS * 86400:
+            cursor.execute(
+                "UPDATE file_cache SET hits = hits + 1, last_used = ? "
+                "WHERE video_id = ? AND quality = ? AND sub_lang = ?",
+                (now, video_id, quality, sub_lang)
+            )
+            _increment_counter(cursor, "file_cache_hits")
+            conn.commit()
+            conn.close()
+            return {"file_id": row[0], "file_size": row[1]}
+        _increment_counter(cursor, "file_cache_misses")
+        conn.commit()
+        conn.close()
+        return None
+    except Exception as e:
+        logger.error(f"خطا در خواندن کش فایل: {e}")
+        return None
+
+def has_cached_file(video_id, quality, sub_lang=""):
+    """ وجود ورودی معتبر در کش، بدون به‌روزرسانی شمارنده‌ها """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT 1 FROM file_cache WHERE video_id = ? AND quality = ? AND sub_lang = ? AND created_at >= ?",
+            (video_id, quality, sub_lang, time.time() - FILE_CACHE_TTL_DAYS * 86400)
+        )
+        row = cursor.fetchone()
+        conn.close()
+        return row is not None
+    except Exception as e:
+        logger.error(f"خطا در خواندن کش فایل: {e}")
+        return False
+
+def store_cached_file(video_id, quality, file_id, file_size=0, sub_lang=""):
+    """ file_id یک آپلود موفق را در کش ذخیره می‌کند. """
+    try:
+        now = time.time()
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT OR REPLACE INTO file_cache "
+            "(video_id, quality, sub_lang, file_id, file_size, created_at, last_used, hits) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+            (video_id, quality, sub_lang, file_id, file_size or 0, now, now)
+        )
+        conn.commit()
+        conn.close()
+        evict_file_cache()
+    except Exception as e:
+        logger.error(f"خطا در ذخیره کش فایل: {e}")
+
+def delete_cached_file(video_id, quality, sub_lang=""):
+    """ یک ورودی نامعتبر را از کش حذف می‌کند. """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "DELETE FROM file_cache WHERE video_id = ? AND quality = ? AND sub_lang = ?",
+            (video_id, quality, sub_lang)
+        )
+        _increment_counter(cursor, "file_cache_invalidated")
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        logger.error(f"خطا در حذف کش فایل: {e}")
+
+def evict_file_cache():
+    """ ورودی‌های قدیمی‌تر از TTL و مازاد بر ظرفیت (کم‌استفاده‌ترین‌ها) را حذف می‌کند. """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cutoff = time.time() - FILE_CACHE_TTL_DAYS * 86400
+        cursor.execute("DELETE FROM file_cache WHERE created_at < ?", (cutoff,))
+        expired = cursor.rowcount
+        cursor.execute(
+            "DELETE FROM file_cache WHERE rowid IN ("
+            "SELECT rowid FROM file_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (FILE_CACHE_MAX_ENTRIES,)
+        )
+        evicted = expired + cursor.rowcount
+        if evicted:
+            _increment_counter(cursor, "file_cache_evicted", evicted)
+        conn.commit()
+        conn.close()
+        return evicted
+    except Exception as e:
+        logger.error(f"خطا در پاک‌سازی کش فایل: {e}")
+        return 0
+
+def get_file_cache_stats():
+    """ آمار کش file_id را برمی‌گرداند. """
+    counters = get_counters("file_cache_")
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM file_cache")
+        entries = cursor.fetchone()[0]
+        conn.close()
+    except Exception as e:
+        logger.error(f"خطا در خواندن آمار کش فایل: {e}")
+        entries = 0
+    hits = counters.get("file_cache_hits", 0)
+    misses = counters.get("file_cache_misses", 0)
+    total = hits + misses
+    return {
+        "entries": entries,
+        "hits": hits,
+        "misses": misses,
+        "evicted": counters.get("file_cache_evicted", 0),
+        "hit_ratio": (hits / total) if total else 0.0,
+    }
+
+# --- شمارنده‌های آماری ---
+
+def _increment_counter(cursor, name, amount=1):
+    """ افزایش شمارنده روی یک cursor باز (بدون commit) """
+    cursor.execute(
+        "INSERT INTO stats_counters (name, value) VALUES (?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+        (name, amount)
+    )
+
+def increment_counter(name, amount=1):
+    """ یک شمارنده آماری را افزایش می‌دهد. """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        _increment_counter(cursor, name, amount)
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        logger.error(f"خطا در به‌روزرسانی شمارنده {name}: {e}")
+
+def get_counters(prefix=""):
+    """ شمارنده‌هایی که با prefix شروع می‌شوند را برمی‌گرداند. """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT name, value FROM stats_counters WHERE name LIKE ?",
+            (prefix + "%",)
+        )
+        rows = cursor.fetchall()
+        conn.close()
+        return {name: value for name, value in rows}
+    except Exception as e:
+        logger.error(f"خطا در خواندن شمارنده‌ها: {e}")
+        return {}
+
+# --- آمار کلاینت‌های yt-dlp (انتخاب تطبیقی) ---
+
+def record_client_result(player_client, ua_family, success, nbytes=0, seconds=0.0, half_life=0):
+    """ ثبت نتیجه یک تلاش برای ترکیب؛ مقادیر قبلی پیش از افزودن با نیمه‌عمر half_life (ثانیه) کم می‌شوند. """
+    try:
+        now = time.time()
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        # خواندن و نوشتن در یک تراکنش (دانلودها در چند thread هم‌زمان ثبت می‌کنند)
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(
+            "SELECT successes, failures, bytes, seconds, updated_at FROM client_stats "
+            "WHERE player_client = ? AND ua_family = ?",
+            (player_client, ua_family)
+        )
+        row = cursor.fetchone()
+        values = [0.0, 0.0, 0.0, 0.0]
+        if row:
+            factor = 0.5 ** (max(0.0, now - row[4]) / half_life) if half_life else 1.0
+            values = [v * factor for v in row[:4]]
+        values[0 if success else 1] += 1
+        values[2] += nbytes
+        values[3] += seconds
+        cursor.execute(
+            "INSERT INTO client_stats (player_client, ua_family, successes, failures, bytes, seconds, attempts, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, 1, ?) "
+            "ON CONFLICT(player_client, ua_family) DO UPDATE SET successes = excluded.successes, "
+            "failures = excluded.failures, bytes = excluded.bytes, seconds = excluded.seconds, "
+            "attempts = attempts + 1, updated_at = excluded.updated_at",
+            (player_client, ua_family, *values, now)
+        )
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        logger.error(f"خطا در ثبت آمار کلاینت {player_client}/{ua_family}: {e}")
+
+def get_client_stats():
+    """ آمار ذخیره‌شده همه ترکیب‌ها (بدون اعمال کم‌رنگ‌شدن) """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT player_client, ua_family, successes, failures, bytes, seconds, attempts, updated_at "
+            "FROM client_stats"
+        )
+        rows = cursor.fetchall()
+        conn.close()
+    except Exception as e:
+        logger.error(f"خطا در خواندن آمار کلاینت‌ها: {e}")
+        return []
+    keys = ('player_client', 'ua_family', 'successes', 'failures', 'bytes', 'seconds', 'attempts', 'updated_at')
+    return [dict(zip(keys, row)) for row in rows]
+
+# --- صف کارهای ASR (بین ربات و پروسه‌های worker) ---
+
+ASR_JOB_KEYS = (
+    'job_id', 'video_id', 'source_id', 'lang', 'media_path', 'status', 'stage', 'progress',
+    'result_path', 'error', 'worker_id', 'cancel_requested', 'created_at', 'updated_at',
+    'parent_id', 'chunk_start', 'chunk_end', 'model'
+)
+
+def create_asr_job(job_id, video_id, lang, media_path, source_id=None):
+    """ افزودن کار جدید به صف ASR؛ source_id شناسه منبع صوت برای ذخیره رونوشت است """
+    now = time.time()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT INTO asr_jobs (job_id, video_id, source_id, lang, media_path, status, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)",
+        (job_id, video_id, source_id, lang, media_path, now, now)
+    )
+    conn.commit()
+    conn.close()
+
+def create_asr_chunk_jobs(parent_id, lang, model, media_path, chunks):
+    """ افزودن بخش‌های (شروع، پایان) یک کار اصلی به صف به صورت کار فرزند؛ شناسه بخش‌ها به ترتیب """
+    now = time.time()
+    job_ids = [f"{parent_id}-{index}" for index in range(len(chunks))]
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.executemany(
+        "INSERT INTO asr_jobs (job_id, lang, media_path, status, created_at, updated_at, "
+        "parent_id, chunk_start, chunk_end, model) VALUES (?, ?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+        [
+            (job_id, lang, media_path, now, now, parent_id, start, end, model)
+            for job_id, (start, end) in zip(job_ids, chunks)
+        ]
+    )
+    conn.commit()
+    conn.close()
+    return job_ids
+
+def get_asr_chunk_jobs(parent_id):
+    """ بخش‌های یک کار اصلی به ترتیب زمان """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        f"SELECT {', '.join(ASR_JOB_KEYS)} FROM asr_jobs WHERE parent_id = ? ORDER BY chunk_start",
+        (parent_id,)
+    )
+    rows = cursor.fetchall()
+    conn.close()
+    return [dict(zip(ASR_JOB_KEYS, row)) for row in rows]
+
+def cancel_asr_chunks(parent_id):
+    """ لغو بخش‌های باقی‌مانده یک کار اصلی (شکست یا لغو کار اصلی) """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE asr_jobs SET cancel_requested = 1, "
+        "status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END, updated_at = ? "
+        "WHERE parent_id = ? AND status IN ('queued', 'running')",
+        (time.time(), parent_id)
+    )
+    conn.commit()
+    conn.close()
+
+def claim_asr_job(worker_id, parent_id=None):
+    """ برداشتن کار بعدی صف برای worker (اتمیک بین چند پروسه)؛ در نبود کار None.
+    بخش‌های کارهای در حال اجرا پیش از کارهای اصلی جدید برداشته می‌شوند؛ با parent_id فقط بخش‌های همان کار.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        if parent_id is not None:
+            cursor.execute(
+                f"SELECT {', '.join(ASR_JOB_KEYS)} FROM asr_jobs "
+                "WHERE status = 'queued' AND cancel_requested = 0 AND parent_id = ? ORDER BY chunk_start LIMIT 1",
+                (parent_id,)
+            )
+        else:
+            cursor.execute(
+                f"SELECT {', '.join(ASR_JOB_KEYS)} FROM asr_jobs "
+                "WHERE status = 'queued' AND cancel_requested = 0 AND (parent_id IS NULL "
+                "OR parent_id IN (SELECT job_id FROM asr_jobs WHERE status = 'running')) "
+                "ORDER BY parent_id IS NULL, created_at, chunk_start LIMIT 1"
+            )
+        row = cursor.fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+        cursor.execute(
+            "UPDATE asr_jobs SET status = 'running', worker_id = ?, updated_at = ? WHERE job_id = ?",
+            (worker_id, time.time(), row[0])
+        )
+        conn.commit()
+        return dict(zip(ASR_JOB_KEYS, row), status='running', worker_id=worker_id)
+    finally:
+        conn.close()
+
+def update_asr_job_progress(job_id, stage, progress):
+    """ ثبت مرحله و پیشرفت کار؛ True اگر لغو کار درخواست شده باشد """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE asr_jobs SET stage = ?, progress = ?, updated_at = ? WHERE job_id = ?",
+        (stage, progress, time.time(), job_id)
+    )
+    cursor.execute("SELECT cancel_requested FROM asr_jobs WHERE job_id = ?", (job_id,))
+    row = cursor.fetchone()
+    conn.commit()
+    conn.close()
+    return bool(row and row[0])
+
+def finish_asr_job(job_id, status, result_path=None, error=None):
+    """ پایان کار با وضعیت done / failed / cancelled """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE asr_jobs SET status = ?, result_path = ?, error = ?, "
+        "progress = CASE WHEN ? = 'done' THEN 1 ELSE progress END, updated_at = ? WHERE job_id = ?",
+        (status, result_path, error, status, time.time(), job_id)
+    )
+    conn.commit()
+    conn.close()
+
+def cancel_asr_job(job_id):
+    """ درخواست لغو: کار در صف فوراً لغو می‌شود و کار در حال اجرا در بررسی بعدی worker متوقف می‌شود
+    (بخش‌های کار هم همراه آن لغو می‌شوند)
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE asr_jobs SET cancel_requested = 1 WHERE job_id = ? OR parent_id = ?", (job_id, job_id))
+    cursor.execute(
+        "UPDATE asr_jobs SET status = 'cancelled', updated_at = ? "
+        "WHERE (job_id = ? OR parent_id = ?) AND status = 'queued'",
+        (time.time(), job_id, job_id)
+    )
+    conn.commit()
+    conn.close()
+
+def get_asr_job(job_id):
+    """ وضعیت کار به همراه جایگاه در صف (queue_position؛ 0 برای کار در حال اجرا) """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {', '.join(ASR_JOB_KEYS)} FROM asr_jobs WHERE job_id = ?", (job_id,))
+    row = cursor.fetchone()
+    if row is None:
+        conn.close()
+        return None
+    job = dict(zip(ASR_JOB_KEYS, row))
+    job['queue_position'] = 0
+    if job['status'] == 'queued':
+        cursor.execute(
+            "SELECT COUNT(*) FROM asr_jobs WHERE status = 'queued' AND parent_id IS NULL AND created_at <= ?",
+            (job['created_at'],)
+        )
+        job['queue_position'] = cursor.fetchone()[0]
+    conn.close()
+    return job
+
+def fail_worker_asr_jobs(worker_id, error):
+    """ کارهای در حال اجرای worker ازکارافتاده شکست‌خورده ثبت و بخش‌های کارهای اصلی آن لغو می‌شوند """
+    now = time.time()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE asr_jobs SET cancel_requested = 1, "
+        "status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END, updated_at = ? "
+        "WHERE status IN ('queued', 'running') AND parent_id IN "
+        "(SELECT job_id FROM asr_jobs WHERE worker_id = ? AND status = 'running')",
+        (now, worker_id)
+    )
+    cursor.execute(
+        "UPDATE asr_jobs SET status = 'failed', error = ?, updated_at = ? "
+        "WHERE worker_id = ? AND status = 'running'",
+        (error, now, worker_id)
+    )
+    conn.commit()
+    conn.close()
+
+def reset_asr_queue(keep_seconds=86400):
+    """ در شروع ربات: کارهای ناتمام اجرای قبلی (بدون منتظر) لغو و کارهای قدیمی و heartbeatها پاک می‌شوند """
+    now = time.time()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE asr_jobs SET status = 'cancelled', cancel_requested = 1, updated_at = ? "
+        "WHERE status IN ('queued', 'running')",
+        (now,)
+    )
+    cursor.execute("DELETE FROM asr_jobs WHERE updated_at < ?", (now - keep_seconds,))
+    cursor.execute("DELETE FROM asr_workers")
+    conn.commit()
+    conn.close()
+
+def get_asr_queue_counts():
+    """ تعداد کارهای اصلی (بدون بخش‌ها) به تفکیک وضعیت """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT status, COUNT(*) FROM asr_jobs WHERE parent_id IS NULL GROUP BY status")
+        rows = cursor.fetchall()
+        conn.close()
+        return dict(rows)
+    except Exception as e:
+        logger.error(f"خطا در خواندن صف ASR: {e}")
+        return {}
+
+def record_asr_heartbeat(worker_id, pid, status, job_id=None, models="", align_models="", align_bytes=0, rss=0):
+    """ heartbeat یک worker (وضعیت، کار فعلی و مدل‌های بارگذاری‌شده) """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO asr_workers (worker_id, pid, status, job_id, models, heartbeat_at, align_models, align_bytes, rss) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(worker_id) DO UPDATE SET pid = excluded.pid, status = excluded.status, "
+            "job_id = excluded.job_id, models = excluded.models, heartbeat_at = excluded.heartbeat_at, "
+            "align_models = excluded.align_models, align_bytes = excluded.align_bytes, rss = excluded.rss",
+            (worker_id, pid, status, job_id, models, time.time(), align_models, align_bytes, rss)
+        )
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        logger.error(f"خطا در ثبت heartbeat worker {worker_id}: {e}")
+
+def get_asr_workers():
+    """ آخرین heartbeat همه workerها """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT worker_id, pid, status, job_id, models, heartbeat_at, align_models, align_bytes, rss "
+            "FROM asr_workers ORDER BY worker_id"
+        )
+        rows = cursor.fetchall()
+        conn.close()
+    except Exception as e:
+        logger.error(f"خطا در خواندن workerهای ASR: {e}")
+        return []
+    keys = ('worker_id', 'pid', 'status', 'job_id', 'models', 'heartbeat_at', 'align_models', 'align_bytes', 'rss')
+    return [dict(zip(keys, row)) for row in rows]
+
+# --- رونوشت‌های ASR (کلید: منبع صوت، زبان، مدل، نسخه pipeline) ---
+
+def get_transcript_entry(transcript_key):
+    """ مسیر فایل رونوشت یا None؛ استفاده ثبت می‌شود """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT path FROM transcripts WHERE transcript_key = ?", (transcript_key,))
+        row = cursor.fetchone()
+        if row:
+            cursor.execute(
+                "UPDATE transcripts SET last_used = ?, hits = hits + 1 WHERE transcript_key = ?",
+                (time.time(), transcript_key)
+            )
+            _increment_counter(cursor, "transcript_hit")
+        else:
+            _increment_counter(cursor, "transcript_miss")
+        conn.commit()
+        conn.close()
+        return row[0] if row else None
+    except Exception as e:
+        logger.error(f"خطا در خواندن رونوشت: {e}")
+        return None
+
+def store_transcript_entry(transcript_key, source_id, lang, model, pipeline_version, path, size):
+    """ ثبت یا جایگزینی رونوشت """
+    try:
+        now = time.time()
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO transcripts "
+            "(transcript_key, source_id, lang, model, pipeline_version, path, size, created_at, last_used, hits) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0) "
+            "ON CONFLICT(transcript_key) DO UPDATE SET path = excluded.path, size = excluded.size, "
+            "last_used = excluded.last_used",
+            (transcript_key, source_id, lang, model, pipeline_version, path, size, now, now)
+        )
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        logger.error(f"خطا در ذخیره رونوشت: {e}")
+
+def delete_transcript_entry(transcript_key):
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM transcripts WHERE transcript_key = ?", (transcript_key,))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        logger.error(f"خطا در حذف رونوشت: {e}")
+
+def evict_transcripts(max_entries, max_bytes):
+    """ حذف کم‌استفاده‌ترین رونوشت‌ها تا سقف تعداد و حجم؛ مسیر فایل‌های حذف‌شده را برمی‌گرداند """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT transcript_key, path, size FROM transcripts ORDER BY last_used DESC")
+        rows = cursor.fetchall()
+        removed = []
+        total = 0
+        for index, (key, path, size) in enumerate(rows):
+            total += size or 0
+            if index >= max_entries or total > max_bytes:
+                cursor.execute("DELETE FROM transcripts WHERE transcript_key = ?", (key,))
+                removed.append(path)
+        if removed:
+            _increment_counter(cursor, "transcript_evicted", len(removed))
+        conn.commit()
+        conn.close()
+        return removed
+    except Exception as e:
+        logger.error(f"خطا در پاک‌سازی رونوشت‌ها: {e}")
+        return []
+
+def get_transcript_stats():
+    """ آمار ذخیره رونوشت‌ها برای پنل ادمین """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM transcripts")
+        entries, total_size = cursor.fetchone()
+        conn.close()
+    except Exception as e:
+        logger.error(f"خطا در خواندن آمار رونوشت‌ها: {e}")
+        entries, total_size = 0, 0
+    counters = get_counters("transcript_")
+    hits = counters.get("transcript_hit", 0)
+    misses = counters.get("transcript_miss", 0)
+    return {
+        "entries": entries,
+        "bytes": total_size,
+        "hits": hits,
+        "misses": misses,
+        "evicted": counters.get("transcript_evicted", 0),
+        "hit_ratio": (hits / (hits + misses)) if (hits + misses) else 0.0,
+    }
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+تحویل فایل به کاربر در سه سطح بر اساس حجم:
+Bot API (تا 50MB، یا 2GB با سرور محلی)، MTProto از طریق Pyrogram (تا 2GB) و تقسیم به چند بخش با ffmpeg (بدون encode مجدد)
+"""
+
+import os
+import glob
+import asyncio
+import shutil
+import logging
+from aiogram.types import FSInputFile
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from config import (
+    DOWNLOAD_DIR, MAX_FILE_SIZE, BOT_API_UPLOAD_LIMIT, MTPROTO_UPLOAD_LIMIT, SPLIT_MAX_PARTS,
+    LOCAL_BOT_API_URL, LOCAL_BOT_API_DOWNLOAD_DIR, LOCAL_BOT_API_UPLOAD_LIMIT
+)
+from pyrogram_client import pyrogram_pool, upload_file_parallel, send_uploaded_media
+from cancellation import run_process
+
+logger = logging.getLogger(__name__)
+
+TIER_BOT_API = "bot_api"
+TIER_MTPROTO = "mtproto"
+TIER_SPLIT = "split"
+
+# حاشیه اطمینان برای طول هر بخش (نرخ بیت ویدیو یکنواخت نیست)
+SPLIT_SAFETY = 0.9
+
+
+def bot_api_limit() -> int:
+    """ سقف آپلود Bot API؛ سرور محلی فایل را مستقیم از دیسک می‌خواند و تا 2GB می‌پذیرد """
+    return LOCAL_BOT_API_UPLOAD_LIMIT if LOCAL_BOT_API_URL else BOT_API_UPLOAD_LIMIT
+
+
+def bot_api_session(base_url: str = LOCAL_BOT_API_URL):
+    """ نشست aiogram برای سرور Bot API محلی (is_local: فایل‌ها با مسیر خوانده می‌شوند)؛ بدون سرور محلی None """
+    if not base_url:
+        return None
+    return AiohttpSession(api=TelegramAPIServer.from_base(base_url, is_local=True))
+
+
+def local_file_uri(file_path: str) -> str:
+    """ آدرس file:// فایل برای سرور Bot API محلی """
+    path = os.path.abspath(file_path)
+    if LOCAL_BOT_API_DOWNLOAD_DIR:
+        relative = os.path.relpath(path, os.path.abspath(DOWNLOAD_DIR))
+        path = os.path.join(LOCAL_BOT_API_DOWNLOAD_DIR, relative)
+    return f"file://{path}"
+
+
+def bot_api_input_file(file_path: str, file_name: str):
+    """ در حالت محلی فقط مسیر فایل فرستاده می‌شود (بدون آپلود multipart) """
+    if LOCAL_BOT_API_URL:
+        return local_file_uri(file_path)
+    return FSInputFile(file_path, filename=file_name)
+
+
+def mtproto_available() -> bool:
+    return pyrogram_pool.stats()['healthy'] > 0
+
+
+def upload_limit() -> int:
+    """ بزرگ‌ترین فایل تکی که در حال حاضر قابل آپلود است """
+    if mtproto_available():
+        return max(MTPROTO_UPLOAD_LIMIT, bot_api_limit())
+    return bot_api_limit()
+
+
+def max_deliverable_size() -> int:
+    """ سقف حجم برای برنامه‌ریزی فرمت: فایلی بزرگ‌تر از این دانلود نمی‌شود """
+    limit = upload_limit()
+    if shutil.which('ffmpeg') is None:
+        return limit
+    return min(MAX_FILE_SIZE, limit * SPLIT_MAX_PARTS)
+
+
+def choose_tier(size: int) -> str:
+    if size <= bot_api_limit():
+        return TIER_BOT_API
+    if mtproto_available() and size <= MTPROTO_UPLOAD_LIMIT:
+        return TIER_MTPROTO
+    return TIER_SPLIT
+
+
+def split_file_sync(file_path: str, part_limit: int, duration, out_dir: str, cancel_check=None):
+    """ تقسیم فایل به بخش‌های کوچک‌تر از part_limit با ffmpeg segment (فقط copy).
+    چون برش روی keyframe انجام می‌شود، اگر بخشی بزرگ‌تر شد با طول کوتاه‌تر تکرار می‌شود.
+    cancel_check در حین اجرای ffmpeg فراخوانی می‌شود و با لغو، ffmpeg کشته می‌شود.
+    """
+    size = os.path.getsize(file_path)
+    if not duration:
+        raise ValueError("برای تقسیم فایل مدت ویدیو لازم است")
+    ext = os.path.splitext(file_path)[1] or '.mp4'
+    segment_time = max(10, int(duration * part_limit * SPLIT_SAFETY / size))
+    os.makedirs(out_dir, exist_ok=True)
+    for _ in range(3):
+        for old in glob.glob(os.path.join(out_dir, f"part_*{ext}")):
+            os.remove(old)
+        pattern = os.path.join(out_dir, f"part_%03d{ext}")
+        run_process([
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+            '-i', file_path, '-map', '0', '-c', 'copy',
+            '-f', 'segment', '-segment_time', str(segment_time),
+            '-reset_timestamps', '1', pattern
+        ], cancel_check=cancel_check)
+        parts = sorted(glob.glob(os.path.join(out_dir, f"part_*{ext}")))
+        if not parts:
+            raise RuntimeError(f"ffmpeg هیچ بخشی از {os.path.basename(file_path)} ننوشت (فایل خالی یا خراب)")
+        largest = max(os.path.getsize(p) for p in parts)
+        if largest <= part_limit:
+            return parts
+        segment_time = max(5, int(segment_time * part_limit / largest * SPLIT_SAFETY))
+    raise RuntimeError("تقسیم فایل به بخش‌های کوچک‌تر از حد آپلود ممکن نشد")
+
+
+async def send_media(bot, chat_id, quality, media, video_title):
+    """ ارسال ویدیو/صوت با aiogram؛ media می‌تواند file_id یا InputFile باشد """
+    if quality == "audio":
+        return await bot.send_audio(
+            chat_id=chat_id,
+            audio=media,
+            caption=video_title,
+            title=video_title
+        )
+    return await bot.send_video(
+        chat_id=chat_id,
+        video=media,
+        caption=f"{video_title} - {quality}p",
+        supports_streaming=True
+    )
+
+
+def get_sent_media(sent_message):
+    """ شیء رسانه (video/audio/document) پیام ارسال‌شده (aiogram یا Pyrogram) """
+    if sent_message is None:
+        return None
+    for attr in ('video', 'audio', 'document'):
+        media = getattr(sent_message, attr, None)
+        if media is not None and getattr(media, 'file_id', None):
+            return media
+    return None
+
+
+def get_sent_file_id(sent_message):
+    """ استخراج file_id از پیام ارسال‌شده (aiogram یا Pyrogram) """
+    media = get_sent_media(sent_message)
+    return media.file_id if media is not None else None
+
+
+async def upload_with_pyrogram(pyro_client, chat_id, file_path, file_name, quality, video_title,
+                               reporter, meta=None):
+    """ آپلود موازی فایل روی یک نشست Pyrogram و ارسال آن به صورت ویدیو/صوت """
+    meta = meta or {}
+    kind = "audio" if quality == "audio" else "video"
+    input_file = await upload_file_parallel(pyro_client, file_path, file_name, progress=reporter.pyrogram_progress)
+    return await send_uploaded_media(
+        pyro_client, chat_id, input_file, kind, file_name,
+        caption=video_title if kind == "audio" else f"{video_title} - {quality}p",
+        duration=meta.get('duration') or 0,
+        width=meta.get('width') or 0,
+        height=meta.get('height') or 0,
+        title=video_title
+    )
+
+
+async def _send_single(bot, chat_id, file_path, file_name, quality, video_title, reporter, meta, tier):
+    if tier == TIER_MTPROTO:
+        async with pyrogram_pool.session() as pyro_client:
+            if pyro_client is not None:
+                return await upload_with_pyrogram(
+                    pyro_client, chat_id, file_path, file_name, quality, video_title, reporter, meta
+                )
+        if os.path.getsize(file_path) > bot_api_limit():
+            raise RuntimeError("نشست Pyrogram برای آپلود فایل بزرگ در دسترس نیست")
+    return await send_media(bot, chat_id, quality, bot_api_input_file(file_path, file_name), video_title)
+
+
+async def deliver_path(bot, chat_id, file_path, video_id, quality, video_title, reporter, meta=None,
+                       cancel_check=None):
+    """ ارسال فایل با مسیر مناسب حجم آن. خروجی (پیام‌های ارسال‌شده، سطح) است؛
+    در سطح split هر بخش یک پیام جدا با شماره بخش در کپشن است.
+    """
+    meta = meta or {}
+    size = os.path.getsize(file_path)
+    tier = choose_tier(size)
+    ext = os.path.splitext(file_path)[1]
+    logger.info(f"تحویل {video_id} ({quality}) با مسیر {tier}، حجم {size / (1024 * 1024):.1f}MB")
+
+    if tier != TIER_SPLIT:
+        sent = await _send_single(
+            bot, chat_id, file_path, f"{video_id}{ext}", quality, video_title, reporter, meta, tier
+        )
+        return [sent], tier
+
+    reporter.set_status("✂️ در حال تقسیم فایل به چند بخش...")
+    part_limit = upload_limit()
+    out_dir = f"{os.path.splitext(file_path)[0]}_parts"
+    loop = asyncio.get_event_loop()
+    try:
+        parts = await loop.run_in_executor(
+            None, split_file_sync, file_path, part_limit, meta.get('duration'), out_dir, cancel_check
+        )
+        sent_messages = []
+        for number, part_path in enumerate(parts, start=1):
+            part_title = f"{video_title} (بخش {number}/{len(parts)})"
+            part_tier = choose_tier(os.path.getsize(part_path))
+            # مدت دقیق هر بخش (برش روی keyframe) نامعلوم است
+            part_meta = dict(meta, duration=0)
+            sent_messages.append(await _send_single(
+                bot, chat_id, part_path, f"{video_id}_part{number}{ext}",
+                quality, part_title, reporter, part_meta, part_tier
+            ))
+        return sent_messages, tier
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
@@ -5,51 +5,108 @@
 
 import os
 import re
+import copy
+import time
+import uuid
+import shutil
 import asyncio
-import urllib.request
 import logging
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from yt_dlp import YoutubeDL
-from yt_dlp.utils import DownloadError
-from aiogram.types import FSInputFile
+from yt_dlp.utils import DownloadError, download_range_func
+
 from aiogram.exceptions import TelegramBadRequest
-from config import DOWNLOAD_DIR, MAX_FILE_SIZE, MAX_DURATION
-from user_agents import USER_AGENTS
-import random
+from aiogram.types import FSInputFile
+from config import (
+    DOWNLOAD_DIR, MAX_FILE_SIZE, MAX_DURATION,
+    INFO_CACHE_TTL, INFO_CACHE_MAX_ENTRIES,
+    DOWNLOAD_WORKERS, DOWNLOAD_PER_USER_LIMIT,
+    DOWNLOAD_ACCEL_MODE, DOWNLOAD_CONNECTIONS_PER_JOB, DOWNLOAD_MAX_CONNECTIONS,
+    STREAMING_UPLOAD, STREAM_BUFFER_PARTS, DOWNLOAD_MAX_ATTEMPTS, MTPROTO_UPLOAD_LIMIT,
+    PREFETCH_ENABLED, CLIP_FORCE_KEYFRAMES, STUCK_WORKER_GRACE, YTDLP_SOCKET_TIMEOUT
+)
 import glob
-from keyboards import get_quality_keyboard
+from keyboards import (
+    get_quality_keyboard, get_job_cancel_keyboard, get_subtitle_choice_keyboard, get_subtitle_language_keyboard
+)
 from states import DownloadStates
 from credits import check_and_consume_credit
-from pyrogram_client import get_pyrogram_client
+from database import get_cached_file, store_cached_file, delete_cached_file, has_cached_file, add_credits
+from pyrogram_client import pyrogram_pool, upload_stream, send_uploaded_media
+from delivery import (
+    send_media, get_sent_media, deliver_path, max_deliverable_size,
+    upload_limit, TIER_SPLIT
+)
+from format_planner import plan_format, describe_plan, NoFormatCandidates
+from progress import ProgressReporter
+from range_download import download_ranges_parallel, RangeNotSupported
+from streaming import stream_download_sync, iter_stream_queue, drain_stream_queue
+from storage import storage_manager
+from thumbnails import send_video_preview
+from client_selector import choose_arm, player_clients, record_result, ClientArm
+from cancellation import (
+    CancelToken, JobCancelled, STAGE_EXTRACT, STAGE_DOWNLOAD, STAGE_UPLOAD, STAGE_TRANSCRIBE, STAGE_TIMEOUTS,
+    REASON_TIMEOUT, REASON_ABANDONED, register_handle, unregister_handle, get_handle
+)
+from clip import parse_clip, parse_link_start, format_clip, clip_key
+from prefetch import (
+    start_prefetch, claim_prefetch, cancel_prefetch, choose_prefetch_quality, record_quality_pick
+)
+from retry import (
+    PERMANENT, TRANSIENT, RATE_LIMITED, classify_error, is_format_unavailable,
+    permanent_error_message, backoff_delay, RetryableDownloadError
+)
+from captions import generate_subtitles, SOURCE_MANUAL, SOURCE_AUTO, SOURCE_WHISPER
+from asr_pool import asr_pool, AsrError
 
 logger = logging.getLogger(__name__)
 
+CANCELLED_MESSAGE = "دانلود لغو شد."
+
+SUBTITLE_SOURCE_LABELS = {
+    SOURCE_MANUAL: "زیرنویس یوتیوب",
+    SOURCE_AUTO: "زیرنویس خودکار یوتیوب",
+    SOURCE_WHISPER: "تبدیل گفتار به متن (Whisper)",
+}
+ASR_STAGE_LABELS = {"decode": "استخراج صدا", "asr": "تبدیل گفتار به متن", "align": "تنظیم زمان کلمات"}
+
 class DownloadState:
     waiting_for_quality = "waiting_for_quality"  # باقی مانده برای سازگاری؛ از DownloadStates استفاده می‌کنیم
 
 
-def get_download_opts(format_str):
-    """ تنظیمات yt-dlp """
+def get_extract_opts(arm=None):
+    """ تنظیمات yt-dlp برای خواندن اطلاعات ویدیو (بدون دانلود) با ترکیب player_client/User-Agent انتخاب‌شده """
+    arm = arm or choose_arm()
     return {
-        'format': format_str,
-        'outtmpl': os.path.join(DOWNLOAD_DIR, '%(id)s.%(ext)s'),
         'http_headers': {
-            'User-Agent': random.choice(USER_AGENTS),
+            'User-Agent': arm.user_agent,
             'Accept': '*/*',
             'Accept-Language': 'en-US,en;q=0.9'
         },
         'quiet': True,
         'no_warnings': True,
         'logger': logger,
-        'retries': 10,
-        'fragment_retries': 10,
         'no_check_certificate': True,
+        'socket_timeout': YTDLP_SOCKET_TIMEOUT,
         'extractor_args': {
-            'youtube': {'player_client': ['android', 'ios']}
+            'youtube': {'player_client': player_clients(arm)}
         },
-     
         'cookies': 'cookies.txt'
     }
 
+def get_download_opts(format_str, work_dir=DOWNLOAD_DIR, arm=None):
+    """ تنظیمات yt-dlp """
+    opts = get_extract_opts(arm)
+    opts.update({
+        'format': format_str,
+        'outtmpl': os.path.join(work_dir, '%(id)s.%(ext)s'),
+        'retries': 10,
+        'fragment_retries': 10,
+    })
+    return opts
+
 # def get_download_opts(format_str):
 #     """ تنظیمات yt-dlp """
 #     return {
@@ -71,65 +128,731 @@ def get_download_opts(format_str):
 #         },
 #     }
 
-def download_video_sync(url: str, video_id: str, quality: str):
-    """ دانلود ویدیو با yt-dlp (همگام) با مدیریت خطا و retry محدود """
-    import time
+# کش LRU اطلاعات ویدیو: video_id -> (زمان ذخیره, info)
+_info_cache = OrderedDict()
+# استخراج‌های در جریان تا یک لینک هم‌زمان دو بار استخراج نشود
+_inflight_extractions = {}
+
+
+def extract_info_sync(url: str):
+    """ خواندن اطلاعات ویدیو با yt-dlp (همگام، برای اجرا در executor).
+    ترکیب کلاینت استفاده‌شده در info ذخیره می‌شود تا دانلود همان را به کار ببرد و نتیجه‌اش به حساب آن ثبت شود.
+    """
+    arm = choose_arm()
+    try:
+        with YoutubeDL(get_extract_opts(arm)) as ydl:
+            info = ydl.extract_info(url, download=False)
+    except Exception as e:
+        if classify_error(e) != PERMANENT:
+            record_result(arm, False)
+        raise
+    # موفقیت همین ترکیب پس از دانلود (با حجم و زمان) ثبت می‌شود؛ ثبت اینجا هر کار را دو بار حساب می‌کرد
+    info['_client_arm'] = tuple(arm)
+    return info
+
+
+def _job_arm(job):
+    """ ترکیب کلاینتی که info کار با آن استخراج شده است """
+    arm = job.info.get('_client_arm') if job.info else None
+    return ClientArm(*arm) if arm else None
+
+
+def _invalidate_info(video_id: str):
+    _info_cache.pop(video_id, None)
+
+
+def _get_cached_info(video_id: str):
+    """ info معتبر از کش یا None """
+    entry = _info_cache.get(video_id)
+    if entry is None:
+        return None
+    stored_at, info = entry
+    if time.time() - stored_at > INFO_CACHE_TTL:
+        # لینک‌های مستقیم فرمت‌ها منقضی می‌شوند
+        del _info_cache[video_id]
+        return None
+    _info_cache.move_to_end(video_id)
+    return info
+
+
+async def get_video_info(url: str, video_id: str):
+    """ اطلاعات ویدیو را از کش یا با استخراج در executor (بدون بلاک کردن event loop) برمی‌گرداند """
+    info = _get_cached_info(video_id)
+    if info is not None:
+        return info
+    
+    future = _inflight_extractions.get(video_id)
+    if future is None:
+        loop = asyncio.get_event_loop()
+        future = loop.run_in_executor(None, extract_info_sync, url)
+        _inflight_extractions[video_id] = future
+        try:
+            info = await _wait_extraction(future)
+        finally:
+            _inflight_extractions.pop(video_id, None)
+        _info_cache[video_id] = (time.time(), info)
+        _info_cache.move_to_end(video_id)
+        while len(_info_cache) > INFO_CACHE_MAX_ENTRIES:
+            _info_cache.popitem(last=False)
+        return info
+    return await _wait_extraction(future)
+
+
+async def _wait_extraction(future):
+    """ انتظار برای استخراج با مهلت مرحله (thread استخراج با socket_timeout خودش پایان می‌یابد) """
+    timeout = STAGE_TIMEOUTS[STAGE_EXTRACT] or None
+    return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+
+TIMEOUT_MESSAGE = "زمان دانلود بیش از حد مجاز طول کشید؛ لطفاً دوباره تلاش کنید."
+
+
+def _cancel_message(job) -> str:
+    return TIMEOUT_MESSAGE if job.token.reason == REASON_TIMEOUT else CANCELLED_MESSAGE
+
+
+class DownloadJob:
+    """ یک کار دانلود با پوشه کاری اختصاصی تا دانلودها فایل‌های همدیگر را پاک نکنند """
+
+    def __init__(self, url: str, video_id: str, quality: str, user_id=None):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.url = url
+        self.video_id = video_id
+        self.quality = quality
+        self.user_id = user_id
+        self.info = None
+        # فرمت انتخاب‌شده پیش از دانلود (خروجی plan_format)
+        self.plan = None
+        self.work_dir = os.path.join(DOWNLOAD_DIR, f"job_{self.job_id}")
+        # callbackهای اطلاع از جایگاه در صف (برای همه درخواست‌کننده‌های متصل)
+        self.position_listeners = []
+        self.queue_position = None
+        # progress_hookهای yt-dlp (از thread دانلود فراخوانی می‌شوند)
+        self.progress_listeners = []
+        # تعداد اتصال‌هایی که زمان‌بند به این کار داده است
+        self.connections = 1
+        # در حالت جریانی: آپلود متوقف شده و تولید جریان باید قطع شود
+        self.stream_aborted = False
+        # در حالت جریانی: تنظیمات yt-dlp (get_download_opts) برای پروسه جدا
+        self.ytdlp_opts = None
+        # بزرگ‌ترین حجمی که برای این کار قابل تحویل است
+        self.max_size = MAX_FILE_SIZE
+        # پیش‌دانلود با اولویت پایین (تا اتصال اولین کاربر)
+        self.background = False
+        # لغو همکارانه: در hookهای yt-dlp و دانلود چنداتصالی بررسی می‌شود
+        self.token = CancelToken()
+        # حالت برش: (start, end) بر حسب ثانیه
+        self.clip = None
+
+    def cleanup(self):
+        """ حذف پوشه کاری کار و آزاد کردن فضای رزروشده آن """
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        storage_manager.release(self.job_id)
+        # کارهای منتظر فضا ممکن است حالا قابل شروع باشند
+        download_scheduler.wake()
 
-    for f in os.listdir(DOWNLOAD_DIR):
-        if f.startswith(video_id):
+    def check_cancelled(self):
+        """ در thread دانلود: توقف کار لغوشده یا کاری که مهلتش تمام شده (JobCancelled) """
+        self.token.check()
+
+    def report_progress(self, d: dict):
+        """ progress_hook مشترک yt-dlp که به همه شنونده‌ها پخش می‌شود """
+        self.check_cancelled()
+        for listener in list(self.progress_listeners):
+            try:
+                listener(d)
+            except Exception as e:
+                logger.warning(f"خطا در گزارش پیشرفت: {e}")
+
+    def grant_connections(self, connections: int):
+        """ فراخوانی توسط زمان‌بند هنگام شروع کار """
+        self.connections = connections
+        self.queue_position = 0
+        self.token.enter_stage(STAGE_DOWNLOAD)
+
+    async def notify_position(self, position: int):
+        """ اطلاع جایگاه صف (0 یعنی شروع دانلود) به همه شنونده‌ها """
+        self.queue_position = position
+        for listener in list(self.position_listeners):
             try:
-                os.remove(os.path.join(DOWNLOAD_DIR, f))
-            except Exception:
-                pass
-
-    # تنظیم فرمت‌ها
-    formats = (
-        ['bestaudio[ext=m4a]', 'bestaudio[ext=mp3]', 'bestaudio', 'worstaudio']
-        if quality == "audio"
-        else [
+                await listener(position)
+            except Exception as e:
+                logger.warning(f"خطا در اطلاع‌رسانی جایگاه صف: {e}")
+
+
+def _range_download_source(job: DownloadJob):
+    """ فرمت progressive با حجم دقیق و لینک مستقیم HTTP که می‌شود با چند اتصال Range گرفت """
+    if DOWNLOAD_ACCEL_MODE != "parallel" or job.connections < 2 or job.clip:
+        return None
+    if not job.plan or not job.plan['progressive'] or not job.info:
+        return None
+    format_id = job.plan['format_ids'][0]
+    for fmt in job.info.get('formats') or []:
+        if fmt.get('format_id') != format_id:
+            continue
+        if fmt.get('filesize') and fmt.get('url') and fmt.get('protocol') in ('http', 'https'):
+            return fmt
+        return None
+    return None
+
+
+def download_video_sync(job: DownloadJob):
+    """ یک تلاش دانلود ویدیو با yt-dlp (همگام).
+    خطای دائمی (ویدیو خصوصی/حذف‌شده/...) بلافاصله پیام خطا برمی‌گرداند و خطای موقت
+    RetryableDownloadError می‌دهد تا _run_download کار را با backoff دوباره در صف بگذارد.
+    """
+    os.makedirs(job.work_dir, exist_ok=True)
+    quality = job.quality
+    # بدون info، yt-dlp هنگام دانلود با همین ترکیب استخراج می‌کند
+    arm = _job_arm(job) or choose_arm()
+
+    # حالت شتاب‌یافته: دانلود فرمت progressive با چند اتصال Range موازی
+    range_source = _range_download_source(job)
+    if range_source is not None:
+        file_path = os.path.join(job.work_dir, f"{job.video_id}.{range_source.get('ext') or 'mp4'}")
+        try:
+            started = time.monotonic()
+            download_ranges_parallel(
+                range_source['url'], file_path, int(range_source['filesize']),
+                connections=job.connections,
+                headers=range_source.get('http_headers'),
+                progress_hook=job.report_progress,
+                cancel_check=job.check_cancelled
+            )
+            record_result(arm, True, os.path.getsize(file_path), time.monotonic() - started)
+            return file_path, None
+        except JobCancelled:
+            shutil.rmtree(job.work_dir, ignore_errors=True)
+            return None, _cancel_message(job)
+        except RangeNotSupported as e:
+            logger.info(f"Range پشتیبانی نشد ({e})؛ دانلود با yt-dlp")
+        except Exception as e:
+            logger.warning(f"دانلود چنداتصالی {job.video_id} ناموفق بود: {e}؛ دانلود با yt-dlp")
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    # تنظیم فرمت‌ها: با برنامه فرمت فقط همان یک فرمت دانلود می‌شود
+    if job.plan:
+        formats = [job.plan['format']]
+    elif quality == "audio":
+        formats = ['bestaudio[ext=m4a]', 'bestaudio[ext=mp3]', 'bestaudio', 'worstaudio']
+    else:
+        formats = [
             f"best[height<={quality}]/22/18",
             "22/18/136/137/248",
             "best",
             "worst"
         ]
-    )
 
-    # حداکثر تعداد تلاش‌ها برای هر فرمت
-    max_retries_per_fmt = 2
-
-    # تلاش دانلود با فرمت‌های مختلف
+    # یک تلاش برای هر فرمت؛ خطای موقت کل کار را با backoff به صف برمی‌گرداند (بدون sleep در worker)
+    last_error = None
     for fmt in formats:
-        retries = 0
-        while retries <= max_retries_per_fmt:
-            try:
-                with YoutubeDL(get_download_opts(fmt)) as ydl:
-                    ydl.download([url])
-                # پیدا کردن فایل دانلود شده
-                files = glob.glob(os.path.join(DOWNLOAD_DIR, f'{video_id}.*'))
-                if files:
-                    file_path = files[0]
-                    try:
-                        size_ok = os.path.getsize(file_path) <= MAX_FILE_SIZE
-                    except Exception:
-                        size_ok = False
-                    if size_ok:
-                        return file_path, None
-                    try:
-                        os.remove(file_path)
-                    except Exception:
-                        pass
+        if job.token.cancelled:
+            return None, _cancel_message(job)
+        try:
+            started = time.monotonic()
+            opts = get_download_opts(fmt, job.work_dir, arm)
+            if job.plan and job.plan['merge']:
+                opts['merge_output_format'] = job.plan['ext']
+            opts['progress_hooks'] = [job.report_progress]
+            # قطعه‌های DASH/HLS با همان بودجه اتصال به‌صورت موازی گرفته می‌شوند
+            opts['concurrent_fragment_downloads'] = job.connections
+            if job.clip:
+                # فقط قطعه‌های بازه دانلود می‌شوند؛ برش روی keyframe بدون encode مجدد
+                opts['download_ranges'] = download_range_func(None, [tuple(job.clip)])
+                opts['force_keyframes_at_cuts'] = CLIP_FORCE_KEYFRAMES
+            with YoutubeDL(opts) as ydl:
+                if job.info:
+                    # استفاده مجدد از اطلاعات استخراج‌شده به‌جای استخراج دوباره
+                    ydl.process_ie_result(copy.deepcopy(job.info), download=True)
+                else:
+                    ydl.download([job.url])
+            # پیدا کردن فایل دانلود شده
+            files = glob.glob(os.path.join(job.work_dir, f'{job.video_id}.*'))
+            if files:
+                file_path = files[0]
+                try:
+                    size_ok = os.path.getsize(file_path) <= job.max_size
+                except Exception:
+                    size_ok = False
+                if size_ok:
+                    record_result(arm, True, os.path.getsize(file_path), time.monotonic() - started)
+                    return file_path, None
+                try:
+                    os.remove(file_path)
+                except Exception:
+                    pass
+                if job.plan:
+                    # تخمین حجم اشتباه بوده؛ فرمت دیگری در برنامه نیست
+                    logger.warning(f"حجم واقعی بیشتر از تخمین بود: {describe_plan(job.plan)}")
+                    return None, "حجم فایل در این کیفیت بیشتر از حد مجاز است."
+        except DownloadError as de:
+            if job.token.cancelled:
+                return None, _cancel_message(job)
+            if is_format_unavailable(de):
+                logger.info(f"فرمت {fmt} برای {job.video_id} موجود نیست؛ فرمت بعدی")
+                continue
+            kind = classify_error(de)
+            logger.warning(f"yt-dlp خطا داد (fmt={fmt}, نوع={kind}): {de}")
+            if kind == PERMANENT:
+                return None, permanent_error_message(de)
+            record_result(arm, False)
+            raise RetryableDownloadError(kind, str(de))
+        except JobCancelled:
+            return None, _cancel_message(job)
+        except Exception as e:
+            if job.token.cancelled:
+                return None, _cancel_message(job)
+            logger.error(f"خطای غیرمنتظره در دانلود (fmt={fmt}): {e}")
+            last_error = e
+    
+    if last_error is not None:
+        record_result(arm, False)
+        raise RetryableDownloadError(TRANSIENT, str(last_error))
+    return None, "نمی‌توانم ویدیو را دانلود کنم."
+
+
+class _QueuedJob:
+    """ یک کار در صف زمان‌بند """
+
+    def __init__(self, user_id, func, args, future, on_position, connections, on_start, admit,
+                 background=False, tag=None, timeout=None, on_timeout=None):
+        self.user_id = user_id
+        self.func = func
+        self.args = args
+        self.future = future
+        self.on_position = on_position
+        self.connections = connections
+        self.on_start = on_start
+        self.admit = admit
+        self.background = background
+        self.tag = tag
+        self.timeout = timeout
+        self.on_timeout = on_timeout
+        self.timer = None
+        # worker گیرکرده که پس از مهلت رها شده است
+        self.reclaimed = False
+        self.counted = False
+        self.granted_connections = 0
+        self.last_position = None
+
+
+class DownloadScheduler:
+    """ زمان‌بند کارهای دانلود: تعداد ثابت worker، صف FIFO با نوبت‌دهی چرخشی بین کاربران،
+    سقف کار هم‌زمان برای هر کاربر و بودجه سراسری اتصال‌های دانلود.
+    کارهای پس‌زمینه (پیش‌دانلود) فقط وقتی صف عادی خالی است و حداقل یک worker آزاد می‌ماند اجرا می‌شوند.
+    مهلت هر کار اجرا می‌شود: پس از timeout کار لغو و اگر تا STUCK_WORKER_GRACE متوقف نشد جایش آزاد می‌شود.
+    """
+
+    def __init__(self, workers: int, per_user_limit: int, max_connections: int = None):
+        self.workers = workers
+        self.per_user_limit = per_user_limit
+        self.max_connections = max_connections or workers
+        self._connections_in_use = 0
+        # threadهای اضافه برای جبران workerهای گیرکرده‌ای که رها می‌شوند
+        self._executor = ThreadPoolExecutor(max_workers=workers * 2, thread_name_prefix="download")
+        # user_id -> deque از کارهای در انتظار؛ ترتیب کلیدها همان نوبت چرخشی است
+        self._queues = OrderedDict()
+        # کارهای پس‌زمینه با اولویت پایین
+        self._background = deque()
+        self._running = {}
+        self._active = 0
+        self.reclaimed = 0
+
+    async def submit(self, user_id, func, *args, on_position=None, connections=1, on_start=None, admit=None,
+                     background=False, tag=None, timeout=None, on_timeout=None):
+        """ افزودن کار به صف و انتظار برای نتیجه آن.
+        connections: تعداد اتصال درخواستی؛ on_start با تعداد اتصال اعطاشده پیش از اجرا فراخوانی می‌شود.
+        admit: اگر داده شود، کار فقط وقتی شروع می‌شود که admit() مقدار True بدهد (مثلاً رزرو فضای دیسک).
+        background: کار با اولویت پایین؛ با promote(tag) به صف عادی منتقل می‌شود.
+        timeout: مهلت اجرا از شروع کار؛ پس از آن on_timeout() (لغو همکارانه) فراخوانی می‌شود.
+        """
+        loop = asyncio.get_event_loop()
+        entry = _QueuedJob(user_id, func, args, loop.create_future(), on_position, connections, on_start, admit,
+                           background, tag, timeout, on_timeout)
+        if background:
+            self._background.append(entry)
+        else:
+            self._queues.setdefault(user_id, deque()).append(entry)
+        self._dispatch()
+        self._notify_positions()
+        try:
+            return await entry.future
+        except asyncio.CancelledError:
+            self._remove_queued(entry)
+            raise
+
+    def _remove_queued(self, entry: _QueuedJob):
+        if entry in self._background:
+            self._background.remove(entry)
+            return
+        queue = self._queues.get(entry.user_id)
+        if queue and entry in queue:
+            queue.remove(entry)
+            if not queue:
+                del self._queues[entry.user_id]
+            self._notify_positions()
+
+    def _pick_next(self):
+        """ اولین کار از اولین کاربری که به سقف کار هم‌زمان نرسیده و کارش پذیرفته می‌شود """
+        for user_id, queue in self._queues.items():
+            if self._running.get(user_id, 0) >= self.per_user_limit:
+                continue
+            if queue[0].admit is not None and not queue[0].admit():
+                continue
+            entry = queue.popleft()
+            if queue:
+                # کاربر به انتهای نوبت می‌رود تا بقیه کاربران معطل نشوند
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            return entry
+        # پیش‌دانلود: فقط با صف عادی خالی و بدون گرفتن آخرین worker آزاد
+        if self._background and not self._queues and self._active < self.workers - 1:
+            entry = self._background[0]
+            if entry.admit is None or entry.admit():
+                return self._background.popleft()
+        return None
+
+    def _dispatch(self):
+        while self._active < self.workers and self._connections_in_use < self.max_connections:
+            entry = self._pick_next()
+            if entry is None:
                 break
-            except DownloadError as de:
-                logger.warning(f"yt-dlp خطا داد (fmt={fmt}): {de}")
-                retries += 1
-                time.sleep(1.0)
-            except Exception as e:
-                logger.error(f"خطای غیرمنتظره در دانلود (fmt={fmt}): {e}")
-                retries += 1
-                time.sleep(1.0)
+            self._start(entry)
+
+    def promote(self, tag):
+        """ انتقال کار پس‌زمینه با این tag به صف عادی (کاربری منتظر آن است) """
+        for entry in list(self._background):
+            if entry.tag == tag:
+                self._background.remove(entry)
+                entry.background = False
+                self._queues.setdefault(entry.user_id, deque()).append(entry)
+                self.wake()
+                return True
+        return False
+
+    def wake(self):
+        """ بررسی دوباره صف پس از آزاد شدن منابع بیرونی (مثل فضای دیسک) """
+        self._dispatch()
+        self._notify_positions()
+
+    def _start(self, entry: _QueuedJob):
+        self._active += 1
+        if not entry.background:
+            # پیش‌دانلود جزو سقف کار هم‌زمان کاربر حساب نمی‌شود
+            entry.counted = True
+            self._running[entry.user_id] = self._running.get(entry.user_id, 0) + 1
+        entry.granted_connections = max(1, min(entry.connections, self.max_connections - self._connections_in_use))
+        self._connections_in_use += entry.granted_connections
+        if entry.on_start is not None:
+            entry.on_start(entry.granted_connections)
+        self._report_position(entry, 0)
+        loop = asyncio.get_event_loop()
+        worker_future = loop.run_in_executor(self._executor, entry.func, *entry.args)
+        worker_future.add_done_callback(lambda f: self._finished(entry, f))
+        if entry.timeout:
+            entry.timer = loop.call_later(entry.timeout, self._timed_out, entry, worker_future)
+
+    def _timed_out(self, entry: _QueuedJob, worker_future):
+        if worker_future.done():
+            return
+        logger.warning(f"مهلت کار {entry.tag} تمام شد؛ لغو")
+        if entry.on_timeout is not None:
+            entry.on_timeout()
+        entry.timer = asyncio.get_event_loop().call_later(STUCK_WORKER_GRACE, self._reclaim, entry, worker_future)
+
+    def _reclaim(self, entry: _QueuedJob, worker_future):
+        """ worker به لغو پاسخ نداد (مثلاً در I/O گیر کرده)؛ thread رها و ظرفیتش به صف برگردانده می‌شود """
+        if worker_future.done():
+            return
+        logger.error(f"worker کار {entry.tag} پس از لغو متوقف نشد؛ رها شد")
+        entry.reclaimed = True
+        self.reclaimed += 1
+        self._release(entry)
+        if not entry.future.done():
+            entry.future.set_exception(JobCancelled(REASON_TIMEOUT, STAGE_DOWNLOAD))
+        self._dispatch()
+        self._notify_positions()
+
+    def _release(self, entry: _QueuedJob):
+        self._active -= 1
+        self._connections_in_use -= entry.granted_connections
+        if entry.counted:
+            self._running[entry.user_id] -= 1
+            if not self._running[entry.user_id]:
+                del self._running[entry.user_id]
+
+    def _finished(self, entry: _QueuedJob, worker_future):
+        if entry.timer is not None:
+            entry.timer.cancel()
+        if entry.reclaimed:
+            # ظرفیت این کار قبلاً آزاد شده است
+            return
+        self._release(entry)
+        if not entry.future.done():
+            if worker_future.cancelled():
+                entry.future.cancel()
+            elif worker_future.exception() is not None:
+                entry.future.set_exception(worker_future.exception())
+            else:
+                entry.future.set_result(worker_future.result())
+        self._dispatch()
+        self._notify_positions()
+
+    def pending_order(self):
+        """ ترتیب اجرای کارهای در انتظار با شبیه‌سازی نوبت چرخشی """
+        queues = [list(q) for q in self._queues.values()]
+        order = []
+        depth = 0
+        while True:
+            layer = [q[depth] for q in queues if depth < len(q)]
+            if not layer:
+                break
+            order.extend(layer)
+            depth += 1
+        return order
+
+    def _notify_positions(self):
+        for position, entry in enumerate(self.pending_order(), start=1):
+            self._report_position(entry, position)
 
+    def _report_position(self, entry: _QueuedJob, position: int):
+        if entry.on_position is None or entry.last_position == position:
+            return
+        entry.last_position = position
+        asyncio.ensure_future(entry.on_position(position))
+
+    def stats(self):
+        """ وضعیت فعلی زمان‌بند """
+        return {
+            "workers": self.workers,
+            "active": self._active,
+            "queued": sum(len(q) for q in self._queues.values()),
+            "background": len(self._background),
+            "connections": self._connections_in_use,
+            "max_connections": self.max_connections,
+            "reclaimed": self.reclaimed,
+        }
+
+
+download_scheduler = DownloadScheduler(DOWNLOAD_WORKERS, DOWNLOAD_PER_USER_LIMIT, DOWNLOAD_MAX_CONNECTIONS)
+
+
+class _SharedDownload:
+    """ یک دانلود در جریان که چند درخواست‌کننده به آن وصل شده‌اند """
+
+    def __init__(self, job: DownloadJob, task):
+        self.job = job
+        self.task = task
+        self.refs = 0
+
+
+# دانلودهای در جریان بر اساس (video_id, quality)
+_inflight_downloads = {}
+
+
+def _storage_estimate(job: DownloadJob) -> int:
+    """ فضای لازم برای کار: حجم برنامه‌ریزی‌شده یا سقف حجم کار؛ دو برابر برای ادغام صوت و تصویر
+    یا وقتی فایل برای تحویل باید به چند بخش تقسیم شود
+    """
+    if not job.plan or not job.plan.get('estimated_size'):
+        return job.max_size
+    size = int(job.plan['estimated_size'])
+    return size * 2 if job.plan['merge'] or size > upload_limit() else size
+
+
+async def _run_download(job: DownloadJob):
+    """ آماده‌سازی info از کش و سپردن دانلود به زمان‌بند (با تلاش مجدد خطاهای موقت) """
+    try:
+        job.info = await get_video_info(job.url, job.video_id)
+    except Exception as e:
+        if classify_error(e) == PERMANENT:
+            # لینک مرده؛ دانلود هم شکست خواهد خورد
+            return None, permanent_error_message(e)
+        # yt-dlp هنگام دانلود خودش اطلاعات را استخراج می‌کند
+        logger.warning(f"اطلاعات ویدیو {job.video_id} برای دانلود در دسترس نیست: {e}")
+    
+    # انتخاب فرمت پیش از دریافت هر بایت، با سقف حجمی که واقعاً قابل تحویل است
+    job.max_size = max_deliverable_size()
+    if job.info and job.info.get('formats'):
+        clip_duration = (job.clip[1] - job.clip[0]) if job.clip else None
+        try:
+            job.plan = plan_format(job.info, job.quality, job.max_size, clip_duration=clip_duration)
+        except NoFormatCandidates as e:
+            # فرمت‌های info قابل برنامه‌ریزی نیستند؛ انتخاب فرمت به yt-dlp سپرده می‌شود
+            logger.warning(f"برنامه فرمت برای {job.video_id} ({job.quality}) ممکن نیست: {e}")
+        else:
+            if job.plan is None:
+                return None, "حجم فایل در این کیفیت بیشتر از حد مجاز است."
+            logger.info(f"برنامه دانلود {job.video_id} ({job.quality}): {describe_plan(job.plan)}")
+    
+    reserve_bytes = _storage_estimate(job)
+    if not storage_manager.fits_quota(reserve_bytes):
+        return None, "فضای کافی برای دانلود این فایل روی سرور وجود ندارد."
+    
+    connections = DOWNLOAD_CONNECTIONS_PER_JOB if DOWNLOAD_ACCEL_MODE == "parallel" else 1
+    for attempt in range(DOWNLOAD_MAX_ATTEMPTS):
+        try:
+            return await download_scheduler.submit(
+                job.user_id, download_video_sync, job,
+                on_position=job.notify_position,
+                connections=connections,
+                on_start=job.grant_connections,
+                # تا رزرو فضا ممکن نشود کار در صف می‌ماند
+                admit=lambda: storage_manager.reserve(job.job_id, reserve_bytes),
+                background=job.background,
+                tag=job.job_id,
+                timeout=STAGE_TIMEOUTS[STAGE_DOWNLOAD],
+                on_timeout=lambda: job.token.cancel(REASON_TIMEOUT)
+            )
+        except JobCancelled:
+            # worker گیرکرده توسط زمان‌بند رها شد
+            return None, _cancel_message(job)
+        except RetryableDownloadError as e:
+            if job.token.cancelled:
+                return None, _cancel_message(job)
+            if attempt == DOWNLOAD_MAX_ATTEMPTS - 1:
+                logger.error(f"دانلود {job.video_id} پس از {DOWNLOAD_MAX_ATTEMPTS} تلاش ناموفق ماند: {e}")
+                break
+            delay = backoff_delay(attempt, e.kind)
+            logger.info(f"تلاش مجدد دانلود {job.video_id} ({e.kind}) پس از {delay:.1f} ثانیه")
+            # در مدت انتظار نه worker اشغال است و نه فضای رزروشده
+            storage_manager.release(job.job_id)
+            download_scheduler.wake()
+            job.report_progress({'status': 'retrying', 'attempt': attempt + 2, 'delay': delay})
+            await asyncio.sleep(delay)
+            if e.kind == RATE_LIMITED:
+                # لینک‌های ترکیب کلاینت فعلی محدود شده‌اند؛ استخراج دوباره با ترکیب انتخابی جدید
+                await _refresh_info(job)
     return None, "نمی‌توانم ویدیو را دانلود کنم."
 
+
+async def _refresh_info(job: DownloadJob):
+    """ استخراج دوباره info (و برنامه فرمت) پس از محدودیت نرخ """
+    _invalidate_info(job.video_id)
+    try:
+        job.info = await get_video_info(job.url, job.video_id)
+    except Exception as e:
+        logger.warning(f"استخراج دوباره اطلاعات {job.video_id} ناموفق بود: {e}")
+        return
+    if job.plan and job.info.get('formats'):
+        clip_duration = (job.clip[1] - job.clip[0]) if job.clip else None
+        try:
+            job.plan = plan_format(job.info, job.quality, job.max_size, clip_duration=clip_duration) or job.plan
+        except NoFormatCandidates as e:
+            logger.warning(f"برنامه فرمت جدید برای {job.video_id} ممکن نیست: {e}")
+
+
+def _finish_flight(key, flight: _SharedDownload):
+    """ پس از خروج آخرین استفاده‌کننده: نگه‌داری فایل موفق در LRU و پاک کردن پوشه کاری """
+    task = flight.task
+    if not task.cancelled() and task.exception() is None:
+        file_path, error_msg = task.result()
+        if file_path and not error_msg:
+            storage_manager.retain(key, file_path)
+    flight.job.cleanup()
+
+
+@asynccontextmanager
+async def shared_download(url: str, video_id: str, quality: str, user_id=None,
+                          on_position=None, on_progress=None, background=False, clip=None):
+    """ single-flight: درخواست‌های هم‌زمان برای یک (ویدیو، کیفیت) منتظر یک دانلود مشترک می‌مانند.
+    خروجی (file_path, error_msg) است و فایل پس از خروج آخرین استفاده‌کننده پاک یا در LRU نگه‌داشته می‌شود.
+    on_position با جایگاه صف (0 = شروع دانلود) و on_progress با دیکشنری progress_hook فراخوانی می‌شود.
+    background=True برای پیش‌دانلود است: کار با اولویت پایین اجرا و با اتصال اولین کاربر عادی ارتقا می‌یابد.
+    دانلودی که همه استفاده‌کننده‌هایش رهایش کنند (لغو یا خطا) لغو می‌شود. clip=(start, end) فقط همان بازه را دانلود می‌کند.
+    """
+    key = (video_id, clip_key(quality, clip))
+    flight = _inflight_downloads.get(key)
+    if flight is None:
+        # فایل اخیراً ارسال‌شده هنوز روی دیسک است
+        retained_path = storage_manager.acquire(key)
+        if retained_path is not None:
+            logger.info(f"ارسال از فایل نگه‌داشته: {video_id} ({quality})")
+            try:
+                yield retained_path, None
+            finally:
+                storage_manager.release_retained(key)
+            return
+        job = DownloadJob(url, video_id, quality, user_id)
+        job.background = background
+        job.clip = clip
+        if on_position is not None:
+            job.position_listeners.append(on_position)
+        task = asyncio.ensure_future(_run_download(job))
+        flight = _SharedDownload(job, task)
+        _inflight_downloads[key] = flight
+        flight.refs += 1
+    else:
+        logger.info(f"اتصال به دانلود در جریان: {video_id} ({quality})")
+        # ارجاع پیش از هر await ثبت می‌شود تا دانلود در این فاصله رها نشود
+        flight.refs += 1
+        if not background and flight.job.background:
+            flight.job.background = False
+            download_scheduler.promote(flight.job.job_id)
+        if on_position is not None:
+            flight.job.position_listeners.append(on_position)
+            if flight.job.queue_position is not None:
+                await on_position(flight.job.queue_position)
+    if on_progress is not None:
+        flight.job.progress_listeners.append(on_progress)
+    try:
+        try:
+            file_path, error_msg = await asyncio.shield(flight.task)
+        except Exception as e:
+            logger.error(f"خطای غیرمنتظره در دانلود {video_id}: {e}")
+            file_path, error_msg = None, "نمی‌توانم ویدیو را دانلود کنم."
+        if (error_msg or not file_path) and _inflight_downloads.get(key) is flight:
+            # نتیجه ناموفق به اشتراک گذاشته نمی‌شود تا درخواست بعدی دوباره تلاش کند
+            del _inflight_downloads[key]
+        yield file_path, error_msg
+    finally:
+        if on_progress in flight.job.progress_listeners:
+            flight.job.progress_listeners.remove(on_progress)
+        if on_position in flight.job.position_listeners:
+            flight.job.position_listeners.remove(on_position)
+        flight.refs -= 1
+        if flight.refs == 0:
+            if _inflight_downloads.get(key) is flight:
+                del _inflight_downloads[key]
+            if not flight.task.done():
+                # دانلود رهاشده: کار در صف حذف و کار در حال اجرا متوقف می‌شود
+                flight.job.token.cancel(REASON_ABANDONED)
+                if flight.job.queue_position != 0:
+                    flight.task.cancel()
+            if flight.task.done():
+                _finish_flight(key, flight)
+            else:
+                flight.task.add_done_callback(lambda _: _finish_flight(key, flight))
+
+
+async def send_cached_media(bot, chat_id, video_id, quality, video_title, sub_lang="", clip=None):
+    """ ارسال با file_id کش‌شده؛ در نبود یا نامعتبر بودن آن False """
+    cache_quality = clip_key(quality, clip)
+    cached = get_cached_file(video_id, cache_quality, sub_lang)
+    if not cached:
+        return False
+    try:
+        await send_media(bot, chat_id, quality, cached['file_id'], video_title)
+    except TelegramBadRequest as e:
+        # file_id نامعتبر شده؛ حذف از کش و ادامه با دانلود
+        logger.warning(f"file_id کش‌شده برای {video_id} ({quality}) نامعتبر است: {e}")
+        delete_cached_file(video_id, cache_quality, sub_lang)
+        return False
+    logger.info(f"ارسال از کش file_id: {video_id} ({quality})")
+    return True
+
+async def send_from_file_cache(query, video_id, quality, video_title, sub_lang="", clip=None):
+    """ اگر فایل قبلاً آپلود شده باشد، با file_id ارسال می‌کند و True برمی‌گرداند """
+    if not await send_cached_media(query.bot, query.message.chat.id, video_id, quality, video_title, sub_lang, clip):
+        return False
+    try:
+        await query.message.delete()
+    except Exception:
+        pass
+    return True
+
 async def process_youtube_link(message, state):
     """ پردازش لینک یوتیوب """
     try:
@@ -147,13 +870,9 @@ async def process_youtube_link(message, state):
         
         status_msg = await message.answer("🚀")
         
-        # دریافت اطلاعات ویدیو
-        ydl_opts = {'quiet': True, 'no_warnings': True, 'logger': logger}
-        info = {}
-        
+        # دریافت اطلاعات ویدیو (در executor و با کش)
         try:
-            with YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(clean_url, download=False)
+            info = await get_video_info(clean_url, video_id)
         except Exception as e:
             logger.warning(f"yt-dlp نتوانست اطلاعات را بخواند: {e}")
             await status_msg.edit_text(
@@ -161,80 +880,34 @@ async def process_youtube_link(message, state):
             )
             return
         
-        title = info.get('title', 'بدون عنوان')
-        yt_thumb = f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg"
-        thumbnail_url = info.get('thumbnail') or yt_thumb
-        duration = info.get('duration', 0)
+        duration = info.get('duration') or 0
         
-        # بررسی محدودیت زمان
-        if duration > MAX_DURATION:
+        # حالت برش: بازه از متن پیام یا لینک
+        clip = parse_clip(message.text)
+        if clip is None and duration > MAX_DURATION:
+            link_start = parse_link_start(message.text)
+            if link_start is not None and link_start < duration:
+                # لینک با t= از ویدیوی طولانی: از همان نقطه تا سقف مدت
+                clip = (link_start, min(link_start + MAX_DURATION, duration))
+        
+        # بررسی محدودیت زمان (برای برش، طول بازه)
+        if clip is None and duration > MAX_DURATION:
+            await state.set_state(DownloadStates.waiting_for_clip_range)
+            await state.update_data(video_url=clean_url, video_id=video_id)
             await status_msg.edit_text(
-                f"❌ ویدیو ({duration // 60} دقیقه) طولانی‌تر از حد مجاز (30 دقیقه) است."
+                f"❌ ویدیو ({duration // 60} دقیقه) طولانی‌تر از حد مجاز ({MAX_DURATION // 60} دقیقه) است.\n\n"
+                f"✂️ برای دریافت بخشی از آن، بازه زمانی را بفرستید (مثلاً 1:30-12:00)؛ "
+                f"حداکثر {MAX_DURATION // 60} دقیقه."
             )
             return
         
-        # ذخیره اطلاعات در FSM
-        await state.set_state(DownloadStates.waiting_for_quality)
-        await state.update_data(
-            video_url=clean_url,
-            video_title=title,
-            video_id=video_id,
-            thumbnail_url=thumbnail_url
-        )
+        if clip is not None:
+            clip, clip_error = validate_clip(clip, duration)
+            if clip_error:
+                await status_msg.edit_text(f"❌ {clip_error}")
+                return
         
-        # ارسال عکس و دکمه‌ها
-        caption = (
-            f"<b>{title}</b>\n\n"
-            f"⏱️ مدت زمان: {duration // 60}:{duration % 60:02d}\n\n"
-            "لطفاً کیفیت مورد نظر را انتخاب کنید:"
-        )
-        
-        # تلاش برای ارسال عکس
-        try:
-            await message.bot.send_photo(
-                chat_id=message.chat.id,
-                photo=thumbnail_url,
-                caption=caption,
-                reply_markup=get_quality_keyboard()
-            )
-        except TelegramBadRequest as tbre:
-            err_text = str(tbre).lower()
-            if 'wrong type of the web page content' in err_text:
-                try:
-                    if thumbnail_url != yt_thumb:
-                        await message.bot.send_photo(
-                            chat_id=message.chat.id,
-                            photo=yt_thumb,
-                            caption=caption,
-                            reply_markup=get_quality_keyboard()
-                        )
-                    else:
-                        raise Exception('skip')
-                except Exception:
-                    # دانلود و ارسال عکس محلی
-                    thumb_path = os.path.join(DOWNLOAD_DIR, f"{video_id}_thumb.jpg")
-                    try:
-                        urllib.request.urlretrieve(yt_thumb, thumb_path)
-                        await message.bot.send_photo(
-                            chat_id=message.chat.id,
-                            photo=FSInputFile(thumb_path),
-                            caption=caption,
-                            reply_markup=get_quality_keyboard()
-                        )
-                    except Exception:
-                        await message.bot.send_message(
-                            chat_id=message.chat.id,
-                            text=caption,
-                            reply_markup=get_quality_keyboard()
-                        )
-                    finally:
-                        if os.path.exists(thumb_path):
-                            try:
-                                os.remove(thumb_path)
-                            except:
-                                pass
-            else:
-                raise
+        await show_quality_menu(message, state, info, video_id, clean_url, clip)
         
         await status_msg.delete()
     
@@ -242,17 +915,103 @@ async def process_youtube_link(message, state):
         logger.error(f"خطا در پردازش لینک: {e}")
         await message.answer(f"خطای ناشناخته: {str(e)}")
 
+def validate_clip(clip, duration):
+    """ بازه را به مدت ویدیو محدود می‌کند؛ خروجی (clip, پیام خطا) """
+    start, end = clip
+    if duration:
+        if start >= duration:
+            return None, "شروع بازه بعد از پایان ویدیو است."
+        end = min(end, duration)
+    if end - start > MAX_DURATION:
+        return None, f"طول بازه ({(end - start) // 60} دقیقه) بیشتر از حد مجاز ({MAX_DURATION // 60} دقیقه) است."
+    return (start, end), None
+
+async def show_quality_menu(message, state, info, video_id, clean_url, clip=None):
+    """ ذخیره اطلاعات در FSM، ارسال پیش‌نمایش با دکمه‌های کیفیت و شروع پیش‌دانلود """
+    title = info.get('title', 'بدون عنوان')
+    thumbnail_url = info.get('thumbnail') or f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg"
+    duration = info.get('duration') or 0
+    if clip is not None:
+        # بازه در عنوان می‌آید تا در کپشن فایل ارسالی هم دیده شود
+        title = f"{title} ✂️ {format_clip(clip)}"
+        duration = clip[1] - clip[0]
+    
+    # ذخیره اطلاعات در FSM
+    await state.set_state(DownloadStates.waiting_for_quality)
+    await state.update_data(
+        video_url=clean_url,
+        video_title=title,
+        video_id=video_id,
+        thumbnail_url=thumbnail_url,
+        clip=list(clip) if clip else None
+    )
+    
+    # ارسال عکس و دکمه‌ها
+    caption = (
+        f"<b>{title}</b>\n\n"
+        f"⏱️ مدت زمان: {duration // 60}:{duration % 60:02d}\n\n"
+        "لطفاً کیفیت مورد نظر را انتخاب کنید:"
+    )
+    
+    # ارسال پیش‌نمایش (با کش file_id عکس)
+    await send_video_preview(
+        message.bot, message.chat.id, video_id, thumbnail_url, caption, get_quality_keyboard()
+    )
+    
+    # پیش‌دانلود محتمل‌ترین کیفیت تا زمان انتخاب کاربر
+    if PREFETCH_ENABLED and not STREAMING_UPLOAD:
+        prefetch_quality = choose_prefetch_quality(info, clip)
+        if prefetch_quality is not None:
+            user_id = message.from_user.id
+            start_prefetch(
+                user_id, video_id, prefetch_quality,
+                lambda: shared_download(
+                    clean_url, video_id, prefetch_quality, user_id=user_id, background=True, clip=clip
+                )
+            )
+
+async def handle_clip_range_input(message, state):
+    """ دریافت بازه زمانی برای ویدیوی طولانی """
+    user_data = await state.get_data()
+    video_url = user_data.get('video_url')
+    video_id = user_data.get('video_id')
+    if not video_url:
+        await state.clear()
+        return
+    
+    clip = parse_clip(message.text)
+    if clip is None:
+        # متن غیر بازه: انتظار تمام می‌شود تا کاربر در حالت برش گیر نکند
+        await state.clear()
+        await message.answer(
+            "❌ بازه نامعتبر است و درخواست برش لغو شد.\n"
+            "برای برش، لینک را دوباره همراه بازه بفرستید (مثلاً 1:30-12:00)."
+        )
+        return
+    
+    try:
+        info = await get_video_info(video_url, video_id)
+    except Exception as e:
+        logger.warning(f"yt-dlp نتوانست اطلاعات را بخواند: {e}")
+        await state.clear()
+        await message.answer("خطا در خواندن اطلاعات ویدیو. لطفاً لینک را دوباره بفرستید.")
+        return
+    
+    clip, clip_error = validate_clip(clip, info.get('duration') or 0)
+    if clip_error:
+        await message.answer(f"❌ {clip_error}")
+        return
+    
+    await show_quality_menu(message, state, info, video_id, video_url, clip)
+
 async def handle_quality_callback(query, state):
     """ مدیریت انتخاب کیفیت """
     user_data = await state.get_data()
     video_url = user_data.get('video_url')
     video_title = user_data.get('video_title')
-    video_id = user_data.get('video_id')
-    thumbnail_url = user_data.get('thumbnail_url')
-    
-    await state.clear()
     
     if not video_url:
+        await state.clear()
         await query.answer("این دکمه منقضی شده است.", show_alert=True)
         await query.message.delete()
         return
@@ -260,10 +1019,95 @@ async def handle_quality_callback(query, state):
     quality = query.data.split("_")[1]
     
     if quality == "cancel":
+        await state.clear()
+        cancel_prefetch(query.from_user.id)
         await query.answer("عملیات لغو شد.")
         await query.message.delete()
         return
     
+    # پیشنهاد زیرنویس (فقط با پروسه‌های ASR فعال؛ فایل صوتی زیرنویس ندارد)
+    if asr_pool.enabled and quality != "audio":
+        await query.answer()
+        await state.set_state(DownloadStates.waiting_for_subtitle_choice)
+        await state.update_data(quality=quality)
+        await query.message.edit_caption(
+            caption=_subtitle_choice_caption(video_title, quality), reply_markup=get_subtitle_choice_keyboard()
+        )
+        return
+    
+    await state.clear()
+    await run_quality_job(query, state, user_data, quality)
+
+def _subtitle_choice_caption(video_title, quality):
+    return (
+        f"<b>{video_title}</b>\n\nکیفیت {quality} انتخاب شد. زیرنویس هم می‌خواهید؟\n"
+        "(بدون زیرنویس: ۱ اعتبار | با زیرنویس: ۲ اعتبار)"
+    )
+
+async def _expired_subtitle_button(query, state, user_data):
+    """ دکمه زیرنویس بدون اطلاعات FSM (ربات راه‌اندازی مجدد شده یا کار شروع شده است) """
+    if user_data.get('video_url') and user_data.get('quality'):
+        return False
+    await state.clear()
+    await query.answer("این دکمه منقضی شده است.", show_alert=True)
+    await query.message.delete()
+    return True
+
+async def handle_subtitle_choice_callback(query, state):
+    """ انتخاب با/بدون زیرنویس پس از انتخاب کیفیت """
+    user_data = await state.get_data()
+    if await _expired_subtitle_button(query, state, user_data):
+        return
+    video_title = user_data.get('video_title')
+    
+    if query.data == "sub_back_quality":
+        await query.answer()
+        await state.set_state(DownloadStates.waiting_for_quality)
+        await query.message.edit_caption(
+            caption=f"<b>{video_title}</b>\n\nلطفاً کیفیت مورد نظر را انتخاب کنید:",
+            reply_markup=get_quality_keyboard()
+        )
+        return
+    
+    if query.data == "sub_yes":
+        await query.answer()
+        await state.set_state(DownloadStates.waiting_for_subtitle_lang)
+        await query.message.edit_caption(
+            caption=f"<b>{video_title}</b>\n\nزبان زیرنویس را انتخاب کنید:",
+            reply_markup=get_subtitle_language_keyboard()
+        )
+        return
+    
+    await state.clear()
+    await run_quality_job(query, state, user_data, user_data['quality'])
+
+async def handle_subtitle_language_callback(query, state):
+    """ انتخاب زبان زیرنویس و شروع دانلود """
+    user_data = await state.get_data()
+    if await _expired_subtitle_button(query, state, user_data):
+        return
+    
+    if query.data == "sub_back_choice":
+        await query.answer()
+        await state.set_state(DownloadStates.waiting_for_subtitle_choice)
+        await query.message.edit_caption(
+            caption=_subtitle_choice_caption(user_data.get('video_title'), user_data['quality']),
+            reply_markup=get_subtitle_choice_keyboard()
+        )
+        return
+    
+    await state.clear()
+    await run_quality_job(query, state, user_data, user_data['quality'], query.data[len("sub_lang_"):])
+
+async def run_quality_job(query, state, user_data, quality, sub_lang=""):
+    """ دانلود و تحویل کیفیت انتخاب‌شده؛ با sub_lang فایل SRT هم ساخته و ارسال می‌شود (۲ اعتبار) """
+    video_url = user_data.get('video_url')
+    video_title = user_data.get('video_title')
+    video_id = user_data.get('video_id')
+    thumbnail_url = user_data.get('thumbnail_url')
+    clip = tuple(user_data['clip']) if user_data.get('clip') else None
+    user_id = query.from_user.id
+    
     await query.answer(f"درخواست شما برای {quality} ثبت شد...")
     
     # ویرایش پیام
@@ -275,10 +1119,10 @@ async def handle_quality_callback(query, state):
         logger.warning(f"خطا در ویرایش کپشن: {e}")
     
     # بررسی اعتبار
-    user_id = query.from_user.id
-    success, result = await check_and_consume_credit(user_id)
+    success, result = await check_and_consume_credit(user_id, 2 if sub_lang else 1)
     
     if not success:
+        cancel_prefetch(user_id)
         await query.message.edit_caption(
             caption=f"<b>{video_title}</b>\n\n❌ {result}\n\nلطفاً دوباره تلاش کنید:",
             reply_markup=get_quality_keyboard()
@@ -288,109 +1132,327 @@ async def handle_quality_callback(query, state):
             video_url=video_url,
             video_title=video_title,
             video_id=video_id,
-            thumbnail_url=thumbnail_url
+            thumbnail_url=thumbnail_url,
+            clip=list(clip) if clip else None
         )
         return
+    # فقط انتخاب‌های پرداخت‌شده در آمار پیش‌دانلود حساب می‌شوند
+    record_quality_pick(quality)
     
-    # اجرای دانلود
-    loop = asyncio.get_event_loop()
-    file_path, error_msg = await loop.run_in_executor(
-        None,
-        download_video_sync,
-        video_url,
-        video_id,
-        quality
+    # ارسال مستقیم از کش file_id در صورت وجود (زیرنویس جدا ارسال می‌شود؛ ویدیو همان فایل کش‌شده است)
+    if not sub_lang and await send_from_file_cache(query, video_id, quality, video_title, "", clip):
+        cancel_prefetch(user_id)
+        return
+    
+    # کار قابل لغو با دکمه «لغو» روی پیام پیشرفت
+    handle = register_handle(user_id)
+    # گزارش زنده وضعیت در کپشن (با محدودیت نرخ ویرایش)
+    reporter = ProgressReporter(
+        query.message, video_title, reply_markup=get_job_cancel_keyboard(handle.handle_id)
     )
+    srt_path = source = None
+    try:
+        if sub_lang and has_cached_file(video_id, clip_key(quality, clip)):
+            # ویدیو در کش file_id است؛ فقط زیرنویس ساخته می‌شود (Whisper روی فایل صوتی)
+            cancel_prefetch(user_id)
+            srt_path, source = await prepare_subtitles(video_url, video_id, sub_lang, clip, user_id, handle, reporter)
+            if await send_from_file_cache(query, video_id, quality, video_title, "", clip):
+                await reporter.close()
+                await send_subtitle_result(query, user_id, result, srt_path, video_id, video_title, sub_lang, source)
+                return
     
-    if error_msg or not file_path:
-        await query.message.edit_caption(
-            caption=f"<b>{video_title}</b>\n\n❌ {error_msg or 'فایل پیدا نشد'}\n\nلطفاً دوباره تلاش کنید:",
-            reply_markup=get_quality_keyboard()
-        )
+        # حالت جریانی: دانلود و آپلود هم‌زمان بدون فایل موقت (برای برش و زیرنویس پشتیبانی نمی‌شود)
+        if STREAMING_UPLOAD and clip is None and not sub_lang:
+            try:
+                sent_message = await stream_deliver(
+                    query, video_url, video_id, quality, video_title, user_id, reporter
+                )
+            except JobCancelled:
+                # مهلت مرحله دانلود تمام شد؛ مثل خطای دانلود عادی منوی کیفیت دوباره نمایش داده می‌شود
+                await reporter.close()
+                await query.message.edit_caption(
+                    caption=f"<b>{video_title}</b>\n\n❌ {TIMEOUT_MESSAGE}\n\nلطفاً دوباره تلاش کنید:",
+                    reply_markup=get_quality_keyboard()
+                )
+                await state.set_state(DownloadStates.waiting_for_quality)
+                await state.update_data(
+                    video_url=video_url,
+                    video_title=video_title,
+                    video_id=video_id,
+                    thumbnail_url=thumbnail_url,
+                    clip=None
+                )
+                return
+            if sent_message is not None:
+                media = get_sent_media(sent_message)
+                if media is not None:
+                    store_cached_file(video_id, quality, media.file_id, getattr(media, 'file_size', 0))
+                await reporter.close()
+                await query.message.delete()
+                return
+    
+        async def show_queue_position(position):
+            """ نمایش جایگاه صف در کپشن پیام """
+            if position > 0:
+                reporter.set_status(f"🕒 در صف دانلود ({quality})... نوبت شما: {position}")
+            else:
+                reporter.set_status(f"⏬ در حال دانلود ({quality})...")
+    
+        # اتصال به پیش‌دانلود همین کیفیت (بدون await تا ثبت ارجاع در shared_download)
+        claim_prefetch(user_id, video_id, quality)
+    
+        # اجرای دانلود (درخواست‌های هم‌زمان یک ویدیو و کیفیت، یک دانلود مشترک دارند)
+        async with shared_download(
+            video_url, video_id, quality, user_id=user_id,
+            on_position=show_queue_position, on_progress=reporter.ytdlp_hook, clip=clip
+        ) as (file_path, error_msg):
+            if error_msg or not file_path:
+                await reporter.close()
+                await query.message.edit_caption(
+                    caption=f"<b>{video_title}</b>\n\n❌ {error_msg or 'فایل پیدا نشد'}\n\nلطفاً دوباره تلاش کنید:",
+                    reply_markup=get_quality_keyboard()
+                )
+                await state.set_state(DownloadStates.waiting_for_quality)
+                await state.update_data(
+                    video_url=video_url,
+                    video_title=video_title,
+                    video_id=video_id,
+                    thumbnail_url=thumbnail_url,
+                    clip=list(clip) if clip else None
+                )
+                return
+        
+            if sub_lang and srt_path is None:
+                srt_path, source = await prepare_subtitles(
+                    video_url, video_id, sub_lang, clip, user_id, handle, reporter, file_path
+                )
+            await deliver_file(
+                query, file_path, video_id, quality, video_title, "", reporter, clip, handle.token.check
+            )
+        if sub_lang:
+            await send_subtitle_result(query, user_id, result, srt_path, video_id, video_title, sub_lang, source)
+    except asyncio.CancelledError:
+        if not handle.token.cancelled:
+            raise
+        # لغو توسط کاربر: دانلود مشترک اگر کاربر دیگری نداشته باشد متوقف می‌شود
+        logger.info(f"کار {video_id} ({quality}) توسط کاربر {user_id} لغو شد")
+        await reporter.close()
+        try:
+            await query.message.edit_caption(
+                caption=f"<b>{video_title}</b>\n\n❌ {CANCELLED_MESSAGE}\n\nبرای دریافت دوباره کیفیت را انتخاب کنید:",
+                reply_markup=get_quality_keyboard()
+            )
+        except Exception as e:
+            logger.warning(f"خطا در ویرایش پیام لغو: {e}")
         await state.set_state(DownloadStates.waiting_for_quality)
         await state.update_data(
             video_url=video_url,
             video_title=video_title,
             video_id=video_id,
-            thumbnail_url=thumbnail_url
+            thumbnail_url=thumbnail_url,
+            clip=list(clip) if clip else None
         )
+    finally:
+        unregister_handle(handle)
+
+async def prepare_subtitles(video_url, video_id, sub_lang, clip, user_id, handle, reporter, media_path=None):
+    """ ساخت SRT در مرحله transcribe (با مهلت خودش)؛ (srt_path, source) یا (None, None) در صورت خطا.
+    بدون media_path، اگر زیرنویس یوتیوب نباشد فایل صوتی برای Whisper دانلود می‌شود.
+    """
+    handle.token.enter_stage(STAGE_TRANSCRIBE)
+    reporter.set_status("📝 در حال ساخت زیرنویس...")
+
+    async def show_asr_status(job):
+        if job['status'] == 'queued':
+            reporter.set_status(f"🕒 در صف ساخت زیرنویس... نوبت شما: {job['queue_position']}")
+        else:
+            stage = ASR_STAGE_LABELS.get(job['stage'], "ساخت زیرنویس")
+            reporter.set_status(f"📝 {stage}... {job['progress'] or 0:.0%}")
+
+    def open_media():
+        if media_path is not None:
+            return _ready_file(media_path)
+        return shared_download(
+            video_url, video_id, "audio", user_id=user_id, on_progress=reporter.ytdlp_hook, clip=clip
+        )
+
+    try:
+        info = await get_video_info(video_url, video_id)
+        return await generate_subtitles(info, video_id, sub_lang, open_media, clip, handle.token, show_asr_status)
+    except JobCancelled as e:
+        if e.reason != REASON_TIMEOUT:
+            # لغو توسط کاربر؛ همان مسیر لغو task هندلر
+            raise asyncio.CancelledError()
+        logger.warning(f"مهلت ساخت زیرنویس {video_id} ({sub_lang}) تمام شد")
+    except AsrError as e:
+        logger.error(f"ساخت زیرنویس {video_id} ({sub_lang}) ناموفق بود: {e}")
+    finally:
+        # مرحله بعد آپلود است؛ مهلت زیرنویس نباید آپلود را قطع کند
+        handle.token.enter_stage(STAGE_UPLOAD)
+    return None, None
+
+@asynccontextmanager
+async def _ready_file(file_path):
+    """ فایل از قبل دانلودشده با همان خروجی shared_download """
+    yield file_path, None
+
+async def send_subtitle_result(query, user_id, credit_result, srt_path, video_id, video_title, sub_lang, source):
+    """ ارسال SRT به صورت سند؛ اگر ساخته نشد، اعتبار زیرنویس برگردانده می‌شود """
+    chat_id = query.message.chat.id
+    if srt_path is None:
+        # اعتبار فقط در نبود اشتراک کسر شده بود (خروجی عددی check_and_consume_credit)
+        if isinstance(credit_result, int):
+            add_credits(user_id, 1)
+        await query.bot.send_message(chat_id, "❌ ساخت زیرنویس ممکن نشد؛ اعتبار زیرنویس برگردانده شد.")
         return
+    try:
+        await query.bot.send_document(
+            chat_id, FSInputFile(srt_path, filename=f"{video_id}.{sub_lang}.srt"),
+            caption=f"📝 {video_title}\nمنبع زیرنویس: {SUBTITLE_SOURCE_LABELS.get(source, source)}"
+        )
+    finally:
+        try:
+            os.remove(srt_path)
+        except OSError:
+            pass
+
+async def handle_job_cancel_callback(query):
+    """ دکمه لغو کار در حال اجرا """
+    handle = get_handle(query.data[len("job_cancel_"):])
+    if handle is None:
+        await query.answer("این کار دیگر در حال اجرا نیست.", show_alert=True)
+        return
+    if handle.user_id != query.from_user.id:
+        await query.answer("فقط درخواست‌کننده می‌تواند این کار را لغو کند.", show_alert=True)
+        return
+    handle.cancel()
+    await query.answer("در حال لغو...")
+
+async def stream_deliver(query, video_url, video_id, quality, video_title, user_id, reporter):
+    """ دانلود و آپلود جریانی از طریق Pyrogram؛ در صورت عدم امکان یا خطا None (برگشت به مسیر فایل).
+    پایان مهلت مرحله دانلود JobCancelled می‌دهد (برگشت به مسیر فایل فایده‌ای ندارد).
+    """
+    async with pyrogram_pool.session() as pyro_client:
+        if pyro_client is None:
+            return None
+        return await _stream_upload(pyro_client, query, video_url, video_id, quality, video_title, user_id, reporter)
+
+async def _stream_upload(pyro_client, query, video_url, video_id, quality, video_title, user_id, reporter):
+    """ اجرای دانلود جریانی و آپلود هم‌زمان روی یک نشست استخر؛ لغو، مهلت و گزارش پیشرفت مثل مسیر عادی """
+    try:
+        info = await get_video_info(video_url, video_id)
+    except Exception as e:
+        logger.warning(f"حالت جریانی بدون اطلاعات ویدیو ممکن نیست: {e}")
+        return None
+    # جریان قابل تقسیم نیست؛ فقط تا سقف آپلود MTProto
+    try:
+        plan = plan_format(info, quality, MTPROTO_UPLOAD_LIMIT) if info.get('formats') else None
+    except NoFormatCandidates:
+        plan = None
+    if plan is None:
+        return None
     
-    # آپلود فایل
+    job = DownloadJob(video_url, video_id, quality, user_id)
+    job.info = info
+    job.plan = plan
+    job.ytdlp_opts = get_download_opts(plan['format'], job.work_dir, _job_arm(job))
+    # آپلود حداکثر STREAM_BUFFER_PARTS part از دانلود عقب است؛ یک خط پیشرفت (دانلود) کافی است
+    job.progress_listeners.append(reporter.ytdlp_hook)
+    loop = asyncio.get_event_loop()
+    # صف محدود: حداکثر STREAM_BUFFER_PARTS part در حافظه
+    queue = asyncio.Queue(maxsize=STREAM_BUFFER_PARTS)
+    producer = asyncio.ensure_future(download_scheduler.submit(
+        user_id, stream_download_sync, job, queue, loop,
+        on_position=lambda position: _stream_position(reporter, quality, position),
+        on_start=job.grant_connections,
+        tag=job.job_id,
+        timeout=STAGE_TIMEOUTS[STAGE_DOWNLOAD],
+        on_timeout=lambda: job.token.cancel(REASON_TIMEOUT)
+    ))
+    file_name = f"{video_id}.{plan['ext'] or 'mp4'}"
+    kind = "audio" if quality == "audio" else "video"
     try:
-        await query.message.edit_caption(
-            caption=f"<b>{video_title}</b>\n\n📤 در حال آپلود فایل ({quality})..."
+        try:
+            input_file = await upload_stream(
+                pyro_client, iter_stream_queue(queue), file_name, total_hint=plan.get('estimated_size')
+            )
+        except Exception:
+            job.stream_aborted = True
+            await drain_stream_queue(queue, producer)
+            raise
+        await producer
+        return await send_uploaded_media(
+            pyro_client, query.message.chat.id, input_file, kind, file_name,
+            caption=video_title if kind == "audio" else f"{video_title} - {quality}p",
+            duration=info.get('duration') or 0,
+            width=plan.get('width') or 0,
+            height=plan.get('height') or 0,
+            title=video_title
         )
-        
-        file_size = os.path.getsize(file_path)
-        use_pyrogram = file_size > 49 * 1024 * 1024  # اگر بزرگتر از 49MB باشد
-        
-        if use_pyrogram:
-            # استفاده از Pyrogram برای فایل‌های بزرگ
-            pyro_client = await get_pyrogram_client()
-            if pyro_client:
-                if quality == "audio":
-                    await pyro_client.send_audio(
-                        chat_id=query.message.chat.id,
-                        audio=file_path,
-                        caption=video_title
-                    )
-                else:
-                    await pyro_client.send_video(
-                        chat_id=query.message.chat.id,
-                        video=file_path,
-                        caption=f"{video_title} - {quality}p",
-                        supports_streaming=True
-                    )
-            else:
-                # اگر Pyrogram در دسترس نبود، با aiogram تلاش می‌کنیم
-                file_input = FSInputFile(file_path)
-                if quality == "audio":
-                    await query.bot.send_audio(
-                        chat_id=query.message.chat.id,
-                        audio=file_input,
-                        caption=video_title,
-                        title=video_title
-                    )
-                else:
-                    await query.bot.send_video(
-                        chat_id=query.message.chat.id,
-                        video=file_input,
-                        caption=f"{video_title} - {quality}p",
-                        supports_streaming=True
-                    )
+    except Exception as e:
+        if job.token.reason == REASON_TIMEOUT:
+            raise JobCancelled(REASON_TIMEOUT, STAGE_DOWNLOAD) from e
+        logger.warning(f"دانلود جریانی {video_id} ناموفق بود، برگشت به مسیر فایل: {e}")
+        return None
+    finally:
+        if not producer.done():
+            # لغو handler: thread تولیدکننده را آزاد می‌کنیم
+            job.token.cancel(REASON_ABANDONED)
+            job.stream_aborted = True
+            asyncio.ensure_future(drain_stream_queue(queue, producer))
+            producer.add_done_callback(lambda _: job.cleanup())
         else:
-            # استفاده از aiogram برای فایل‌های کوچک
-            file_input = FSInputFile(file_path)
-            if quality == "audio":
-                await query.bot.send_audio(
-                    chat_id=query.message.chat.id,
-                    audio=file_input,
-                    caption=video_title,
-                    title=video_title
-                )
-            else:
-                await query.bot.send_video(
-                    chat_id=query.message.chat.id,
-                    video=file_input,
-                    caption=f"{video_title} - {quality}p",
-                    supports_streaming=True
-                )
-        
+            job.cleanup()
+
+async def _stream_position(reporter, quality, position):
+    """ نمایش جایگاه صف برای کار جریانی """
+    if position > 0:
+        reporter.set_status(f"🕒 در صف دانلود ({quality})... نوبت شما: {position}")
+
+async def upload_and_cache(bot, chat_id, file_path, video_id, quality, video_title, reporter,
+                           sub_lang="", clip=None, cancel_check=None):
+    """ آپلود فایل با مسیر مناسب حجم (با مهلت مرحله آپلود) و ذخیره file_id در کش """
+    info = _get_cached_info(video_id) or {}
+    duration = (clip[1] - clip[0]) if clip else info.get('duration')
+    sent_messages, tier = await asyncio.wait_for(
+        deliver_path(
+            bot, chat_id, file_path, video_id, quality, video_title, reporter,
+            meta={'duration': duration, 'width': info.get('width'), 'height': info.get('height')},
+            cancel_check=cancel_check
+        ),
+        STAGE_TIMEOUTS[STAGE_UPLOAD] or None
+    )
+    # ذخیره file_id برای ارسال‌های بعدی (فایل‌های چندبخشی کش نمی‌شوند)
+    if tier != TIER_SPLIT:
+        media = get_sent_media(sent_messages[0])
+        if media is not None:
+            store_cached_file(
+                video_id, clip_key(quality, clip), media.file_id, getattr(media, 'file_size', 0) or 0, sub_lang
+            )
+    return sent_messages
+
+async def deliver_file(query, file_path, video_id, quality, video_title, sub_lang="", reporter=None, clip=None,
+                       cancel_check=None):
+    """ آپلود فایل دانلودشده با مسیر مناسب حجم (Bot API / MTProto / چند بخش) و ذخیره file_id در کش.
+    مرحله آپلود مهلت STAGE_TIMEOUT_UPLOAD دارد.
+    """
+    if reporter is None:
+        reporter = ProgressReporter(query.message, video_title)
+    try:
+        reporter.set_status(f"📤 در حال آپلود فایل ({quality})...")
+        await upload_and_cache(
+            query.bot, query.message.chat.id, file_path, video_id, quality, video_title, reporter,
+            sub_lang, clip, cancel_check
+        )
+        await reporter.close()
         await query.message.delete()
     
     except Exception as send_error:
-        logger.error(f"خطا در ارسال فایل: {send_error}")
+        logger.error(f"خطا در ارسال فایل: {send_error!r}")
+        if isinstance(send_error, asyncio.TimeoutError):
+            send_error = "زمان آپلود بیش از حد مجاز طول کشید."
+        await reporter.close()
         await query.message.edit_caption(
             caption=f"<b>{video_title}</b>\n\n❌ خطا در آپلود: {send_error}",
             reply_markup=get_quality_keyboard()
         )
-    
-    finally:
-        # پاک کردن فایل
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except:
-                pass
-
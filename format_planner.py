@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+انتخاب یک فرمت مشخص از اطلاعات ویدیو پیش از دانلود
+"""
+
+import shutil
+import logging
+
+logger = logging.getLogger(__name__)
+
+# پسوندهایی که بدون تبدیل در تلگرام قابل پخش هستند
+PREFERRED_VIDEO_EXTS = ('mp4',)
+PREFERRED_AUDIO_EXTS = ('m4a', 'mp3')
+
+
+class NoFormatCandidates(Exception):
+    """ info هیچ فرمت قابل استفاده‌ای برای این کیفیت ندارد (نه اینکه همه فرمت‌ها بزرگ باشند) """
+
+
+def estimate_format_size(fmt: dict, duration):
+    """ تخمین حجم فرمت: filesize، سپس filesize_approx، سپس tbr * مدت """
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    tbr = fmt.get('tbr') or ((fmt.get('vbr') or 0) + (fmt.get('abr') or 0))
+    if tbr and duration:
+        # tbr بر حسب کیلوبیت بر ثانیه است
+        return int(tbr * 1000 / 8 * duration)
+    return None
+
+
+def _is_video_only(fmt):
+    return fmt.get('vcodec') not in (None, 'none') and fmt.get('acodec') == 'none'
+
+
+def _is_progressive(fmt):
+    return fmt.get('vcodec') not in (None, 'none') and fmt.get('acodec') not in (None, 'none')
+
+
+def _is_audio_only(fmt):
+    return fmt.get('vcodec') == 'none' and fmt.get('acodec') not in (None, 'none')
+
+
+def _best_audio_for_merge(formats, duration):
+    """ بهترین صوت m4a برای ادغام با ویدیوی بدون صدا """
+    audios = [f for f in formats if _is_audio_only(f) and f.get('ext') == 'm4a']
+    if not audios:
+        return None
+    return max(audios, key=lambda f: f.get('abr') or f.get('tbr') or 0)
+
+
+def _video_candidates(formats, duration, allow_merge):
+    candidates = []
+    for fmt in formats:
+        if not fmt.get('height') or not fmt.get('format_id'):
+            continue
+        if _is_progressive(fmt):
+            candidates.append({
+                'format': fmt['format_id'],
+                'format_ids': [fmt['format_id']],
+                'height': fmt['height'],
+                'width': fmt.get('width'),
+                'ext': fmt.get('ext'),
+                'estimated_size': estimate_format_size(fmt, duration),
+                'tbr': fmt.get('tbr') or 0,
+                'progressive': True,
+                'merge': False,
+            })
+    if allow_merge:
+        audio = _best_audio_for_merge(formats, duration)
+        if audio is not None:
+            audio_size = estimate_format_size(audio, duration)
+            for fmt in formats:
+                if not fmt.get('height') or not _is_video_only(fmt) or fmt.get('ext') != 'mp4':
+                    continue
+                video_size = estimate_format_size(fmt, duration)
+                candidates.append({
+                    'format': f"{fmt['format_id']}+{audio['format_id']}",
+                    'format_ids': [fmt['format_id'], audio['format_id']],
+                    'height': fmt['height'],
+                    'width': fmt.get('width'),
+                    'ext': 'mp4',
+                    'estimated_size': (video_size + audio_size) if video_size and audio_size else None,
+                    'tbr': (fmt.get('tbr') or 0) + (audio.get('tbr') or 0),
+                    'progressive': False,
+                    'merge': True,
+                })
+    return candidates
+
+
+def _audio_candidates(formats, duration):
+    candidates = []
+    for fmt in formats:
+        if not _is_audio_only(fmt) or not fmt.get('format_id'):
+            continue
+        candidates.append({
+            'format': fmt['format_id'],
+            'format_ids': [fmt['format_id']],
+            'height': None,
+            'width': None,
+            'ext': fmt.get('ext'),
+            'estimated_size': estimate_format_size(fmt, duration),
+            'tbr': fmt.get('abr') or fmt.get('tbr') or 0,
+            'progressive': True,
+            'merge': False,
+        })
+    return candidates
+
+
+def _pick(candidates, max_size):
+    """ اولین کاندید (به ترتیب اولویت) که حجمش جا می‌شود؛ کاندیدهای با حجم نامعلوم در آخر """
+    known = [c for c in candidates if c['estimated_size'] is not None]
+    for cand in known:
+        if max_size is None or cand['estimated_size'] <= max_size:
+            return cand
+    unknown = [c for c in candidates if c['estimated_size'] is None]
+    return unknown[0] if unknown else None
+
+
+def _scale_sizes(candidates, scale):
+    """ حالت برش: حجم تخمینی متناسب با طول بازه """
+    if scale >= 1:
+        return candidates
+    for cand in candidates:
+        if cand['estimated_size']:
+            cand['estimated_size'] = int(cand['estimated_size'] * scale)
+    return candidates
+
+
+def plan_format(info: dict, quality: str, max_size=None, allow_merge=None, clip_duration=None):
+    """ بهترین فرمت تکی که در محدودیت حجم جا شود را از روی info انتخاب می‌کند.
+    clip_duration (ثانیه) در حالت برش، حجم‌ها را به نسبت طول بازه کوچک می‌کند.
+    اگر هیچ فرمتی جا نشود None برمی‌گرداند؛ اگر اصلاً فرمتی برای این کیفیت نباشد NoFormatCandidates.
+    """
+    formats = info.get('formats') or []
+    duration = info.get('duration') or 0
+    if allow_merge is None:
+        allow_merge = shutil.which('ffmpeg') is not None
+    scale = min(1.0, clip_duration / duration) if clip_duration and duration else 1.0
+
+    if quality == "audio":
+        candidates = _scale_sizes(_audio_candidates(formats, duration), scale)
+        candidates.sort(
+            key=lambda c: (c['ext'] in PREFERRED_AUDIO_EXTS, c['tbr']),
+            reverse=True
+        )
+        if not candidates:
+            raise NoFormatCandidates(f"no audio formats among {len(formats)}")
+        return _pick(candidates, max_size)
+
+    target_height = int(quality)
+    candidates = _scale_sizes(_video_candidates(formats, duration, allow_merge), scale)
+    if not candidates:
+        raise NoFormatCandidates(f"no video formats among {len(formats)}")
+    within = [c for c in candidates if c['height'] <= target_height]
+    # ارتفاع بیشتر، سپس mp4، سپس progressive (یک اتصال، بدون ادغام)، سپس بیت‌ریت بیشتر
+    within.sort(
+        key=lambda c: (c['height'], c['ext'] in PREFERRED_VIDEO_EXTS, c['progressive'], c['tbr']),
+        reverse=True
+    )
+    plan = _pick(within, max_size)
+    if plan is None:
+        # اگر کیفیتی تا ارتفاع درخواستی وجود نداشت، کم‌حجم‌ترین کیفیت بالاتر
+        above = [c for c in candidates if c['height'] > target_height]
+        above.sort(key=lambda c: (c['height'], not c['progressive'], c['estimated_size'] or 0))
+        plan = _pick(above, max_size)
+    return plan
+
+
+def describe_plan(plan) -> str:
+    """ متن کوتاه برای لاگ """
+    if not plan:
+        return "بدون برنامه"
+    size = plan['estimated_size']
+    size_text = f"{size / (1024 * 1024):.1f}MB" if size else "نامعلوم"
+    return f"format={plan['format']} height={plan['height']} ext={plan['ext']} size≈{size_text}"
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+نشست HTTP ناهمگام مشترک (aiohttp) با استفاده مجدد از اتصال‌ها
+"""
+
+import asyncio
+import logging
+import aiohttp
+from config import HTTP_POOL_LIMIT, HTTP_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_lock = None
+
+
+def _get_session_lock() -> asyncio.Lock:
+    """ قفل در event loop در حال اجرا ساخته می‌شود (در پایتون 3.8/3.9 قفل به loop زمان ساخت بسته است) """
+    global _session_lock
+    if _session_lock is None:
+        _session_lock = asyncio.Lock()
+    return _session_lock
+
+
+async def get_http_session() -> aiohttp.ClientSession:
+    """ نشست مشترک؛ در اولین فراخوانی ساخته می‌شود """
+    global _session
+    if _session is not None and not _session.closed:
+        return _session
+    async with _get_session_lock():
+        if _session is None or _session.closed:
+            connector = aiohttp.TCPConnector(limit=HTTP_POOL_LIMIT, ttl_dns_cache=300)
+            _session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT)
+            )
+    return _session
+
+
+async def fetch_bytes(url: str, max_bytes: int) -> bytes:
+    """ دریافت کامل محتوای url؛ اگر بزرگ‌تر از max_bytes باشد ValueError """
+    session = await get_http_session()
+    async with session.get(url) as response:
+        response.raise_for_status()
+        if response.content_length and response.content_length > max_bytes:
+            raise ValueError(f"حجم پاسخ ({response.content_length}) بیشتر از حد مجاز است")
+        data = bytearray()
+        async for chunk in response.content.iter_chunked(64 * 1024):
+            data.extend(chunk)
+            if len(data) > max_bytes:
+                raise ValueError("حجم پاسخ بیشتر از حد مجاز است")
+        return bytes(data)
+
+
+async def close_http_session():
+    """ بستن نشست هنگام خاموش شدن ربات """
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logger.info("نشست HTTP بسته شد.")
+    _session = None
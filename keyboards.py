@@ -14,19 +14,24 @@ def get_main_keyboard() -> ReplyKeyboardMarkup:
     ]
     return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
 
-def get_quality_keyboard() -> InlineKeyboardMarkup:
-    """ کیبورد انتخاب کیفیت """
+def get_quality_keyboard(prefix: str = "q_") -> InlineKeyboardMarkup:
+    """ کیبورد انتخاب کیفیت (prefix برای دسته‌ها "bq_" است) """
     keyboard = [
-        [InlineKeyboardButton(text="🎵 MP3 (صوت)", callback_data="q_audio")],
+        [InlineKeyboardButton(text="🎵 MP3 (صوت)", callback_data=f"{prefix}audio")],
         [
-            InlineKeyboardButton(text="480p 📹", callback_data="q_480"),
-            InlineKeyboardButton(text="720p 📹", callback_data="q_720"),
+            InlineKeyboardButton(text="480p 📹", callback_data=f"{prefix}480"),
+            InlineKeyboardButton(text="720p 📹", callback_data=f"{prefix}720"),
         ],
-        [InlineKeyboardButton(text="1080p 📹", callback_data="q_1080")],
-        [InlineKeyboardButton(text="❌ لغو", callback_data="q_cancel")]
+        [InlineKeyboardButton(text="1080p 📹", callback_data=f"{prefix}1080")],
+        [InlineKeyboardButton(text="❌ لغو", callback_data=f"{prefix}cancel")]
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
+def get_job_cancel_keyboard(handle_id: str) -> InlineKeyboardMarkup:
+    """ دکمه لغو کار در حال اجرا """
+    keyboard = [[InlineKeyboardButton(text="❌ لغو", callback_data=f"job_cancel_{handle_id}")]]
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
 def get_subtitle_choice_keyboard() -> InlineKeyboardMarkup:
     keyboard = [
         [InlineKeyboardButton(text="🎬 بدون زیرنویس", callback_data="sub_none")],
@@ -47,10 +52,16 @@ def get_admin_main_keyboard() -> InlineKeyboardMarkup:
     keyboard = [
         [InlineKeyboardButton(text="🎁 ساخت ریدیم کد", callback_data="admin_gen_code")],
         [InlineKeyboardButton(text="📢 مدیریت اسپانسرها", callback_data="admin_manage_sponsors")],
+        [InlineKeyboardButton(text="📊 آمار سیستم", callback_data="admin_stats")],
         [InlineKeyboardButton(text="🔒 خروج از پنل", callback_data="admin_logout")]
     ]
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
+def get_admin_back_keyboard() -> InlineKeyboardMarkup:
+    """ کیبورد بازگشت به پنل ادمین """
+    keyboard = [[InlineKeyboardButton(text="🔙 بازگشت به پنل اصلی", callback_data="admin_main_menu")]]
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
 def get_sponsors_menu_keyboard() -> InlineKeyboardMarkup:
     """ کیبورد مدیریت اسپانسرها """
     sponsors = get_sponsors()
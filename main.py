@@ -15,7 +15,12 @@ from aiogram.enums import ParseMode
 from states import AdminStates, SponsorStates, RedeemStates, DownloadStates
 
 import config
-from database import initialize_database
+from database import initialize_database, get_users_count
+from storage import storage_manager
+from http_client import close_http_session
+from pyrogram_client import pyrogram_pool
+from asr_pool import asr_pool
+from delivery import bot_api_session
 from keyboards import get_main_keyboard
 from credits import (
     handle_referral_logic, get_referral_link, show_credits_status, 
@@ -23,13 +28,15 @@ from credits import (
 )
 from admin import (
     admin_login_entry, handle_username, handle_password,
-    admin_logout, admin_gen_code, start_redeem_callback, handle_redeem_code_input
+    admin_logout, admin_gen_code, start_redeem_callback, handle_redeem_code_input,
+    admin_show_stats
 )
 from sponsor import (
     sponsor_add_start, sponsor_receive_handle, sponsor_receive_link,
     sponsor_remove_select, sponsor_remove_confirm
 )
-from download import process_youtube_link, handle_quality_callback, DownloadState, handle_subtitle_choice_callback, handle_subtitle_language_callback
+from batch import is_batch_request, process_batch_request, handle_batch_quality_callback
+from download import process_youtube_link, handle_clip_range_input, handle_quality_callback, handle_job_cancel_callback, DownloadState, handle_subtitle_choice_callback, handle_subtitle_language_callback
 from force_join import force_join_handler, force_join_check_button
 
 logging.basicConfig(
@@ -44,7 +51,12 @@ if not config.BOT_TOKEN or config.BOT_TOKEN == "YOUR_BOT_TOKEN_HERE":
     logger.critical("2. داخل آن بنویسید: BOT_TOKEN=YOUR_TELEGRAM_BOT_TOKEN")
     sys.exit(1)
 
-bot = Bot(token=config.BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+# حالت سرور Bot API محلی: فایل‌ها با مسیر روی دیسک ارسال می‌شوند (بدون آپلود multipart)
+bot_session = bot_api_session()
+if bot_session is not None:
+    logger.info(f"استفاده از سرور Bot API محلی: {config.LOCAL_BOT_API_URL}")
+
+bot = Bot(token=config.BOT_TOKEN, session=bot_session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 router = Router()
@@ -103,6 +115,11 @@ async def cb_admin_gen_code(query: CallbackQuery):
     """ ساخت کد ریدیم """
     await admin_gen_code(query)
 
+@router.callback_query(F.data == "admin_stats")
+async def cb_admin_stats(query: CallbackQuery):
+    """ نمایش آمار سیستم """
+    await admin_show_stats(query)
+
 @router.callback_query(F.data == "admin_manage_sponsors")
 async def cb_admin_manage_sponsors(query: CallbackQuery):
     """ مدیریت اسپانسرها """
@@ -185,6 +202,16 @@ async def msg_redeem_code(message: Message, state: FSMContext):
 
 # --- YouTube Download Handlers ---
 
+@router.message(F.text.func(is_batch_request))
+async def msg_youtube_batch(message: Message, state: FSMContext):
+    """ پلی‌لیست یا چند لینک در یک پیام """
+    # چک عضویت اجباری
+    result = await force_join_handler(message, authenticated_users)
+    if result:
+        return
+    
+    await process_batch_request(message, state)
+
 @router.message(F.text.regexp(r'(?:https?://)?(?:www\.)?(?:youtube\.com/(?:watch\?v=|shorts/)|youtu\.be/)([a-zA-Z0-9_-]{11})'))
 async def msg_youtube_link(message: Message, state: FSMContext):
     """ پردازش لینک یوتیوب """
@@ -200,6 +227,16 @@ async def cb_quality(query: CallbackQuery, state: FSMContext):
     """ مدیریت انتخاب کیفیت """
     await handle_quality_callback(query, state)
 
+@router.callback_query(F.data.startswith("bq_"))
+async def cb_batch_quality(query: CallbackQuery, state: FSMContext):
+    """ انتخاب کیفیت دسته """
+    await handle_batch_quality_callback(query, state)
+
+@router.callback_query(F.data.startswith("job_cancel_"))
+async def cb_job_cancel(query: CallbackQuery):
+    """ لغو کار در حال اجرا """
+    await handle_job_cancel_callback(query)
+
 @router.callback_query(lambda c: c.data in ("sub_yes","sub_none","sub_back_quality"))
 async def cb_subtitle_choice(query: CallbackQuery, state: FSMContext):
     await handle_subtitle_choice_callback(query, state)
@@ -231,7 +268,9 @@ async def msg_download_youtube(message: Message):
     await message.answer(
         " دانلود یوتیوب\n\n"
         "لطفاً لینک یوتیوب را برای من ارسال کنید.\n\n"
-        "⚠️ توجه: ویدیوها باید کمتر از 30 دقیقه باشند."
+        "✂️ برای دریافت بخشی از ویدیو، بازه را کنار لینک بنویسید (مثلاً 1:30-4:00).\n"
+        "📚 لینک پلی‌لیست یا چند لینک در یک پیام هم پذیرفته می‌شود.\n\n"
+        "⚠️ توجه: ویدیوها (یا بازه انتخابی) باید کمتر از 30 دقیقه باشند."
     )
 
 # --- Force Join Handler ---
@@ -241,6 +280,14 @@ async def cb_force_join_check(query: CallbackQuery):
     """ بررسی مجدد عضویت """
     await force_join_check_button(query, authenticated_users)
 
+# --- بازه برش ---
+
+# بعد از دکمه‌های منو ثبت می‌شود تا انتظار بازه آن‌ها را نپوشاند
+@router.message(DownloadStates.waiting_for_clip_range, F.text)
+async def msg_clip_range(message: Message, state: FSMContext):
+    """ دریافت بازه زمانی برای ویدیوی طولانی """
+    await handle_clip_range_input(message, state)
+
 # --- سایر پیام‌ها ---
 
 @router.message()
@@ -261,6 +308,15 @@ async def main():
     # آماده‌سازی دیتابیس
     initialize_database()
     
+    # پاک‌سازی فایل‌های باقی‌مانده از اجرای قبلی
+    storage_manager.sweep_orphans()
+    
+    # راه‌اندازی نشست‌های Pyrogram پیش از دریافت اولین درخواست
+    await pyrogram_pool.start()
+    
+    # پروسه‌های ASR (بارگذاری مدل‌ها هم‌زمان با شروع ربات)
+    asr_pool.start()
+    
     # ثبت روتر
     dp.include_router(router)
     
@@ -277,6 +333,9 @@ async def main():
         logger.critical(traceback.format_exc())
     finally:
         await bot.session.close()
+        await close_http_session()
+        await pyrogram_pool.stop()
+        await asr_pool.stop()
         logger.info("ربات متوقف شد.")
 
 if __name__ == '__main__':
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+پیش‌دانلود (prefetch): هم‌زمان با انتخاب کیفیت توسط کاربر، محتمل‌ترین کیفیت با اولویت پایین
+دانلود می‌شود تا اگر انتخاب کاربر همان بود، به دانلود در جریان متصل شود.
+"""
+
+import asyncio
+import logging
+from config import PREFETCH_QUALITY, PREFETCH_MAX_ACTIVE, PREFETCH_TTL
+from database import increment_counter, get_counters
+from format_planner import plan_format, NoFormatCandidates
+from delivery import max_deliverable_size
+
+logger = logging.getLogger(__name__)
+
+QUALITY_PICK_PREFIX = "quality_pick_"
+
+
+class _Prefetch:
+    def __init__(self, user_id, video_id, quality):
+        self.user_id = user_id
+        self.video_id = video_id
+        self.quality = quality
+        self.claimed = False
+        self.task = None
+        self.timer = None
+
+
+# user_id -> _Prefetch (برای هر کاربر حداکثر یک پیش‌دانلود)
+_active = {}
+
+
+def record_quality_pick(quality: str):
+    """ ثبت انتخاب کیفیت برای آمار انتخاب خودکار """
+    increment_counter(f"{QUALITY_PICK_PREFIX}{quality}")
+
+
+def choose_prefetch_quality(info: dict, clip=None):
+    """ کیفیت تنظیم‌شده، یا پرانتخاب‌ترین کیفیت تاریخی (در نبود آمار: صوت)؛ اگر قابل تحویل نباشد None """
+    quality = PREFETCH_QUALITY
+    if quality == "auto":
+        picks = get_counters(QUALITY_PICK_PREFIX)
+        if picks:
+            quality = max(picks, key=picks.get)[len(QUALITY_PICK_PREFIX):]
+        else:
+            quality = "audio"
+    clip_duration = (clip[1] - clip[0]) if clip else None
+    if not info.get('formats'):
+        return None
+    try:
+        if plan_format(info, quality, max_deliverable_size(), clip_duration=clip_duration) is None:
+            return None
+    except NoFormatCandidates:
+        return None
+    return quality
+
+
+def start_prefetch(user_id, video_id: str, quality: str, open_download):
+    """ شروع پیش‌دانلود؛ open_download() باید context manager دانلود پس‌زمینه (shared_download) بدهد """
+    cancel_prefetch(user_id)
+    if len(_active) >= PREFETCH_MAX_ACTIVE:
+        increment_counter("prefetch_skipped")
+        return
+    prefetch = _Prefetch(user_id, video_id, quality)
+    _active[user_id] = prefetch
+    prefetch.task = asyncio.ensure_future(_hold(prefetch, open_download))
+    prefetch.timer = asyncio.get_event_loop().call_later(PREFETCH_TTL, _expire, prefetch)
+    increment_counter("prefetch_started")
+    logger.info(f"پیش‌دانلود {video_id} ({quality}) برای کاربر {user_id}")
+
+
+async def _hold(prefetch: _Prefetch, open_download):
+    """ نگه داشتن یک ارجاع به دانلود تا انتخاب کاربر یا پایان مهلت """
+    try:
+        async with open_download() as (file_path, error_msg):
+            if error_msg or not file_path:
+                return
+            # فایل آماده است؛ تا انتخاب کاربر یا پایان مهلت روی دیسک می‌ماند
+            while not prefetch.claimed:
+                await asyncio.sleep(1)
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        logger.warning(f"خطا در پیش‌دانلود {prefetch.video_id}: {e}")
+    finally:
+        if _active.get(prefetch.user_id) is prefetch:
+            del _active[prefetch.user_id]
+        if prefetch.timer is not None:
+            prefetch.timer.cancel()
+
+
+def _expire(prefetch: _Prefetch):
+    if not prefetch.claimed and _active.get(prefetch.user_id) is prefetch:
+        increment_counter("prefetch_expired")
+        prefetch.task.cancel()
+
+
+def claim_prefetch(user_id, video_id: str, quality: str):
+    """ فراخوانی درست پیش از shared_download برای کیفیت انتخاب‌شده.
+    اگر همان کیفیت در حال پیش‌دانلود باشد، ارجاع پیش‌دانلود پس از اتصال کاربر آزاد می‌شود؛ در غیر این صورت لغو می‌شود.
+    """
+    prefetch = _active.get(user_id)
+    if prefetch is None or prefetch.video_id != video_id:
+        return False
+    if prefetch.quality == quality:
+        increment_counter("prefetch_hit")
+        prefetch.claimed = True
+        # ارجاع کاربر در همین گام event loop ثبت می‌شود و لغو نگه‌دارنده دانلود را متوقف نمی‌کند
+        asyncio.get_event_loop().call_soon(prefetch.task.cancel)
+        return True
+    increment_counter("prefetch_miss")
+    _cancel(prefetch)
+    return False
+
+
+def cancel_prefetch(user_id):
+    """ لغو پیش‌دانلود کاربر (لینک جدید، لغو یا ارسال از کش) """
+    prefetch = _active.get(user_id)
+    if prefetch is not None:
+        increment_counter("prefetch_cancelled")
+        _cancel(prefetch)
+
+
+def _cancel(prefetch: _Prefetch):
+    if _active.get(prefetch.user_id) is prefetch:
+        del _active[prefetch.user_id]
+    prefetch.task.cancel()
+
+
+def get_prefetch_stats():
+    counters = get_counters("prefetch_")
+    hits = counters.get("prefetch_hit", 0)
+    misses = counters.get("prefetch_miss", 0)
+    return {
+        "active": len(_active),
+        "started": counters.get("prefetch_started", 0),
+        "hits": hits,
+        "misses": misses,
+        "expired": counters.get("prefetch_expired", 0),
+        "cancelled": counters.get("prefetch_cancelled", 0),
+        "skipped": counters.get("prefetch_skipped", 0),
+        "hit_ratio": (hits / (hits + misses)) if (hits + misses) else 0.0,
+    }
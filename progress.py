@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+گزارش زنده پیشرفت دانلود/آپلود در کپشن پیام با محدودیت نرخ ویرایش
+"""
+
+import time
+import asyncio
+import logging
+import threading
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from config import PROGRESS_EDIT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# زودترین زمان مجاز ویرایش بعدی برای هر چت (مشترک بین همه گزارشگرها)؛ فقط روی event loop تغییر می‌کند
+_chat_next_edit = {}
+# از این تعداد چت بیشتر شود، زمان‌های گذشته حذف می‌شوند (نبودن کلید همان «بدون محدودیت» است)
+_CHAT_PRUNE_THRESHOLD = 256
+
+
+def _set_next_edit(chat_id, at: float):
+    _chat_next_edit[chat_id] = at
+    if len(_chat_next_edit) > _CHAT_PRUNE_THRESHOLD:
+        now = time.monotonic()
+        for key in [key for key, value in _chat_next_edit.items() if value <= now]:
+            del _chat_next_edit[key]
+
+
+def format_size(num_bytes) -> str:
+    """ نمایش خوانای حجم """
+    if not num_bytes:
+        return "0B"
+    for unit in ("B", "KB", "MB", "GB"):
+        if num_bytes < 1024 or unit == "GB":
+            return f"{num_bytes:.1f}{unit}" if unit != "B" else f"{int(num_bytes)}B"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f}GB"
+
+
+def format_eta(seconds) -> str:
+    """ نمایش زمان باقی‌مانده به صورت m:ss """
+    if seconds is None:
+        return "?"
+    seconds = int(seconds)
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+def progress_bar(percent: float, width: int = 10) -> str:
+    filled = int(round(width * min(max(percent, 0.0), 100.0) / 100))
+    return "▰" * filled + "▱" * (width - filled)
+
+
+class ProgressReporter:
+    """ وضعیت را از هر thread می‌گیرد، به‌روزرسانی‌ها را ادغام می‌کند و حداکثر هر
+    PROGRESS_EDIT_INTERVAL ثانیه یک بار (برای هر چت) کپشن پیام را روی event loop ویرایش می‌کند.
+    """
+
+    def __init__(self, message, title: str, loop=None, min_interval: float = PROGRESS_EDIT_INTERVAL,
+                 reply_markup=None):
+        self.message = message
+        self.title = title
+        # کیبورد پیام در هر ویرایش دوباره فرستاده می‌شود (مثلاً دکمه لغو)
+        self.reply_markup = reply_markup
+        # پیام متنی (بدون عکس) با edit_text ویرایش می‌شود
+        self._text_mode = not getattr(message, 'photo', None)
+        self.chat_id = message.chat.id
+        self.loop = loop or asyncio.get_event_loop()
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._pending_text = None
+        self._scheduled = False
+        self._closed = False
+        self._last_text = None
+        self._flush_handle = None
+        self._upload_started = None
+
+    # --- ورودی‌ها (thread-safe) ---
+
+    def set_status(self, text: str):
+        """ ثبت متن وضعیت جدید؛ فقط آخرین متن ارسال می‌شود """
+        with self._lock:
+            if self._closed:
+                return
+            self._pending_text = text
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.loop.call_soon_threadsafe(self._schedule_flush)
+
+    def ytdlp_hook(self, d: dict):
+        """ progress_hook برای yt-dlp (از thread دانلود فراخوانی می‌شود) """
+        if d.get('status') == 'retrying':
+            self.set_status(f"🔁 خطای موقت؛ تلاش {d.get('attempt')} تا {int(d.get('delay') or 0)} ثانیه دیگر...")
+            return
+        if d.get('status') != 'downloading':
+            return
+        downloaded = d.get('downloaded_bytes') or 0
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        self.set_status(self._format_line("⏬ در حال دانلود", downloaded, total, d.get('speed'), d.get('eta')))
+
+    async def pyrogram_progress(self, current: int, total: int):
+        """ callback پیشرفت آپلود Pyrogram """
+        now = time.monotonic()
+        if self._upload_started is None:
+            self._upload_started = now
+        elapsed = now - self._upload_started
+        speed = current / elapsed if elapsed > 0 else None
+        eta = (total - current) / speed if speed else None
+        self.set_status(self._format_line("📤 در حال آپلود", current, total, speed, eta))
+
+    def _format_line(self, label, current, total, speed, eta) -> str:
+        parts = [label]
+        if total:
+            percent = current * 100.0 / total
+            parts.append(f"{progress_bar(percent)} {percent:.0f}%")
+            parts.append(f"{format_size(current)}/{format_size(total)}")
+        else:
+            parts.append(format_size(current))
+        if speed:
+            parts.append(f"⚡ {format_size(speed)}/s")
+        if eta is not None:
+            parts.append(f"⏱ {format_eta(eta)}")
+        return " • ".join(parts)
+
+    # --- اجرا روی event loop ---
+
+    def _schedule_flush(self):
+        delay = max(0.0, _chat_next_edit.get(self.chat_id, 0.0) - time.monotonic())
+        self._flush_handle = self.loop.call_later(delay, lambda: asyncio.ensure_future(self._flush()))
+
+    async def _flush(self):
+        now = time.monotonic()
+        next_allowed = _chat_next_edit.get(self.chat_id, 0.0)
+        if now < next_allowed:
+            # گزارشگر دیگری در همین چت زودتر ویرایش کرده است
+            self._flush_handle = self.loop.call_later(
+                next_allowed - now, lambda: asyncio.ensure_future(self._flush())
+            )
+            return
+        with self._lock:
+            text = self._pending_text
+            self._pending_text = None
+            self._scheduled = False
+            if self._closed or text is None or text == self._last_text:
+                return
+        _set_next_edit(self.chat_id, now + self.min_interval)
+        await self._edit(text)
+
+    async def _edit(self, text: str):
+        caption = f"<b>{self.title}</b>\n\n{text}"
+        try:
+            if self._text_mode:
+                await self.message.edit_text(caption, reply_markup=self.reply_markup)
+            else:
+                await self.message.edit_caption(caption=caption, reply_markup=self.reply_markup)
+            self._last_text = text
+        except TelegramRetryAfter as e:
+            _set_next_edit(self.chat_id, time.monotonic() + e.retry_after)
+            self.set_status(text)
+        except TelegramBadRequest as e:
+            err_text = str(e).lower()
+            if 'not modified' in err_text:
+                self._last_text = text
+            elif 'no caption' in err_text:
+                # پیش‌نمایش بدون عکس ارسال شده بود
+                self._text_mode = True
+                try:
+                    await self.message.edit_text(caption, reply_markup=self.reply_markup)
+                    self._last_text = text
+                except Exception as edit_error:
+                    logger.warning(f"خطا در ویرایش پیام پیشرفت: {edit_error}")
+            else:
+                logger.warning(f"خطا در ویرایش پیام پیشرفت: {e}")
+        except Exception as e:
+            logger.warning(f"خطا در ویرایش پیام پیشرفت: {e}")
+
+    async def finish(self, text: str):
+        """ توقف گزارش و نمایش متن نهایی (بدون کیبورد) """
+        await self.close()
+        self.reply_markup = None
+        await self._edit(text)
+
+    async def close(self):
+        """ توقف گزارش؛ ویرایش‌های در انتظار لغو می‌شوند تا با پیام‌های بعدی تداخل نکنند """
+        with self._lock:
+            self._closed = True
+            self._pending_text = None
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
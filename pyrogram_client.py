@@ -3,44 +3,314 @@
 کلاینت Pyrogram برای آپلود فایل‌های بزرگ
 """
 
+import os
+import math
+import asyncio
+import mimetypes
 import logging
-from pyrogram import Client
-from config import BOT_TOKEN, API_ID, API_HASH
+from contextlib import asynccontextmanager
+from pyrogram import Client, raw, types
+from config import (
+    BOT_TOKEN, API_ID, API_HASH,
+    PYROGRAM_SESSIONS, UPLOAD_PARALLEL_PARTS, PYROGRAM_HEALTH_INTERVAL
+)
 
 logger = logging.getLogger(__name__)
 
-# کلاینت Pyrogram برای آپلود فایل‌های بزرگ
-pyrogram_client = None
+# اندازه هر part در آپلود MTProto (باید ثابت و مضربی از 1KB باشد)
+UPLOAD_PART_SIZE = 512 * 1024
+# تعداد تلاش برای هر part پیش از شکست کل آپلود
+PART_RETRIES = 3
+# پسوندهایی که mimetypes همه سیستم‌ها نمی‌شناسد؛ webm بسته به نوع رسانه صوت یا ویدیوست
+_MEDIA_MIME_TYPES = {
+    '.mp4': 'video/mp4', '.m4a': 'audio/mp4', '.mp3': 'audio/mpeg', '.mkv': 'video/x-matroska',
+    '.opus': 'audio/ogg', '.ogg': 'audio/ogg',
+}
 
-async def get_pyrogram_client():
-    """ دریافت یا ساخت کلاینت Pyrogram """
-    global pyrogram_client
-    
-    if pyrogram_client is None:
+
+class _PoolSlot:
+    """ یک نشست MTProto در استخر به همراه تعداد آپلودهای در جریان آن """
+
+    def __init__(self, index: int):
+        self.index = index
+        self.client = None
+        self.load = 0
+        self._lock = None
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        # قفل در event loop در حال اجرا ساخته می‌شود (در پایتون 3.8/3.9 قفل به loop زمان ساخت بسته است)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    @property
+    def healthy(self):
+        return self.client is not None and self.client.is_connected
+
+
+class PyrogramPool:
+    """ استخر نشست‌های Pyrogram: راه‌اندازی یک‌باره زیر قفل، انتخاب کم‌بارترین نشست
+    برای هر آپلود، بررسی سلامت دوره‌ای و اتصال مجدد.
+    """
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._slots = [_PoolSlot(i) for i in range(self.size)]
+        self._lock = None
+        self._started = False
+        self._health_task = None
+
+    async def start(self):
+        """ راه‌اندازی همه نشست‌ها (فراخوانی‌های هم‌زمان فقط یک بار اجرا می‌شوند) """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._started:
+                return
+            await asyncio.gather(*(self._connect(slot) for slot in self._slots))
+            self._started = True
+            if self._health_task is None and PYROGRAM_HEALTH_INTERVAL > 0:
+                self._health_task = asyncio.ensure_future(self._health_loop())
+            ready = sum(1 for slot in self._slots if slot.healthy)
+            logger.info(f"✅ استخر Pyrogram: {ready}/{self.size} نشست آماده")
+
+    async def _connect(self, slot: _PoolSlot):
+        async with slot.lock:
+            if slot.client is not None:
+                try:
+                    await slot.client.stop()
+                except Exception:
+                    pass
+            try:
+                slot.client = Client(
+                    f"bot_session_{slot.index}",
+                    api_id=int(API_ID),
+                    api_hash=API_HASH,
+                    bot_token=BOT_TOKEN,
+                    in_memory=True
+                )
+                await slot.client.start()
+            except Exception as e:
+                slot.client = None
+                logger.error(f"❌ خطا در راه‌اندازی نشست {slot.index} Pyrogram: {e}")
+
+    async def _check(self, slot: _PoolSlot):
+        """ یک درخواست سبک؛ در صورت خطا نشست دوباره ساخته می‌شود """
+        if slot.healthy:
+            try:
+                await asyncio.wait_for(slot.client.invoke(raw.functions.help.GetConfig()), 15)
+                return
+            except Exception as e:
+                logger.warning(f"نشست {slot.index} Pyrogram پاسخ نداد: {e}")
+        if slot.load == 0:
+            await self._connect(slot)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(PYROGRAM_HEALTH_INTERVAL)
+            for slot in self._slots:
+                try:
+                    await self._check(slot)
+                except Exception as e:
+                    logger.error(f"خطا در بررسی سلامت نشست {slot.index}: {e}")
+
+    @asynccontextmanager
+    async def session(self):
+        """ کم‌بارترین نشست سالم (یا None اگر هیچ نشستی در دسترس نباشد) """
+        if not self._started:
+            await self.start()
+        slots = sorted(self._slots, key=lambda s: s.load)
+        slot = next((s for s in slots if s.healthy), None)
+        if slot is None:
+            # تلاش برای اتصال مجدد کم‌بارترین نشست
+            slot = slots[0]
+            await self._connect(slot)
+            if not slot.healthy:
+                yield None
+                return
+        slot.load += 1
         try:
-            pyrogram_client = Client(
-                "bot_session",
-                api_id=int(API_ID),
-                api_hash=API_HASH,
-                bot_token=BOT_TOKEN,
-                in_memory=True
-            )
-            await pyrogram_client.start()
-            logger.info("✅ Pyrogram client started successfully")
-        except Exception as e:
-            logger.error(f"❌ خطا در راه‌اندازی Pyrogram: {e}")
-            return None
-    
-    return pyrogram_client
+            yield slot.client
+        finally:
+            slot.load -= 1
+
+    def stats(self):
+        return {
+            "sessions": self.size,
+            "healthy": sum(1 for slot in self._slots if slot.healthy),
+            "uploads": sum(slot.load for slot in self._slots),
+        }
+
+    async def stop(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for slot in self._slots:
+            if slot.client is not None:
+                try:
+                    await slot.client.stop()
+                except Exception as e:
+                    logger.error(f"خطا در بستن Pyrogram: {e}")
+                slot.client = None
+        self._started = False
+        logger.info("Pyrogram client stopped")
+
+
+pyrogram_pool = PyrogramPool(PYROGRAM_SESSIONS)
+
+
+async def get_pyrogram_client():
+    """ یک کلاینت از استخر (بدون ثبت بار؛ برای آپلود از pyrogram_pool.session استفاده کنید) """
+    async with pyrogram_pool.session() as client:
+        return client
 
 async def close_pyrogram_client():
-    """ بستن کلاینت Pyrogram """
-    global pyrogram_client
-    if pyrogram_client:
+    """ بستن همه نشست‌های Pyrogram """
+    await pyrogram_pool.stop()
+
+
+async def upload_file_parallel(client, file_path, file_name, progress=None, parallel_parts=UPLOAD_PARALLEL_PARTS):
+    """ آپلود فایل با SaveBigFilePart و چند part هم‌زمان روی یک نشست؛ خروجی InputFileBig است """
+    file_size = os.path.getsize(file_path)
+    total_parts = max(1, math.ceil(file_size / UPLOAD_PART_SIZE))
+    file_id = client.rnd_id()
+    loop = asyncio.get_event_loop()
+    next_part = 0
+    uploaded = 0
+
+    def read_part(fd, index):
+        return os.pread(fd, UPLOAD_PART_SIZE, index * UPLOAD_PART_SIZE)
+
+    async def worker(fd):
+        nonlocal next_part, uploaded
+        while next_part < total_parts:
+            index = next_part
+            next_part += 1
+            data = await loop.run_in_executor(None, read_part, fd, index)
+            await _save_big_part(client, file_id, index, total_parts, data)
+            uploaded += len(data)
+            if progress is not None:
+                await progress(uploaded, file_size)
+
+    fd = os.open(file_path, os.O_RDONLY)
+    try:
+        workers = [asyncio.ensure_future(worker(fd)) for _ in range(max(1, min(parallel_parts, total_parts)))]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+    finally:
+        os.close(fd)
+    return raw.types.InputFileBig(id=file_id, parts=total_parts, name=file_name)
+
+
+async def upload_stream(client, chunks, file_name, progress=None, total_hint=None,
+                        parallel_parts=UPLOAD_PARALLEL_PARTS):
+    """ آپلود یک جریان بایت (async iterator از partهای UPLOAD_PART_SIZE) بدون دانستن حجم نهایی.
+    تا part آخر file_total_parts=-1 فرستاده می‌شود (آپلود جریانی تلگرام) و حداکثر parallel_parts
+    part هم‌زمان در جریان است. خروجی InputFileBig است.
+    """
+    file_id = client.rnd_id()
+    part_index = 0
+    uploaded = 0
+    pending = None
+    in_flight = set()
+    slots = asyncio.Semaphore(max(1, parallel_parts))
+
+    async def send(index, data):
+        nonlocal uploaded
         try:
-            await pyrogram_client.stop()
-            pyrogram_client = None
-            logger.info("Pyrogram client stopped")
+            await _save_big_part(client, file_id, index, -1, data)
+        finally:
+            slots.release()
+        uploaded += len(data)
+        if progress is not None:
+            await progress(uploaded, max(total_hint or 0, uploaded))
+
+    try:
+        async for chunk in chunks:
+            if pending is not None:
+                await slots.acquire()
+                in_flight.add(asyncio.ensure_future(send(part_index, pending)))
+                # خطای partهای تمام‌شده زودتر گزارش می‌شود
+                for task in [t for t in in_flight if t.done()]:
+                    in_flight.discard(task)
+                    task.result()
+                part_index += 1
+            pending = chunk
+        if in_flight:
+            await asyncio.gather(*in_flight)
+            in_flight.clear()
+    except BaseException:
+        for task in in_flight:
+            task.cancel()
+        raise
+    if pending is None:
+        raise ValueError("جریان ورودی خالی بود")
+    # part آخر پس از همه partهای قبلی با تعداد نهایی partها
+    await _save_big_part(client, file_id, part_index, part_index + 1, pending)
+    uploaded += len(pending)
+    if progress is not None:
+        await progress(uploaded, uploaded)
+    return raw.types.InputFileBig(id=file_id, parts=part_index + 1, name=file_name)
+
+async def _save_big_part(client, file_id, part_index, total_parts, data):
+    """ ارسال یک part با SaveBigFilePart (با چند تلاش مجدد) """
+    for attempt in range(PART_RETRIES):
+        try:
+            await client.invoke(
+                raw.functions.upload.SaveBigFilePart(
+                    file_id=file_id,
+                    file_part=part_index,
+                    file_total_parts=total_parts,
+                    bytes=data
+                )
+            )
+            return
         except Exception as e:
-            logger.error(f"خطا در بستن Pyrogram: {e}")
+            if attempt == PART_RETRIES - 1:
+                raise
+            logger.warning(f"خطا در آپلود part {part_index}: {e}؛ تلاش مجدد")
+            await asyncio.sleep(1 + attempt)
+
+def media_mime_type(kind: str, file_name: str) -> str:
+    """ نوع MIME از پسوند فایل؛ در نبود پسوند شناخته‌شده mp4 همان نوع رسانه """
+    ext = os.path.splitext(file_name)[1].lower()
+    if ext == '.webm':
+        return f"{kind}/webm"
+    return _MEDIA_MIME_TYPES.get(ext) or mimetypes.guess_type(file_name)[0] or f"{kind}/mp4"
+
 
+async def send_uploaded_media(client, chat_id, input_file, kind, file_name, caption="",
+                              duration=0, width=0, height=0, title=None):
+    """ ارسال فایل آپلودشده (InputFile خام) به‌صورت ویدیو یا صوت و برگرداندن Message پایروگرام """
+    mime_type = media_mime_type(kind, file_name)
+    if kind == "audio":
+        attributes = [raw.types.DocumentAttributeAudio(duration=int(duration or 0), title=title)]
+    else:
+        attributes = [raw.types.DocumentAttributeVideo(
+            duration=int(duration or 0), w=int(width or 0), h=int(height or 0), supports_streaming=True
+        )]
+    attributes.append(raw.types.DocumentAttributeFilename(file_name=file_name))
+    result = await client.invoke(
+        raw.functions.messages.SendMedia(
+            peer=await client.resolve_peer(chat_id),
+            media=raw.types.InputMediaUploadedDocument(
+                mime_type=mime_type,
+                file=input_file,
+                attributes=attributes
+            ),
+            message=caption,
+            random_id=client.rnd_id()
+        )
+    )
+    users = {u.id: u for u in getattr(result, 'users', [])}
+    chats = {c.id: c for c in getattr(result, 'chats', [])}
+    for update in getattr(result, 'updates', []):
+        if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+            return await types.Message._parse(client, update.message, users, chats)  # pylint: disable=protected-access
+    return None
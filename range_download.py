@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+دانلود چنداتصالی فایل‌های progressive با درخواست‌های موازی HTTP Range
+"""
+
+import time
+import logging
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_EXCEPTION
+
+from cancellation import JobCancelled
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK = 256 * 1024
+MIN_RANGE_SIZE = 1024 * 1024  # تکه‌های کوچک‌تر از این ارزش اتصال جدا ندارند
+
+
+class RangeNotSupported(Exception):
+    """ سرور درخواست Range را پشتیبانی نمی‌کند """
+
+
+def split_ranges(total_size: int, parts: int):
+    """ تقسیم [0, total_size) به حداکثر parts بازه پیوسته (شامل انتها) """
+    parts = max(1, min(parts, total_size // MIN_RANGE_SIZE or 1))
+    step = total_size // parts
+    ranges = []
+    start = 0
+    for i in range(parts):
+        end = total_size - 1 if i == parts - 1 else start + step - 1
+        ranges.append((start, end))
+        start = end + 1
+    return ranges
+
+
+class _Aborted(Exception):
+    """ بازه دیگری شکست خورده و بقیه باید متوقف شوند """
+
+
+class _Progress:
+    """ جمع‌آوری thread-safe بایت‌های دریافتی و گزارش به شکل progress_hook در yt-dlp """
+
+    def __init__(self, total_size, hook, filename):
+        self.total = total_size
+        self.hook = hook
+        self.filename = filename
+        self.downloaded = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, nbytes):
+        with self._lock:
+            self.downloaded += nbytes
+            downloaded = self.downloaded
+        if self.hook is None:
+            return
+        elapsed = time.monotonic() - self.started
+        speed = downloaded / elapsed if elapsed > 0 else None
+        self.hook({
+            'status': 'downloading',
+            'filename': self.filename,
+            'downloaded_bytes': downloaded,
+            'total_bytes': self.total,
+            'speed': speed,
+            'eta': (self.total - downloaded) / speed if speed else None,
+        })
+
+
+def _fetch_range(url, dest, start, end, headers, progress, retries, timeout, cancel_check):
+    """ دریافت یک بازه و نوشتن در جایگاه خودش؛ در صورت قطع اتصال از همان نقطه ادامه می‌دهد """
+    position = start
+    attempt = 0
+    while position <= end:
+        request = urllib.request.Request(url, headers=dict(headers or {}))
+        request.add_header('Range', f'bytes={position}-{end}')
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                if response.status != 206:
+                    raise RangeNotSupported(f"HTTP {response.status}")
+                with open(dest, 'r+b') as f:
+                    f.seek(position)
+                    while position <= end:
+                        cancel_check()
+                        chunk = response.read(min(READ_CHUNK, end - position + 1))
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        position += len(chunk)
+                        progress.add(len(chunk))
+            if position <= end:
+                raise ConnectionError("اتصال پیش از پایان بازه بسته شد")
+        except (RangeNotSupported, _Aborted, JobCancelled):
+            # لغو کار تلاش مجدد ندارد
+            raise
+        except Exception as e:
+            attempt += 1
+            if attempt > retries:
+                raise
+            logger.warning(f"قطع دریافت بازه {start}-{end} در {position}: {e}؛ تلاش مجدد {attempt}")
+            time.sleep(min(2 ** attempt * 0.5, 8))
+
+
+def download_ranges_parallel(url: str, dest: str, total_size: int, connections: int = 4,
+                             headers=None, progress_hook=None, retries: int = 5,
+                             timeout: float = 30, cancel_check=None):
+    """ دانلود url در dest با connections اتصال موازی (هر کدام یک بازه Range).
+    total_size باید حجم دقیق فایل باشد. اگر سرور Range را پشتیبانی نکند RangeNotSupported می‌دهد.
+    """
+    ranges = split_ranges(total_size, connections)
+    with open(dest, 'wb') as f:
+        f.truncate(total_size)
+    progress = _Progress(total_size, progress_hook, dest)
+    stop = threading.Event()
+
+    def check():
+        if stop.is_set():
+            raise _Aborted()
+        if cancel_check is not None:
+            cancel_check()
+
+    with ThreadPoolExecutor(max_workers=len(ranges), thread_name_prefix="range") as pool:
+        futures = [
+            pool.submit(_fetch_range, url, dest, start, end, headers, progress, retries, timeout, check)
+            for start, end in ranges
+        ]
+        done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+        failed = [f for f in done if f.exception() is not None]
+        if failed:
+            stop.set()
+            wait(futures)
+            # خطای اصلی (مثلاً لغو کار) بر _Aborted بازه‌های متوقف‌شده مقدم است
+            errors = [f.exception() for f in futures if f.exception() is not None]
+            raise next((e for e in errors if not isinstance(e, _Aborted)), errors[0])
+    if progress_hook is not None:
+        progress_hook({
+            'status': 'finished',
+            'filename': dest,
+            'downloaded_bytes': total_size,
+            'total_bytes': total_size,
+        })
+    return dest
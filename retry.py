@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+دسته‌بندی خطاهای yt-dlp و محاسبه فاصله تلاش مجدد (backoff نمایی با jitter)
+"""
+
+import re
+import random
+from config import RETRY_BASE_DELAY, RETRY_RATE_LIMIT_DELAY, RETRY_MAX_DELAY
+
+PERMANENT = "permanent"
+TRANSIENT = "transient"
+RATE_LIMITED = "rate_limited"
+
+# (الگو، پیام برای کاربر)؛ تلاش مجدد برای این خطاها بی‌فایده است
+_PERMANENT_PATTERNS = [
+    (r"private video|video is private", "این ویدیو خصوصی است."),
+    (r"has been removed|video unavailable|no longer available|account .* terminated",
+     "این ویدیو حذف شده یا در دسترس نیست."),
+    (r"not (?:made )?available in your country|geo.?restrict|blocked it in your country",
+     "این ویدیو در منطقه سرور ربات در دسترس نیست."),
+    (r"copyright", "این ویدیو به دلیل کپی‌رایت در دسترس نیست."),
+    (r"members.only|join this channel|requires payment|only available for premium",
+     "این ویدیو فقط برای اعضا یا مشترکین قابل مشاهده است."),
+    (r"confirm your age|age.restricted|inappropriate for some users",
+     "این ویدیو محدودیت سنی دارد."),
+    (r"live event will begin|premieres in|is not a valid url|unsupported url",
+     "این لینک قابل دانلود نیست."),
+]
+
+_RATE_LIMIT_PATTERN = re.compile(r"http error 429|too many requests|rate.?limit|not a bot")
+
+# فرمت خاص موجود نیست؛ فرمت بعدی را باید امتحان کرد (نه تلاش مجدد همان فرمت)
+_FORMAT_UNAVAILABLE_PATTERN = re.compile(r"requested format is not available|format not available")
+
+
+def classify_error(error) -> str:
+    """ PERMANENT / TRANSIENT / RATE_LIMITED برای یک خطای yt-dlp (یا متن آن) """
+    text = str(error).lower()
+    if _RATE_LIMIT_PATTERN.search(text):
+        return RATE_LIMITED
+    for pattern, _ in _PERMANENT_PATTERNS:
+        if re.search(pattern, text):
+            return PERMANENT
+    return TRANSIENT
+
+
+def is_format_unavailable(error) -> bool:
+    return bool(_FORMAT_UNAVAILABLE_PATTERN.search(str(error).lower()))
+
+
+def permanent_error_message(error) -> str:
+    """ پیام مناسب کاربر برای خطای دائمی """
+    text = str(error).lower()
+    for pattern, message in _PERMANENT_PATTERNS:
+        if re.search(pattern, text):
+            return message
+    return "نمی‌توانم ویدیو را دانلود کنم."
+
+
+def backoff_delay(attempt: int, kind: str) -> float:
+    """ فاصله پیش از تلاش شماره attempt+1: نمایی با سقف و jitter (بین نصف و کل مقدار) """
+    base = RETRY_RATE_LIMIT_DELAY if kind == RATE_LIMITED else RETRY_BASE_DELAY
+    delay = min(RETRY_MAX_DELAY, base * (2 ** attempt))
+    return random.uniform(delay / 2, delay)
+
+
+class RetryableDownloadError(Exception):
+    """ خطای موقت دانلود؛ کار باید پس از backoff دوباره در صف قرار گیرد """
+
+    def __init__(self, kind: str, message: str):
+        super().__init__(message)
+        self.kind = kind
@@ -17,6 +17,8 @@ class RedeemStates(StatesGroup):
 
 class DownloadStates(StatesGroup):
     waiting_for_quality = State()
+    waiting_for_clip_range = State()
+    waiting_for_batch_quality = State()
     waiting_for_subtitle_choice = State()
     waiting_for_subtitle_lang = State()
 
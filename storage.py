@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+مدیریت فضای DOWNLOAD_DIR: رزرو حجم برای هر کار، سقف مصرف، حداقل فضای آزاد واقعی دیسک،
+پاک‌سازی فایل‌های یتیم و نگه‌داری فایل‌های اخیراً ارسال‌شده (LRU) برای درخواست‌های تکراری
+"""
+
+import os
+import shutil
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import quote, unquote
+from config import DOWNLOAD_DIR, STORAGE_QUOTA_BYTES, STORAGE_RETAIN_BYTES, STORAGE_MIN_FREE_BYTES
+
+logger = logging.getLogger(__name__)
+
+RETAIN_SUBDIR = "retained"
+# جداکننده اجزای کلید در نام فایل (در شناسه ویدیو یوتیوب وجود ندارد)
+KEY_SEPARATOR = "+"
+
+
+def _key_to_name(key) -> str:
+    """ نام فایل برگشت‌پذیر برای کلید؛ sweep_orphans با _name_to_key همان کلید ذخیره‌شده را بازمی‌سازد """
+    return KEY_SEPARATOR.join(quote(str(part), safe='@').replace('.', '%2E') for part in key)
+
+
+def _name_to_key(stem: str):
+    return tuple(unquote(part) for part in stem.split(KEY_SEPARATOR))
+
+
+class _RetainedFile:
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.pins = 0
+
+
+class StorageManager:
+    """ حسابداری حجم DOWNLOAD_DIR: رزرو پیش از دانلود بر اساس حجم برنامه‌ریزی‌شده و
+    نگه‌داری LRU فایل‌های ارسال‌شده در زیرپوشه retained. علاوه بر سهمیه، رزرو فقط وقتی پذیرفته می‌شود
+    که فضای آزاد واقعی دیسک پس از کسر همه رزروها از min_free_bytes کمتر نشود.
+    """
+
+    def __init__(self, root: str, quota_bytes: int, retain_bytes: int, min_free_bytes: int = 0):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.retain_bytes = retain_bytes
+        self.min_free_bytes = min_free_bytes
+        self.retain_dir = os.path.join(root, RETAIN_SUBDIR)
+        self._lock = threading.Lock()
+        self._reservations = {}
+        self._retained = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    # --- رزرو ---
+
+    def fits_quota(self, nbytes: int) -> bool:
+        """ آیا کاری با این حجم اصلاً در سهمیه جا می‌شود؟ """
+        return nbytes <= self.quota_bytes
+
+    def reserve(self, job_id: str, nbytes: int) -> bool:
+        """ رزرو حجم برای یک کار؛ در صورت نبود جا (سهمیه یا فضای آزاد دیسک)، ابتدا فایل‌های نگه‌داشته (LRU) حذف می‌شوند """
+        with self._lock:
+            if job_id in self._reservations:
+                return True
+            if not self.fits_quota(nbytes):
+                self.rejected += 1
+                return False
+            self._evict_retained_locked(self.quota_bytes - nbytes - self._reserved_locked())
+            if self._used_locked() + nbytes > self.quota_bytes:
+                return False
+            # رزروها ممکن است بخشی از حجمشان را نوشته باشند؛ کسر کامل آن‌ها محافظه‌کارانه است
+            deficit = self.min_free_bytes - (self._disk_free() - self._reserved_locked() - nbytes)
+            if deficit > 0:
+                self._evict_retained_locked(self._retained_size_locked() - deficit)
+                if self.min_free_bytes > self._disk_free() - self._reserved_locked() - nbytes:
+                    return False
+            self._reservations[job_id] = nbytes
+            return True
+
+    def _disk_free(self) -> int:
+        try:
+            return shutil.disk_usage(self.root).free
+        except OSError:
+            # بدون اطلاعات دیسک فقط سهمیه اعمال می‌شود
+            return self.min_free_bytes + self.quota_bytes
+
+    def release(self, job_id: str):
+        with self._lock:
+            self._reservations.pop(job_id, None)
+
+    def _reserved_locked(self):
+        return sum(self._reservations.values())
+
+    def _retained_size_locked(self):
+        return sum(entry.size for entry in self._retained.values())
+
+    def _used_locked(self):
+        return self._reserved_locked() + self._retained_size_locked()
+
+    # --- LRU فایل‌های ارسال‌شده ---
+
+    def _evict_retained_locked(self, limit: int):
+        """ حذف کم‌استفاده‌ترین فایل‌های بدون استفاده تا حجم کل نگه‌داشته‌ها <= limit شود """
+        total = self._retained_size_locked()
+        for key in list(self._retained.keys()):
+            if total <= max(limit, 0):
+                break
+            entry = self._retained[key]
+            if entry.pins:
+                continue
+            del self._retained[key]
+            total -= entry.size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def retain(self, key, path: str):
+        """ انتقال فایل ارسال‌شده به LRU؛ اگر نگه‌داری غیرفعال یا فایل بزرگ باشد False """
+        if self.retain_bytes <= 0 or not os.path.exists(path):
+            return False
+        size = os.path.getsize(path)
+        if size > self.retain_bytes:
+            return False
+        os.makedirs(self.retain_dir, exist_ok=True)
+        ext = os.path.splitext(path)[1]
+        target = os.path.join(self.retain_dir, _key_to_name(key) + ext)
+        with self._lock:
+            old = self._retained.pop(key, None)
+            if old is not None and old.pins:
+                # نسخه قبلی در حال استفاده است؛ همان را نگه می‌داریم
+                self._retained[key] = old
+                return False
+            try:
+                shutil.move(path, target)
+            except OSError as e:
+                logger.warning(f"خطا در نگه‌داری فایل {path}: {e}")
+                return False
+            self._retained[key] = _RetainedFile(target, size)
+            self._evict_retained_locked(min(self.retain_bytes, self.quota_bytes - self._reserved_locked()))
+        return True
+
+    def acquire(self, key):
+        """ مسیر فایل نگه‌داشته (و pin کردن آن تا release_retained) یا None """
+        with self._lock:
+            entry = self._retained.get(key)
+            if entry is None or not os.path.exists(entry.path):
+                if entry is not None:
+                    del self._retained[key]
+                self.misses += 1
+                return None
+            self._retained.move_to_end(key)
+            entry.pins += 1
+            self.hits += 1
+            return entry.path
+
+    def release_retained(self, key):
+        with self._lock:
+            entry = self._retained.get(key)
+            if entry is not None and entry.pins:
+                entry.pins -= 1
+
+    # --- راه‌اندازی و آمار ---
+
+    def sweep_orphans(self):
+        """ در شروع برنامه: حذف پوشه‌ها و فایل‌های باقی‌مانده از کارهای قبلی و بازسازی فهرست LRU """
+        os.makedirs(self.root, exist_ok=True)
+        removed = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name == RETAIN_SUBDIR:
+                continue
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+                removed += 1
+            except OSError as e:
+                logger.warning(f"خطا در حذف فایل یتیم {path}: {e}")
+        if os.path.isdir(self.retain_dir):
+            files = []
+            for name in os.listdir(self.retain_dir):
+                path = os.path.join(self.retain_dir, name)
+                key = _name_to_key(os.path.splitext(name)[0])
+                if not os.path.isfile(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                    continue
+                if len(key) != 2:
+                    os.remove(path)
+                    continue
+                files.append((os.path.getmtime(path), key, path))
+            with self._lock:
+                for _, key, path in sorted(files):
+                    self._retained[key] = _RetainedFile(path, os.path.getsize(path))
+                self._evict_retained_locked(self.retain_bytes)
+        if removed:
+            logger.info(f"{removed} فایل/پوشه یتیم از {self.root} حذف شد.")
+        return removed
+
+    def stats(self):
+        with self._lock:
+            reserved = self._reserved_locked()
+            retained = self._retained_size_locked()
+            retained_count = len(self._retained)
+            jobs = len(self._reservations)
+        total = self.hits + self.misses
+        try:
+            free = shutil.disk_usage(self.root).free
+        except OSError:
+            free = 0
+        return {
+            "min_free": self.min_free_bytes,
+            "quota": self.quota_bytes,
+            "reserved": reserved,
+            "jobs": jobs,
+            "retained": retained,
+            "retained_count": retained_count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+            "rejected": self.rejected,
+            "disk_free": free,
+        }
+
+
+storage_manager = StorageManager(DOWNLOAD_DIR, STORAGE_QUOTA_BYTES, STORAGE_RETAIN_BYTES, STORAGE_MIN_FREE_BYTES)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+حالت جریانی: خروجی yt-dlp (یا ffmpeg برای ادغام صوت و تصویر) بدون فایل موقت
+مستقیماً به آپلودر تکه‌ای Pyrogram داده می‌شود.
+"""
+
+import os
+import sys
+import json
+import asyncio
+import logging
+import subprocess
+from yt_dlp import YoutubeDL
+from pyrogram_client import UPLOAD_PART_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class StreamAborted(Exception):
+    """ مصرف‌کننده جریان (آپلود) متوقف شده است """
+
+
+def _find_format(info, format_id):
+    for fmt in info.get('formats') or []:
+        if fmt.get('format_id') == format_id:
+            return fmt
+    return None
+
+
+def _ffmpeg_headers(fmt):
+    headers = fmt.get('http_headers') or {}
+    return "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+
+
+def ytdlp_cli_args(opts):
+    """ معادل خط فرمان تنظیمات get_download_opts (هدرها، کوکی، extractor_args، تلاش مجدد) برای پروسه yt-dlp """
+    args = []
+    for name, value in (opts.get('http_headers') or {}).items():
+        args += ['--add-header', f"{name}:{value}"]
+    cookie_file = opts.get('cookiefile') or opts.get('cookies')
+    if cookie_file and os.path.exists(cookie_file):
+        args += ['--cookies', cookie_file]
+    for extractor, values in (opts.get('extractor_args') or {}).items():
+        joined = ";".join(
+            f"{key}={','.join(value) if isinstance(value, (list, tuple)) else value}" for key, value in values.items()
+        )
+        args += ['--extractor-args', f"{extractor}:{joined}"]
+    if opts.get('socket_timeout'):
+        args += ['--socket-timeout', str(opts['socket_timeout'])]
+    if opts.get('retries') is not None:
+        args += ['--retries', str(opts['retries'])]
+    if opts.get('fragment_retries') is not None:
+        args += ['--fragment-retries', str(opts['fragment_retries'])]
+    if opts.get('no_check_certificate'):
+        args.append('--no-check-certificates')
+    return args
+
+
+def build_stream_command(job):
+    """ دستور تولید جریان: yt-dlp با خروجی stdout برای یک فرمت، یا ffmpeg برای ادغام به mp4 تکه‌تکه """
+    plan = job.plan
+    if plan['merge']:
+        inputs = []
+        for format_id in plan['format_ids']:
+            fmt = _find_format(job.info, format_id)
+            if fmt is None or not fmt.get('url'):
+                return None
+            headers = _ffmpeg_headers(fmt)
+            if headers:
+                inputs += ['-headers', headers]
+            inputs += ['-i', fmt['url']]
+        return [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error', *inputs,
+            '-map', '0:v:0', '-map', '1:a:0', '-c', 'copy',
+            # moov در ابتدای خروجی تا پخش جریانی بدون seek ممکن باشد
+            '-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov+default_base_moof',
+            'pipe:1'
+        ]
+    info_path = os.path.join(job.work_dir, 'info.json')
+    with open(info_path, 'w', encoding='utf-8') as f:
+        json.dump(YoutubeDL.sanitize_info(job.info), f)
+    return [
+        sys.executable, '-m', 'yt_dlp',
+        '--load-info-json', info_path,
+        '-f', plan['format'],
+        '-o', '-',
+        '--quiet', '--no-warnings', '--no-part',
+        # همان User-Agent، کوکی و player_client مسیر دانلود عادی
+        *ytdlp_cli_args(job.ytdlp_opts or {})
+    ]
+
+
+def _read_part(stream):
+    """ خواندن دقیق یک part (به جز آخرین part) از stdout """
+    buffer = bytearray()
+    while len(buffer) < UPLOAD_PART_SIZE:
+        data = stream.read(UPLOAD_PART_SIZE - len(buffer))
+        if not data:
+            break
+        buffer.extend(data)
+    return bytes(buffer)
+
+
+def stream_download_sync(job, queue, loop):
+    """ اجرا در worker دانلود: partها را در صف محدود asyncio می‌گذارد (پر بودن صف = توقف خواندن) """
+    process = None
+    produced = 0
+    try:
+        os.makedirs(job.work_dir, exist_ok=True)
+        command = build_stream_command(job)
+        if command is None:
+            raise RuntimeError("لینک مستقیم فرمت برای حالت جریانی پیدا نشد")
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        while True:
+            if job.stream_aborted:
+                raise StreamAborted()
+            # لغو کاربر یا پایان مهلت مرحله دانلود
+            job.check_cancelled()
+            part = _read_part(process.stdout)
+            if not part:
+                break
+            asyncio.run_coroutine_threadsafe(queue.put(part), loop).result()
+            produced += len(part)
+            job.report_progress({
+                'status': 'downloading',
+                'downloaded_bytes': produced,
+                'total_bytes_estimate': job.plan.get('estimated_size'),
+            })
+        return_code = process.wait()
+        if return_code != 0:
+            raise RuntimeError(f"فرایند جریان با کد {return_code} خارج شد")
+        return produced
+    finally:
+        if process is not None and process.poll() is None:
+            process.kill()
+            process.wait()
+        # پایان جریان برای مصرف‌کننده
+        asyncio.run_coroutine_threadsafe(queue.put(None), loop).result()
+
+
+async def iter_stream_queue(queue):
+    """ partها را تا رسیدن نشانه پایان (None) برمی‌گرداند """
+    while True:
+        part = await queue.get()
+        if part is None:
+            return
+        yield part
+
+
+async def drain_stream_queue(queue, producer):
+    """ خالی کردن صف پس از توقف آپلود تا thread تولیدکننده روی صف پر قفل نماند """
+    while not (producer.done() and queue.empty()):
+        try:
+            await asyncio.wait_for(queue.get(), 0.5)
+        except asyncio.TimeoutError:
+            pass
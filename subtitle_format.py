@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+subtitle_format.py
+
+تقطیع زیرنویس و نوشتن SRT بدون وابستگی سنگین (torch / faster-whisper / whisperx).
+هم audio_to_subtitle در پروسه‌های ASR و هم ربات (captions / transcript_store) از همین قواعد استفاده می‌کنند.
+"""
+
+import math
+from typing import List, Dict, Optional, Tuple
+
+MAX_SUBTITLE_DURATION = 3.0
+MAX_WORDS_PER_LINE = 8
+MIN_SUBTITLE_DURATION = 0.8
+
+
+def normalize_fa_text(text: str) -> str:
+    # ساده‌سازی فارسی: یکسان‌سازی حروف عربی/فارسی، حذف کشیده و فاصله‌های تکراری
+    if not text:
+        return text
+    replaces = {
+        "ي": "ی",
+        "ى": "ی",
+        "ئ": "ی",
+        "ك": "ک",
+        "أ": "ا",
+        "إ": "ا",
+        "ؤ": "و",
+        "ٱ": "ا",
+        "ـ": "",  # کشیده
+    }
+    for k, v in replaces.items():
+        text = text.replace(k, v)
+    # فاصله‌های متعدد به یک فاصله
+    text = " ".join(text.split())
+    return text
+
+
+def format_timestamp_srt(seconds: float) -> str:
+    seconds = max(0.0, seconds)
+    h = int(seconds // 3600)
+    m = int((seconds % 3600) // 60)
+    s = int(seconds % 60)
+    ms = int(round((seconds - int(seconds)) * 1000))
+    return f"{h:02d}:{m:02d}:{s:02d},{ms:03d}"
+
+
+def chunk_words_to_subs(words: List[Dict], max_duration: float, max_words: int) -> List[Dict]:
+    subs: List[Dict] = []
+    cur_words: List[str] = []
+    cur_start: Optional[float] = None
+    cur_end: Optional[float] = None
+    for w in words:
+        if "start" not in w or w["start"] is None or "end" not in w or w["end"] is None:
+            continue
+        w_start = float(w["start"])  # type: ignore
+        w_end = float(w["end"])  # type: ignore
+        token = str(w.get("word", "")).strip()
+        if not token:
+            continue
+        if cur_start is None:
+            cur_start = w_start
+            cur_end = w_end
+            cur_words = [token]
+            continue
+        next_end = w_end
+        next_count = len(cur_words) + 1
+        next_duration = next_end - cur_start
+        if next_duration > MAX_SUBTITLE_DURATION or next_count > MAX_WORDS_PER_LINE:
+            if cur_words and cur_start is not None and cur_end is not None:
+                subs.append({"start": cur_start, "end": cur_end, "text": " ".join(cur_words)})
+            cur_words = [token]
+            cur_start = w_start
+            cur_end = w_end
+        else:
+            cur_words.append(token)
+            cur_end = next_end
+    if cur_words and cur_start is not None and cur_end is not None:
+        subs.append({"start": cur_start, "end": cur_end, "text": " ".join(cur_words)})
+    return subs
+
+
+def fallback_chunk_segments(segments: List[Dict]) -> List[Dict]:
+    subs: List[Dict] = []
+    for seg in segments:
+        start = float(seg.get("start", 0.0))
+        end = float(seg.get("end", start + 2.0))
+        text = str(seg.get("text", "")).strip()
+        if not text:
+            continue
+        duration = max(0.0, end - start)
+        if duration <= MAX_SUBTITLE_DURATION:
+            subs.append({"start": start, "end": end, "text": text})
+            continue
+        parts = max(1, int(math.ceil(duration / MAX_SUBTITLE_DURATION)))
+        words = text.split()
+        words_per_part = max(1, int(math.ceil(len(words) / parts)))
+        current = 0
+        for i in range(parts):
+            chunk_words = words[current: current + words_per_part]
+            if not chunk_words:
+                break
+            chunk_start = start + i * (duration / parts)
+            chunk_end = start + (i + 1) * (duration / parts)
+            subs.append({"start": chunk_start, "end": chunk_end, "text": " ".join(chunk_words)})
+            current += words_per_part
+    return subs
+
+
+def build_subtitles(aligned_segments: List[Dict]) -> List[Dict]:
+    all_words: List[Dict] = []
+    for seg in aligned_segments:
+        for w in seg.get("words", []) or []:
+            if w.get("start") is None or w.get("end") is None:
+                continue
+            token = str(w.get("word", "")).strip()
+            if token:
+                all_words.append({"word": token, "start": float(w["start"]), "end": float(w["end"])} )
+    if all_words:
+        return chunk_words_to_subs(all_words, MAX_SUBTITLE_DURATION, MAX_WORDS_PER_LINE)
+    return fallback_chunk_segments(aligned_segments)
+
+
+def merge_short_subs(subs: List[Dict], min_duration: float = MIN_SUBTITLE_DURATION) -> List[Dict]:
+    if not subs:
+        return subs
+    merged: List[Dict] = []
+    i = 0
+    while i < len(subs):
+        cur = subs[i]
+        duration = float(cur["end"]) - float(cur["start"])
+        if duration < min_duration and i + 1 < len(subs):
+            nxt = subs[i + 1]
+            combined_text = (str(cur.get("text", "")).strip() + " " + str(nxt.get("text", "")).strip()).strip()
+            combined_duration = float(nxt["end"]) - float(cur["start"])
+            if combined_duration <= MAX_SUBTITLE_DURATION:
+                merged.append({"start": float(cur["start"]), "end": float(nxt["end"]), "text": combined_text})
+                i += 2
+                continue
+        merged.append(cur)
+        i += 1
+    return merged
+
+
+def write_srt(subs: List[Dict], out_path: str) -> None:
+    lines: List[str] = []
+    for idx, item in enumerate(subs, start=1):
+        start = format_timestamp_srt(float(item["start"]))
+        end = format_timestamp_srt(float(item["end"]))
+        text = str(item.get("text", "")).strip()
+        lines.append(str(idx))
+        lines.append(f"{start} --> {end}")
+        lines.append(text)
+        lines.append("")
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+
+
+def chunking_signature() -> str:
+    """ پارامترهای تقطیع زیرنویس؛ با تغییر آن زیرنویس رونوشت‌های ذخیره‌شده دوباره ساخته می‌شود """
+    return f"{MAX_SUBTITLE_DURATION}/{MAX_WORDS_PER_LINE}/{MIN_SUBTITLE_DURATION}"
+
+
+def subtitles_from_transcript(transcript: Dict) -> Tuple[List[Dict], bool]:
+    """ زیرنویس نهایی رونوشت؛ اگر با پارامترهای تقطیع فعلی ساخته نشده باشد از روی هم‌ترازی دوباره ساخته می‌شود.
+    خروجی دوم True یعنی transcript به‌روز شد و باید دوباره ذخیره شود.
+    """
+    if transcript.get("subs") and transcript.get("chunking") == chunking_signature():
+        return transcript["subs"], False
+    subs = merge_short_subs(build_subtitles(transcript.get("aligned") or []))
+    if not subs:
+        subs = fallback_chunk_segments(transcript.get("segments") or [])
+    transcript["subs"] = subs
+    transcript["chunking"] = chunking_signature()
+    return subs, True
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+ارسال پیش‌نمایش ویدیو (عکس + کیفیت‌ها) با کش حافظه‌ای thumbnail:
+پس از اولین ارسال فقط file_id تلگرام نگه‌داشته و دوباره استفاده می‌شود.
+"""
+
+import logging
+from collections import OrderedDict
+from aiogram.types import BufferedInputFile
+from aiogram.exceptions import TelegramBadRequest
+from config import THUMB_CACHE_MAX_BYTES, THUMB_CACHE_MAX_ENTRIES
+from http_client import fetch_bytes
+
+logger = logging.getLogger(__name__)
+
+MAX_THUMB_SIZE = 1024 * 1024  # thumbnail بزرگ‌تر از این دانلود نمی‌شود
+
+
+class ThumbnailCache:
+    """ کش LRU بر اساس video_id: file_id عکس ارسال‌شده یا بایت‌های thumbnail (با سقف حجم کل) """
+
+    def __init__(self, max_bytes: int, max_entries: int):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_file_id(self, video_id: str):
+        entry = self._entries.get(video_id)
+        if entry is None or entry.get('file_id') is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(video_id)
+        self.hits += 1
+        return entry['file_id']
+
+    def get_data(self, video_id: str):
+        entry = self._entries.get(video_id)
+        return entry.get('data') if entry else None
+
+    def set_file_id(self, video_id: str, file_id: str):
+        """ با داشتن file_id دیگر به بایت‌ها نیازی نیست """
+        self._drop(video_id)
+        self._entries[video_id] = {'file_id': file_id, 'data': None}
+        self._evict()
+
+    def set_data(self, video_id: str, data: bytes):
+        self._drop(video_id)
+        self._entries[video_id] = {'file_id': None, 'data': data}
+        self._bytes += len(data)
+        self._evict()
+
+    def forget(self, video_id: str):
+        self._drop(video_id)
+
+    def _drop(self, video_id):
+        entry = self._entries.pop(video_id, None)
+        if entry and entry.get('data'):
+            self._bytes -= len(entry['data'])
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, entry = self._entries.popitem(last=False)
+            if entry.get('data'):
+                self._bytes -= len(entry['data'])
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+        }
+
+
+thumbnail_cache = ThumbnailCache(THUMB_CACHE_MAX_BYTES, THUMB_CACHE_MAX_ENTRIES)
+
+
+def _remember(video_id, sent_message):
+    if sent_message is not None and sent_message.photo:
+        thumbnail_cache.set_file_id(video_id, sent_message.photo[-1].file_id)
+    return sent_message
+
+
+async def send_video_preview(bot, chat_id, video_id: str, thumbnail_url: str, caption: str, reply_markup):
+    """ ارسال پیش‌نمایش؛ به ترتیب: file_id کش‌شده، لینک thumbnail (دریافت توسط خود تلگرام)،
+    لینک استاندارد یوتیوب، بایت‌های دریافتی با نشست مشترک و در نهایت پیام متنی.
+    """
+    file_id = thumbnail_cache.get_file_id(video_id)
+    if file_id is not None:
+        try:
+            return await bot.send_photo(chat_id=chat_id, photo=file_id, caption=caption, reply_markup=reply_markup)
+        except TelegramBadRequest as e:
+            logger.warning(f"file_id کش‌شده thumbnail نامعتبر است ({video_id}): {e}")
+            thumbnail_cache.forget(video_id)
+
+    yt_thumb = f"https://img.youtube.com/vi/{video_id}/hqdefault.jpg"
+    for url in dict.fromkeys([thumbnail_url, yt_thumb]):
+        try:
+            sent = await bot.send_photo(chat_id=chat_id, photo=url, caption=caption, reply_markup=reply_markup)
+            return _remember(video_id, sent)
+        except TelegramBadRequest as e:
+            # مثلاً 'wrong type of the web page content' برای webp
+            logger.info(f"تلگرام نتوانست thumbnail را از لینک بگیرد ({url}): {e}")
+
+    try:
+        data = thumbnail_cache.get_data(video_id)
+        if data is None:
+            data = await fetch_bytes(yt_thumb, MAX_THUMB_SIZE)
+            thumbnail_cache.set_data(video_id, data)
+        sent = await bot.send_photo(
+            chat_id=chat_id,
+            photo=BufferedInputFile(data, filename=f"{video_id}.jpg"),
+            caption=caption,
+            reply_markup=reply_markup
+        )
+        return _remember(video_id, sent)
+    except Exception as e:
+        logger.warning(f"ارسال thumbnail {video_id} ناموفق بود: {e}")
+
+    return await bot.send_message(chat_id=chat_id, text=caption, reply_markup=reply_markup)
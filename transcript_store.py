@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+ذخیره رونوشت‌های ASR با کلید محتوا: (منبع صوت، زبان، مدل، نسخه pipeline).
+منبع صوت برای ویدیوهای یوتیوب video_id (با بازه برش) و برای فایل‌های دیگر هش SHA-256 محتواست.
+سگمنت‌های خام، هم‌ترازی کلمه‌ای و زیرنویس نهایی در یک فایل JSON فشرده نگه داشته می‌شوند؛ درخواست تکراری
+بدون ASR پاسخ داده می‌شود و با تغییر پارامترهای تقطیع فقط زیرنویس از روی هم‌ترازی دوباره ساخته می‌شود.
+این ماژول هم در ربات و هم در پروسه‌های worker استفاده می‌شود و audio_to_subtitle (torch/whisperx) را import نمی‌کند.
+"""
+
+import os
+import gzip
+import json
+import uuid
+import hashlib
+import logging
+from config import DOWNLOAD_DIR, TRANSCRIPT_DIR, TRANSCRIPT_MAX_ENTRIES, TRANSCRIPT_MAX_BYTES
+from database import (
+    get_transcript_entry, store_transcript_entry, delete_transcript_entry, evict_transcripts
+)
+from clip import clip_key
+from asr_models import transcript_model_id, PIPELINE_VERSION
+from subtitle_format import subtitles_from_transcript, write_srt
+
+logger = logging.getLogger(__name__)
+
+
+def video_source_id(video_id: str, clip=None) -> str:
+    return f"yt:{clip_key(video_id, clip)}"
+
+
+def file_source_id(path: str) -> str:
+    """ هش محتوای فایل برای ورودی‌هایی که video_id ندارند """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return f"sha256:{digest.hexdigest()}"
+
+
+def transcript_key(source_id: str, lang: str, model: str, pipeline_version) -> str:
+    return f"{source_id}|{lang}|{model}|v{pipeline_version}"
+
+
+def subtitle_output_path(name: str) -> str:
+    """ مسیر یکتای SRT خروجی (حذف پس از ارسال؛ پوشه در شروع ربات پاک می‌شود) """
+    out_dir = os.path.join(DOWNLOAD_DIR, "subs")
+    os.makedirs(out_dir, exist_ok=True)
+    return os.path.abspath(os.path.join(out_dir, f"{name}_{uuid.uuid4().hex[:8]}.srt"))
+
+
+def load_transcript(source_id: str, lang: str, model: str, pipeline_version):
+    """ رونوشت ذخیره‌شده یا None """
+    key = transcript_key(source_id, lang, model, pipeline_version)
+    path = get_transcript_entry(key)
+    if path is None:
+        return None
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"فایل رونوشت {key} خراب یا حذف شده است: {e}")
+        delete_transcript_entry(key)
+        return None
+
+
+def save_transcript(source_id: str, lang: str, transcript: dict):
+    """ ذخیره رونوشت (مدل و نسخه pipeline از خود رونوشت خوانده می‌شوند) """
+    key = transcript_key(source_id, lang, transcript['model'], transcript['pipeline_version'])
+    os.makedirs(TRANSCRIPT_DIR, exist_ok=True)
+    path = os.path.abspath(os.path.join(TRANSCRIPT_DIR, hashlib.sha1(key.encode()).hexdigest() + ".json.gz"))
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        # مقادیر numpy (امتیاز کلمه‌ها در whisperx) به float تبدیل می‌شوند
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(transcript, f, ensure_ascii=False, default=float)
+        os.replace(tmp_path, path)
+    except (OSError, TypeError, ValueError) as e:
+        logger.error(f"ذخیره رونوشت {key} ناموفق بود: {e}")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        return
+    store_transcript_entry(
+        key, source_id, lang, transcript['model'], transcript['pipeline_version'], path, os.path.getsize(path)
+    )
+    for old_path in evict_transcripts(TRANSCRIPT_MAX_ENTRIES, TRANSCRIPT_MAX_BYTES):
+        try:
+            os.remove(old_path)
+        except OSError:
+            pass
+
+
+def write_cached_srt(source_id: str, lang: str, out_path: str) -> bool:
+    """ نوشتن SRT از رونوشت ذخیره‌شده (مدل و نسخه فعلی)؛ در نبود رونوشت False.
+    اگر پارامترهای تقطیع تغییر کرده باشد زیرنویس دوباره ساخته و رونوشت به‌روز می‌شود.
+    """
+    transcript = load_transcript(source_id, lang, transcript_model_id(lang), PIPELINE_VERSION)
+    if transcript is None:
+        return False
+    subs, rebuilt = subtitles_from_transcript(transcript)
+    if rebuilt:
+        save_transcript(source_id, lang, transcript)
+    write_srt(subs, out_path)
+    return True